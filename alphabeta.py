@@ -2,11 +2,23 @@
 
 from pacman_module.game import Agent
 from pacman_module.pacman import Directions
+from pacman_module.transpositionTable import TranspositionTable
+from pacman_module.transpositionTable import ZobristHasher
+from pacman_module.searchContext import BudgetExhausted
+from pacman_module.instrumentation import currentMoveStats
+from pacman_module.tablebase import probeMove
+from pacman_module.transpositionTable import EXACT, LOWER, UPPER
+from pacman_module.moveOrdering import MoveOrdering
+from pacman_module.parallelSearch import RootSplitter
+from pacman_module.parallelSearch import rootAlpha, publishScore
 from math import inf as INF
 
 
 class PacmanAgent(Agent):
 
+    # Maximum number of entries of the transposition table
+    TABLE_CAPACITY = 2 ** 17
+
     def __init__(self, args):
         """
         Arguments:
@@ -14,9 +26,31 @@ class PacmanAgent(Agent):
         - `args`: Namespace of arguments from command-line prompt.
         """
         self.args = args
-        self.visited = {}
         self.lastAction = Directions.STOP
 
+        # Whether to probe the tablebase of the layout before searching
+        self.tablebase = getattr(args, 'tablebase', None) or False
+
+        # Minimax scores of the visited states, relative to the score of the
+        # state, by Zobrist key. Kept from one move to the next.
+        self.table = TranspositionTable(self.TABLE_CAPACITY, 'lru')
+        self.hasher = ZobristHasher()
+
+        # Keys of the states of the current path
+        self.path = set()
+
+        # Order in which the successors of a node are explored
+        self.ordering = MoveOrdering(getattr(args, 'ordering', None) or ())
+
+        # Number of processes searching the successors of the root. The
+        # pool of processes is created on the first move.
+        self.workers = getattr(args, 'workers', None) or 1
+        self.splitter = None
+        self.searchId = 0
+
+        # Statistics of the search of the current move, see searchStats
+        self.stats = currentMoveStats()
+
     def get_action(self, state):
         """
         Given a pacman game state, returns a legal move.
@@ -31,9 +65,33 @@ class PacmanAgent(Agent):
         - A legal move as defined in `game.Directions`.
         """
 
-        action = self._minimax(state)
+        # Search on a compact snapshot of the state, which is much cheaper
+        # to expand than a full GameState
+        state = state.toCompact()
+        self.stats = currentMoveStats()
+
+        # The tablebase of the layout, if asked for and generated, gives the
+        # best move without searching
+        action = probeMove(state) if self.tablebase else None
+        if action is None:
+            action = self._minimax(state)
         return action
 
+    def final(self, state):
+        """
+        Called when the game ends: shut the pool of processes of the
+        parallel search down.
+
+        Arguments:
+        ----------
+        - `state`: the last game state. See FAQ and class
+                   `pacman.GameState`.
+        """
+
+        if self.splitter is not None:
+            self.splitter.shutdown()
+            self.splitter = None
+
     def _minimax(self, state):
         """
         Given a pacman game state, returns the best legal move computed with
@@ -54,25 +112,117 @@ class PacmanAgent(Agent):
 
         interval = [-INF, +INF]
 
-        # Loop on the successors of this state
-        for s in self._generateSuccessors(state, 0, self.lastAction):
+        self.table.newSearch()
+        self.ordering.newSearch()
+        stateKey = self.hasher.hash(state)
 
-            minimax = self._minimaxrec(
-                s[0], 1, 0, parentInterval=interval, lastPacmanMove=s[1])
+        try:
+            successors = self._generateSuccessors(state, 0, self.lastAction)
+            self.stats.visit(0)
+            if self.workers > 1 and len(successors) > 1:
+                action = self._parallelMinimax(successors)
+                self.lastAction = action
+                return action
+
+            # Loop on the successors of this state
+            for s in successors:
+
+                minimax = self._minimaxrec(
+                    s[0], 1, 0, parentInterval=interval, lastPacmanMove=s[1],
+                    stateKey=self.hasher.update(stateKey, state, s[0]))
+
+                # Update the pruning interval
+                self._updateInterval(interval, minimax, 0)
+
+                # Update the best minimax score and action
+                if minimax is not None and minimax > max:
+                    max = minimax
+                    action = s[1]
+
+        # The node expansion budget is spent: keep the best move among the
+        # successors searched so far
+        except BudgetExhausted:
+            self.path.clear()
+
+        self.lastAction = action
+        return action
+
+    def _parallelMinimax(self, successors):
+        """
+        Search the successors of the root in a pool of processes, see
+        `parallelSearch.RootSplitter`.
+
+        Arguments:
+        ----------
+        - `successors`: the successors of the root
+
+        Return:
+        -------
+        - A legal move as defined in `game.Directions`.
+        """
+
+        if self.splitter is None:
+            self.splitter = RootSplitter(self.workers)
 
-            # Update the pruning interval
-            self._updateInterval(interval, minimax, 0)
+        self.searchId += 1
+        results = self.splitter.search(
+            self, [(self.searchId, s[0], s[1]) for s in successors])
 
-            # Update the best minimax score and action
-            if minimax is not None and minimax > max:
+        max = -INF
+        action = Directions.STOP
+        for s, result in zip(successors, results):
+
+            # The successor ran out of budget
+            if result is None:
+                continue
+
+            # A score that is not above the root alpha the search started
+            # with is only a bound on the score of the successor, and a
+            # previous successor is at least as good
+            minimax, alpha = result
+            if minimax is not None and minimax > alpha and minimax > max:
                 max = minimax
                 action = s[1]
 
-        self.lastAction = action
         return action
 
+    def searchRootChild(self, task):
+        """
+        Return the minimax score of a successor of the root. Called in the
+        workers of the parallel search.
+
+        Arguments:
+        ----------
+        - `task`: a (search id, successor, move) tuple
+
+        Return:
+        -------
+        - A (minimax score, root alpha the search started with) tuple
+        """
+
+        searchId, state, move = task
+        if searchId != self.searchId:
+            self.searchId = searchId
+            self.table.newSearch()
+            self.ordering.newSearch()
+
+        self.stats = currentMoveStats()
+        alpha = rootAlpha()
+        try:
+            minimax = self._minimaxrec(
+                state, 1, 0, parentInterval=[alpha, +INF],
+                lastPacmanMove=move)
+
+        # A search stopped by the budget leaves its path behind, whose
+        # states the next tasks of this worker would take for cycles
+        finally:
+            self.path.clear()
+        publishScore(minimax)
+
+        return minimax, alpha
+
     def _minimaxrec(self, state, player, dpt=0, parentInterval=[-INF, +INF],
-                   lastPacmanMove=None, lastGhostMove=None):
+                   lastPacmanMove=None, lastGhostMove=None, stateKey=None):
         """
         Return the minimax score of a state.
 
@@ -86,6 +236,7 @@ class PacmanAgent(Agent):
             prunign pseudo-code
         - `lastPacmanMove`: the last move of Pacman
         - `lastGhostMove`: the last move of the ghost
+        - `stateKey`: the Zobrist key of the state
 
         Return:
         -------
@@ -94,34 +245,53 @@ class PacmanAgent(Agent):
 
         # Check if we won or lost
         if state.isWin() or state.isLose():
+            self.stats.evaluate(1, dpt + 1)
             return state.getScore()
 
         # Get the unique key of this game state
+        if stateKey is None:
+            stateKey = self.hasher.hash(state)
         currentStateHash = self._hash_state(
-            state, player, lastGhostMove, lastPacmanMove)
+            state, stateKey, player, lastGhostMove, lastPacmanMove)
         successors = None
+        ttMove = None
 
-        # Check if this node is already visited
-        if currentStateHash in self.visited:
-            visitedNode = self.visited[currentStateHash]
+        # Visited is a parent
+        if currentStateHash in self.path:
+            return None
 
-            # Visited is a parent
-            if visitedNode is None:
-                return None
+        # Check if this node is already visited
+        entry = self.table.probe(currentStateHash)
+        if entry is not None:
+            ttMove = entry.move
+            value = entry.value + state.getScore()
 
             # Visited in another branch and we know it's minimax score
-            elif visitedNode.score is not None:
-                scrDif = state.getScore() - visitedNode.currScore
-                return visitedNode.score + scrDif
-            # Visited in another branch but we don't know it's minimax score
-            else:
-                successors = visitedNode.successors
+            if entry.flag == EXACT:
+                return value
+
+            # Visited in another branch and pruned. The bound we know is
+            # enough to prune the node again
+            if self._shouldPrune(value, parentInterval, player):
+                return value
+
+            # Otherwise, explore the node again with the same successors
+            successors = entry.data
 
         # Generate successors if we didn't memorize them from a visited state
         if successors is None:
-            successors = self._generateSuccessors(state, player, lastPacmanMove)
+            successors = self._generateSuccessors(state, player,
+                                                  lastPacmanMove)
+
+        # Explore first the successors most likely to prune this node
+        if player == 0:
+            cell = state.getPacmanPosition()
+        else:
+            cell = state.getGhostPosition(1)
+        successors = self.ordering.order(successors, player, cell, dpt, ttMove)
+        self.stats.visit(dpt + 1)
 
-        self.visited[currentStateHash] = None
+        self.path.add(currentStateHash)
 
         # sol  will be the array conaining the minimax results of the children
         sol = []
@@ -132,25 +302,39 @@ class PacmanAgent(Agent):
         # Variable used to know wether or not the node was pruned at the end
         pruned = False
 
-        for s in successors:
+        # Best move of this node and its index in the successors
+        bestMove = None
+        bestIndex = 0
+
+        for index, s in enumerate(successors):
             newState = s[0]
             direction = s[1]
+            newStateKey = self.hasher.update(stateKey, state, newState)
 
             # Pacman is playing, update last Pacman move
             if player == 0:
                 minimax = self._minimaxrec(newState, self._getNextPlayer(
-                    player), dpt + 1, interval, direction, lastGhostMove)
+                    player), dpt + 1, interval, direction, lastGhostMove,
+                    newStateKey)
             # Ghost is playing, update last ghost move
             else:
                 minimax = self._minimaxrec(newState, self._getNextPlayer(
-                    player), dpt + 1, interval, lastPacmanMove, direction)
+                    player), dpt + 1, interval, lastPacmanMove, direction,
+                    newStateKey)
 
             if minimax is not None:
+                if len(sol) == 0 or minimax == self.__getBest(
+                        [minimax] + sol, player) != self.__getBest(
+                        sol, player):
+                    bestMove = direction
+                    bestIndex = index
+
                 sol.append(minimax)
 
                 # Check if we can prune this node
                 if self._shouldPrune(minimax, parentInterval, player):
                     pruned = True
+                    self.stats.cutoff(index)
                     break
 
                 # Update the pruning interval
@@ -159,19 +343,27 @@ class PacmanAgent(Agent):
         # Get the best minimax score
         best = self.__getBest(sol, player)
 
+        self.path.remove(currentStateHash)
+
         # We didn't find a minimax score (all the children of this node leads
         # to a cycle)
         if best is None:
-            del self.visited[currentStateHash]
+            self.table.remove(currentStateHash)
+            return best
+
+        self.ordering.record(player, cell, bestMove, dpt, 1, bestIndex, pruned)
 
-        # We pruned this node. Memorize successors for the next time.
-        elif pruned:
-            self.visited[currentStateHash] = Node(
-                dpt, None, state.getScore(), successors)
+        # We pruned this node: best is only a bound on its score. Memorize
+        # successors for the next time.
+        if pruned:
+            self.table.store(currentStateHash, best - state.getScore(),
+                             LOWER if player == 0 else UPPER,
+                             move=bestMove, data=successors)
 
         # Memorize the minimax score
-        elif best is not None:
-            self.visited[currentStateHash] = Node(dpt, best, state.getScore())
+        else:
+            self.table.store(currentStateHash, best - state.getScore(), EXACT,
+                             move=bestMove)
 
         return best
 
@@ -327,14 +519,16 @@ class PacmanAgent(Agent):
         else:
             return 0
 
-    def _hash_state(self, state, player, lastGhostMove, lastPacmanMove):
+    def _hash_state(self, state, stateKey, player, lastGhostMove,
+                    lastPacmanMove):
         """
-        Create an unique tuple representing this game state.
+        Create an unique key representing this game state.
 
         Arguments:
         ----------
         - `state`: the current game state. See FAQ and class
                     `pacman.GameState`.
+        - `stateKey`: the Zobrist key of the state
         - `player`: the id of the current player
         - `lastGhostMove`: the last move of the ghost
         - `lastPacmanMove`: the last move of Pacman
@@ -342,19 +536,10 @@ class PacmanAgent(Agent):
 
         Return:
         -------
-        - A unique tuple representing this game state
+        - A unique 64 bits key representing this game state
         """
 
-        return (state.getPacmanPosition(),
-                state.getGhostPositions()[0],
-                hash(state.getFood()), player, lastGhostMove,
-                self._canPacmanStop(state, lastPacmanMove))
-
-
-class Node:
-
-    def __init__(self, dpt, score, currScore=0, successors=None):
-        self.dpt = dpt
-        self.score = score
-        self.currScore = currScore
-        self.successors = successors
+        return stateKey ^ self.hasher.token(('player', player)) ^ \
+            self.hasher.token(('lastGhostMove', lastGhostMove)) ^ \
+            self.hasher.token(('canStop',
+                               self._canPacmanStop(state, lastPacmanMove)))
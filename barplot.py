@@ -1,4 +1,4 @@
-from runPlot import run
+from runBatch import run_batch
 import matplotlib.pyplot as plt
 
 saveFolderPath = "graphs/"
@@ -19,22 +19,23 @@ if __name__ == '__main__':
     # N = number of runs to determine the mean time
     N = 1
 
+    # Play all the games in parallel
+    results = run_batch(agents, ghosts, [layouts[0]], seeds=[1] * N,
+                        verbose=True)
+
     for i in range(len(ghosts)):
         for j in range(len(agents)):
-            print((i * len(ghosts) + j )/ (len(ghosts)*len(agents))*100, "%")
-            time = 0
-            for k in range(N):
-                result = run(agent=agents[j], ghost=ghosts[i], layout=layouts[0])
-
-                # Nodes explored and scores won't change, we just take them the first time
-                if k == 0:
-                    scores.append(result[0])
-                    nodes.append(result[2])
+            runs = [result for result in results
+                    if result['agent'] == agents[j] and
+                    result['ghost'] == ghosts[i]]
 
-                time += result[1]
+            # Nodes explored and scores won't change, we just take them the
+            # first time
+            scores.append(runs[0]['score'])
+            nodes.append(runs[0]['expanded_nodes'])
 
             # Do the mean of execution times
-            times.append(time/N)
+            times.append(sum(result['time'] for result in runs)/N)
 
     plt.rcParams.update({'font.size': 13})
 
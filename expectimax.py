@@ -0,0 +1,291 @@
+# Complete this class for all parts of the project
+
+from pacman_module.game import Agent
+from pacman_module.pacman import Directions
+from pacman_module.ghostAgents import GreedyGhost, SmartyGhost, DumbyGhost
+from pacman_module.leafEvaluation import LeafEvaluator
+from pacman_module.searchContext import BudgetExhausted
+from pacman_module import instrumentation
+from pacman_module.instrumentation import currentMoveStats
+from math import inf as INF
+
+# Ghost agents that can be modelled, by name (see `--ghostagent`)
+GHOST_MODELS = {
+    'greedy': GreedyGhost,
+    'smarty': SmartyGhost,
+    'dumby': DumbyGhost,
+}
+
+
+class PacmanAgent(Agent):
+
+    # Maximum number of memorized ghost distributions
+    DISTRIBUTION_CACHE_CAPACITY = 2 ** 16
+
+    # Coefficients of the features of the evaluation function
+    FOOD_COEF = -100
+    DIST_COEF = -5
+    GHOST_COEF = 1
+
+    def __init__(self, args):
+        """
+        Arguments:
+        ----------
+        - `args`: Namespace of arguments from command-line prompt.
+        """
+        self.args = args
+
+        # Maximum depth (in moves of Pacman and of the ghosts) of the
+        # iterative deepening, and depth of the search when the moves have
+        # no deadline
+        self.maxDpt = 8
+
+        # Best move found so far by the current iteration
+        self.bestMove = None
+
+        # The ghosts are modelled by the ghost agent they play against
+        ghostName = getattr(args, 'ghostagent', None) or 'greedy'
+        self.ghostClass = GHOST_MODELS[ghostName]
+        self.ghostModels = {}
+
+        # Distributions of the actions of the ghosts missing from their
+        # policy tables, by (ghost index, ghost position, ghost direction,
+        # pacman position, scared) key, without the actions of probability 0
+        self.distributions = {}
+
+        # Evaluation of the leaves, built for the layout of the game
+        self.evaluator = None
+
+        # Statistics of the search of the current move, see searchStats
+        self.stats = currentMoveStats()
+
+    def get_action(self, state):
+        """
+        Given a pacman game state, returns a legal move.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+
+        Return:
+        -------
+        - A legal move as defined in `game.Directions`.
+        """
+
+        # Search on a compact snapshot of the state, which is much cheaper
+        # to expand than a full GameState
+        self.stats = currentMoveStats()
+        return self._iterativeDeepening(state.toCompact())
+
+    def _iterativeDeepening(self, state):
+        """
+        If the move has a deadline (see searchContext.py), run expectimax
+        searches of increasing depth, up to `maxDpt`, until the deadline or
+        the node expansion budget of the move is reached. Without a
+        deadline, run a single search of depth `maxDpt`.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+
+        Return:
+        -------
+        - The move chosen by the deepest finished iteration.
+        """
+
+        action = Directions.STOP
+
+        if instrumentation.current().searchContext.deadline is None:
+            depths = [self.maxDpt]
+        else:
+            depths = range(1, self.maxDpt + 1)
+
+        for iteration, dptLimit in enumerate(depths):
+            try:
+                action = self._expectimax(state, dptLimit)
+            except BudgetExhausted:
+                # Keep the move of the last finished iteration, or the best
+                # move found so far by the first one
+                if iteration == 0 and self.bestMove is not None:
+                    action = self.bestMove
+                break
+
+        return action
+
+    def _expectimax(self, state, dptLimit):
+        """
+        Given a pacman game state, returns the legal move of best expected
+        score, searching `dptLimit` moves ahead.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+        - `dptLimit`: the number of moves (of Pacman and of the ghosts)
+            searched
+
+        Return:
+        -------
+        - A legal move as defined in `game.Directions`.
+        """
+
+        best = -INF
+        action = Directions.STOP
+        self.bestMove = None
+
+        successors = state.generatePacmanSuccessors()
+        if dptLimit <= 1:
+            values = self._getValues(state, successors, 0, 1, dptLimit)
+        else:
+            # One successor at a time, so that the best move so far is known
+            # when the budget runs out
+            self.stats.visit(0)
+            values = (self._getValue(s[0], 1, 1, dptLimit)
+                      for s in successors)
+
+        for value, (_, move) in zip(values, successors):
+            if value > best:
+                best = value
+                action = move
+                self.bestMove = move
+
+        return action
+
+    def _getValue(self, state, player, dpt, dptLimit):
+        """
+        Return the expectimax value of a state: the best value of its
+        successors if Pacman is playing, their expected value if a ghost
+        is playing.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+        - `player`: the id of the current player
+        - `dpt`: the number of moves from the root to the state
+        - `dptLimit`: the number of moves searched
+
+        Return:
+        -------
+        - The expectimax value of the state
+        """
+
+        if state.isWin() or state.isLose():
+            self.stats.evaluate(1, dpt)
+            return self._getEvaluator(state).evaluateStates([state])[0]
+
+        if player == 0:
+            successors = state.generatePacmanSuccessors()
+            return max(self._getValues(state, successors, player, dpt + 1,
+                                       dptLimit))
+
+        # Chance node: only the moves the ghost can play are searched
+        distribution = self._getDistribution(state, player)
+        successors = [s for s in state.generateGhostSuccessors(player)
+                      if s[1] in distribution]
+        values = self._getValues(state, successors, player, dpt + 1,
+                                 dptLimit)
+        return sum(distribution[s[1]] * value
+                   for s, value in zip(successors, values))
+
+    def _getValues(self, state, successors, player, dpt, dptLimit):
+        """
+        Return the expectimax values of the successors of a state. The
+        successors at the depth limit are leaves, evaluated in one batch.
+
+        Arguments:
+        ----------
+        - `state`: the game state of which these are the successors
+        - `successors`: the successors, as (state, move) pairs
+        - `player`: the id of the player of `state`
+        - `dpt`: the number of moves from the root to the successors
+        - `dptLimit`: the number of moves searched
+
+        Return:
+        -------
+        - The list of the values of the successors
+        """
+
+        self.stats.visit(dpt - 1)
+        if dpt >= dptLimit:
+            self.stats.evaluate(len(successors), dpt)
+            return self._getEvaluator(state).evaluateStates(
+                [s[0] for s in successors])
+
+        nextPlayer = (player + 1) % state.getNumAgents()
+        return [self._getValue(s[0], nextPlayer, dpt, dptLimit)
+                for s in successors]
+
+    def _getDistribution(self, state, player):
+        """
+        Return the distribution of the actions of a ghost, given by the
+        ghost agent it plays against. Distributions are read from the policy
+        table of the ghost agent when there is one, and otherwise memorized
+        by (ghost index, ghost position, ghost direction, pacman position,
+        scared) key, which is everything the ghost agents look at.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+        - `player`: the index of the ghost
+
+        Return:
+        -------
+        - A dictionary of the probabilities of the actions of the ghost,
+          without the actions of probability 0
+        """
+
+        model = self.ghostModels.get(player)
+        if model is None:
+            model = self.ghostClass(player)
+            self.ghostModels[player] = model
+
+        position, direction, scaredTimer = state.ghosts[player - 1]
+        table = model.getPolicyTable(state.layout)
+        if table is not None:
+            index = table.lookup(position, direction, state.pacmanPosition,
+                                 scaredTimer > 0)
+            if index is not None:
+                return table.supports[index]
+
+        key = (player, position, direction, state.pacmanPosition,
+               scaredTimer > 0)
+        distribution = self.distributions.get(key)
+        if distribution is None:
+            # The ghost agents expect a full GameState
+            distribution = {action: probability for action, probability in
+                            model.getDistribution(
+                                state.toGameState()).items()
+                            if probability > 0}
+            if len(self.distributions) >= self.DISTRIBUTION_CACHE_CAPACITY:
+                self.distributions.clear()
+            self.distributions[key] = distribution
+
+        return distribution
+
+    def _getEvaluator(self, state):
+        """
+        Return the evaluator of the leaves for the layout of the state. It
+        scores states with the number of food dots left, the distance
+        between Pacman and the closest food dot and the distance between
+        Pacman and the ghost.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                `pacman.GameState`.
+
+        Return:
+        -------
+        - A `LeafEvaluator`
+        """
+
+        if self.evaluator is None or self.evaluator.layout is not state.layout:
+            self.evaluator = LeafEvaluator(
+                state.layout, self.FOOD_COEF, self.DIST_COEF,
+                self.GHOST_COEF)
+            self.distributions = {}
+        return self.evaluator
@@ -2,11 +2,39 @@
 
 from pacman_module.game import Agent
 from pacman_module.pacman import Directions
+from pacman_module.transpositionTable import TranspositionTable
+from pacman_module.transpositionTable import ZobristHasher
+from pacman_module.transpositionTable import EXACT, LOWER, UPPER
+from pacman_module.moveOrdering import MoveOrdering
+from pacman_module.parallelSearch import RootSplitter
+from pacman_module.parallelSearch import rootAlpha, publishScore
+from pacman_module.searchContext import BudgetExhausted
+from pacman_module.instrumentation import currentMoveStats
+from pacman_module import instrumentation
+from pacman_module.leafEvaluation import LeafEvaluator
+from pacman_module.traps import prunePacmanSuccessors
 from math import inf as INF
+from bisect import bisect_left
 
 
 class PacmanAgent(Agent):
 
+    # Depth limit of the iterative deepening when the moves have a deadline
+    # (it stops earlier at the deadline, or when the search is complete)
+    MAX_DEPTH = 100
+
+    # Number of slots of the transposition table
+    TABLE_CAPACITY = 2 ** 16
+
+    # Coefficients of the features of the evaluation function
+    FOOD_COEF = -100
+    DIST_COEF = -5
+    GHOST_COEF = 1
+
+    # Whether the moves into the dead-end pockets the ghost can seal are
+    # pruned by default, see traps.prunePacmanSuccessors
+    TRAP_PRUNING = False
+
     def __init__(self, args):
         """
         Arguments:
@@ -14,9 +42,52 @@ class PacmanAgent(Agent):
         - `args`: Namespace of arguments from command-line prompt.
         """
         self.args = args
+        self.trapPruning = getattr(args, 'trappruning', None) or \
+            self.TRAP_PRUNING
+
+        # Depth of the search when the moves have no deadline
         self.maxDpt = 5
         self.lastAction = Directions.STOP
 
+        # Depth limit of the current iteration, and whether it cut a line at
+        # the depth limit (if not, the whole game tree was searched)
+        self.dptLimit = self.maxDpt
+        self.depthCutoff = False
+
+        # Best line found by the last finished iteration, and best line of
+        # each node of the current path (triangular principal variation)
+        self.bestLine = []
+        self.lines = []
+
+        # Distance to the closest food dot, by (pacman position, food), for
+        # the current move
+        self.closestFood = {}
+
+        # Distances from a cell to the food dots of the layout, sorted, and
+        # bits of the dots in the food bitboards, by cell, for the layout of
+        # `foodOrderLayout`
+        self.foodOrder = {}
+        self.foodOrderLayout = None
+
+        # Evaluation of the leaves of the search frontier, by batches, built
+        # for the layout of the game
+        self.evaluator = None
+
+        # Best move of the nodes of the previous iterations, by Zobrist key,
+        # and order in which the successors of a node are explored
+        self.table = TranspositionTable(self.TABLE_CAPACITY, 'depth')
+        self.hasher = ZobristHasher()
+        self.ordering = MoveOrdering(getattr(args, 'ordering', None) or ())
+
+        # Number of processes searching the successors of the root. The
+        # pool of processes is created on the first move.
+        self.workers = getattr(args, 'workers', None) or 1
+        self.splitter = None
+        self.searchId = 0
+
+        # Statistics of the search of the current move, see searchStats
+        self.stats = currentMoveStats()
+
     def get_action(self, state):
         """
         Given a pacman game state, returns a legal move.
@@ -31,11 +102,80 @@ class PacmanAgent(Agent):
         - A legal move as defined in `game.Directions`.
         """
 
-        action = self._minimax(state)
+        # Search on a compact snapshot of the state, which is much cheaper
+        # to expand than a full GameState
+        self.stats = currentMoveStats()
+        action = self._iterativeDeepening(state.toCompact())
         self.lastAction = action
 
         return action
 
+    def _iterativeDeepening(self, state):
+        """
+        If the move has a deadline (see searchContext.py), run H-minimax
+        searches of increasing depth until the deadline or the node
+        expansion budget of the move is reached, or until an iteration
+        searched the whole game tree. Each iteration explores the best line
+        of the previous one first. Without a deadline, run a single search
+        of depth `maxDpt`, so that the moves do not depend on the speed of
+        the machine.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+
+        Return:
+        -------
+        - The move chosen by the deepest finished iteration.
+        """
+
+        self.closestFood = {}
+        self.bestLine = []
+        self.table.newSearch()
+        self.ordering.newSearch()
+        self.searchId += 1
+        action = Directions.STOP
+
+        if instrumentation.current().searchContext.deadline is None:
+            depths = [self.maxDpt]
+        else:
+            depths = range(self.MAX_DEPTH + 1)
+
+        for iteration, dptLimit in enumerate(depths):
+            self.dptLimit = dptLimit
+            self.depthCutoff = False
+            try:
+                action = self._minimax(state)
+            except BudgetExhausted:
+                # Keep the move of the last finished iteration, or the best
+                # move found so far by the first one
+                if iteration == 0 and len(self.lines[0]) > 0:
+                    action = self.lines[0][0]
+                break
+            self.bestLine = self.lines[0]
+
+            # Deeper iterations would search the same tree again
+            if not self.depthCutoff:
+                break
+
+        return action
+
+    def final(self, state):
+        """
+        Called when the game ends: shut the pool of processes of the
+        parallel search down.
+
+        Arguments:
+        ----------
+        - `state`: the last game state. See FAQ and class
+                   `pacman.GameState`.
+        """
+
+        if self.splitter is not None:
+            self.splitter.shutdown()
+            self.splitter = None
+
     def _minimax(self, state):
         """
         Given a pacman game state, returns the best legal move computed with
@@ -56,11 +196,25 @@ class PacmanAgent(Agent):
 
         interval = [-INF, +INF]
 
+        features = self._getFeatures(state)
+        self.lines = [[] for i in range(self.dptLimit + 3)]
+        stateKey = self.hasher.hash(state)
+
         # Loop on the successors of this state
-        for s in self._generateSuccessors(state, 0, self.lastAction):
+        successors = self._orderSuccessors(
+            state, self._generateSuccessors(state, 0, self.lastAction), 0, 0,
+            True, None)
+        self.stats.visit(0)
+        if self.workers > 1 and len(successors) > 1:
+            return self._parallelMinimax(state, successors, features)
+
+        for s in successors:
 
             minimax = self.minimaxrec(
-                s[0], 1, 0, parentInterval=interval, lastPacmanMove=s[1])
+                s[0], 1, 0, parentInterval=interval, lastPacmanMove=s[1],
+                features=self._updateFeatures(state, s[0], features),
+                onBestLine=self._followsBestLine(s[1], 0, True),
+                stateKey=self.hasher.update(stateKey, state, s[0]))
 
             # Update the pruning interval
             self._updateInterval(interval, minimax, 0)
@@ -69,11 +223,95 @@ class PacmanAgent(Agent):
             if minimax is not None and minimax > max:
                 max = minimax
                 action = s[1]
+                self.lines[0] = [s[1]] + self.lines[1]
+
+        return action
+
+    def _parallelMinimax(self, state, successors, features):
+        """
+        Search the successors of the root in a pool of processes, see
+        `parallelSearch.RootSplitter`.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+        - `successors`: the ordered successors of the root
+        - `features`: the food features of the state, see `_getFeatures`
+
+        Return:
+        -------
+        - A legal move as defined in `game.Directions`.
+        """
+
+        if self.splitter is None:
+            self.splitter = RootSplitter(self.workers)
+
+        results = self.splitter.search(self, [(
+            self.searchId, s[0], s[1],
+            self._updateFeatures(state, s[0], features),
+            self._followsBestLine(s[1], 0, True), self.bestLine,
+            self.dptLimit) for s in successors])
+
+        # Some successors ran out of budget, the iteration is not finished
+        if any(result is None for result in results):
+            raise BudgetExhausted()
+
+        max = -INF
+        action = Directions.STOP
+        for s, (minimax, alpha, line, depthCutoff) in zip(successors,
+                                                          results):
+            self.depthCutoff = self.depthCutoff or depthCutoff
+
+            # A score that is not above the root alpha the search started
+            # with is only a bound on the score of the successor, and a
+            # previous successor is at least as good
+            if minimax is not None and minimax > alpha and minimax > max:
+                max = minimax
+                action = s[1]
+                self.lines[0] = [s[1]] + line
 
         return action
 
+    def searchRootChild(self, task):
+        """
+        Return the minimax score of a successor of the root. Called in the
+        workers of the parallel search.
+
+        Arguments:
+        ----------
+        - `task`: a (search id, successor, move, features, on best line,
+            best line, depth limit) tuple
+
+        Return:
+        -------
+        - A (minimax score, root alpha the search started with, best line
+          below the successor, whether a line was cut at the depth limit)
+          tuple
+        """
+
+        searchId, state, move, features, onBestLine, self.bestLine, \
+            self.dptLimit = task
+        if searchId != self.searchId:
+            self.searchId = searchId
+            self.closestFood = {}
+            self.table.newSearch()
+            self.ordering.newSearch()
+
+        self.lines = [[] for i in range(self.dptLimit + 3)]
+        self.stats = currentMoveStats()
+        self.depthCutoff = False
+        alpha = rootAlpha()
+        minimax = self.minimaxrec(
+            state, 1, 0, parentInterval=[alpha, +INF],
+            lastPacmanMove=move, features=features, onBestLine=onBestLine)
+        publishScore(minimax)
+
+        return minimax, alpha, self.lines[1], self.depthCutoff
+
     def minimaxrec(self, state, player, dpt=0, parentInterval=[-INF, +INF],
-                   lastPacmanMove=None):
+                   lastPacmanMove=None, features=None, onBestLine=False,
+                   stateKey=None):
         """
         Return the minimax score of a state.
 
@@ -86,18 +324,41 @@ class PacmanAgent(Agent):
         - `parentInterval`: the interval of score as defined in the alphabeta
             prunign pseudo-code
         - `lastPacmanMove`: the last move of Pacman
+        - `features`: the food features of the state, see `_getFeatures`
+        - `onBestLine`: whether the path to this node follows the best line
+            of the previous iteration
+        - `stateKey`: the Zobrist key of the state
 
         Return:
         -------
         - A minimax score.
         """
 
+        # The node is at index `dpt + 1` of the current path
+        ply = dpt + 1
+        self.lines[ply] = []
+
+        if features is None:
+            features = self._getFeatures(state)
+
         # Check if we won or lost or it the maximum depth is reached
-        if state.isWin() or state.isLose() or dpt > self.maxDpt:
-            return self._getEstimate(state)
+        if state.isWin() or state.isLose() or dpt > self.dptLimit:
+            self.depthCutoff = self.depthCutoff or dpt > self.dptLimit
+            self.stats.evaluate(1, ply)
+            return self._getEstimate(state, features)
+
+        # Best move found for this node by the previous iterations
+        if stateKey is None:
+            stateKey = self.hasher.hash(state)
+        nodeKey = stateKey ^ self.hasher.token(('player', player))
+        entry = self.table.probe(nodeKey)
+        ttMove = entry.move if entry is not None else None
 
         # Generate the successors of this state
-        successors = self._generateSuccessors(state, player, lastPacmanMove)
+        successors = self._orderSuccessors(
+            state, self._generateSuccessors(state, player, lastPacmanMove),
+            player, ply, onBestLine, ttMove)
+        self.stats.visit(ply)
 
         # sol  will be the array conaining the minimax results of the children
         sol = []
@@ -105,22 +366,54 @@ class PacmanAgent(Agent):
         # Pruning interval
         interval = [-INF, +INF]
 
-        for s in successors:
+        # Variable used to know wether or not the node was pruned at the end
+        pruned = False
+
+        # Index of the best move of this node in the successors
+        bestIndex = 0
+
+        # The successors of the nodes of the search frontier are all leaves,
+        # they are evaluated in one batch
+        leaves = dpt + 1 > self.dptLimit
+        if leaves:
+            self.depthCutoff = True
+            leafScores = self._getEvaluator(state).evaluateStates(
+                [s[0] for s in successors])
+            self.stats.evaluate(len(successors), ply + 1)
+            self.lines[ply + 1] = []
+
+        for index, s in enumerate(successors):
             newState = s[0]
+            if leaves:
+                minimax = leafScores[index]
 
             # Pacman is playing, update last Pacman move
-            if(player == 0):
+            elif(player == 0):
                 minimax = self.minimaxrec(newState, self._getNextPlayer(
-                    player), dpt + 1, interval, s[1])
+                    player), dpt + 1, interval, s[1],
+                    self._updateFeatures(state, newState, features),
+                    self._followsBestLine(s[1], ply, onBestLine),
+                    self.hasher.update(stateKey, state, newState))
             # Ghost is playing, update last ghost move
             else:
                 minimax = self.minimaxrec(newState, self._getNextPlayer(
-                    player), dpt + 1, interval, lastPacmanMove)
+                    player), dpt + 1, interval, lastPacmanMove,
+                    self._updateFeatures(state, newState, features),
+                    self._followsBestLine(s[1], ply, onBestLine),
+                    self.hasher.update(stateKey, state, newState))
+
+            # Remember the best line below this node
+            if len(sol) == 0 or minimax == self._getBest(
+                    [minimax] + sol, player) != self._getBest(sol, player):
+                self.lines[ply] = [s[1]] + self.lines[ply + 1]
+                bestIndex = index
 
             sol.append(minimax)
 
             # Check if we can prune this node
             if self._shouldPrune(minimax, parentInterval, player):
+                pruned = True
+                self.stats.cutoff(index)
                 break
 
             # Update the pruning interval
@@ -129,9 +422,74 @@ class PacmanAgent(Agent):
         # Get the best minimax score
         best = self._getBest(sol, player)
 
+        # Memorize the best move for the next iterations. If we pruned this
+        # node, best is only a bound on its score.
+        bestMove = successors[bestIndex][1]
+        height = self.dptLimit - dpt + 1
+        self.ordering.record(player, self._getCell(state, player), bestMove,
+                             ply, height, bestIndex, pruned)
+        if not pruned:
+            flag = EXACT
+        elif player == 0:
+            flag = LOWER
+        else:
+            flag = UPPER
+        self.table.store(nodeKey, best, flag, height, bestMove)
+
         return best
 
-    def _getEstimate(self, state):
+    def _orderSuccessors(self, state, successors, player, ply, onBestLine,
+                         ttMove):
+        """
+        Order the successors with the move ordering heuristics, then move
+        the successor following the best line of the previous iteration in
+        front of the others.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                `pacman.GameState`.
+        - `successors`: the successors of the node, as (state, move) pairs
+        - `player`: the id of the current player
+        - `ply`: the index of the node in the current path
+        - `onBestLine`: whether the path to this node follows the best line
+            of the previous iteration
+        - `ttMove`: the best move of the node in the transposition table
+
+        Return:
+        -------
+        - The ordered successors
+        """
+
+        successors = self.ordering.order(
+            successors, player, self._getCell(state, player), ply, ttMove)
+
+        if not onBestLine or ply >= len(self.bestLine):
+            return successors
+
+        bestMove = self.bestLine[ply]
+        return [s for s in successors if s[1] == bestMove] + \
+            [s for s in successors if s[1] != bestMove]
+
+    def _getCell(self, state, player):
+        """
+        Return the position of the player.
+        """
+
+        if player == 0:
+            return state.getPacmanPosition()
+        return state.getGhostPosition(1)
+
+    def _followsBestLine(self, move, ply, onBestLine):
+        """
+        Check if playing `move` at the node of index `ply` in the current path
+        keeps following the best line of the previous iteration.
+        """
+
+        return onBestLine and ply < len(self.bestLine) and \
+            self.bestLine[ply] == move
+
+    def _getEstimate(self, state, features):
         """
         Compute the estimated minimax score from this state.
 
@@ -139,50 +497,169 @@ class PacmanAgent(Agent):
         ----------
         - `state`: the current game state. See FAQ and class
                 `pacman.GameState`.
+        - `features`: the food features of the state, see `_getFeatures`
+
         Return:
         -------
         - The computed estimated score
         """
 
-
         pacmanPosition = state.getPacmanPosition()
         ghostPosition = state.getGhostPositions()[0]
-        foodMatrix = state.getFood()
-
-        # Distance between pacman and closest food dot
-        minDistance = INF
-
-        # Number of food left
-        nbFoods = 0
-
-        # Loop over the whole food matrix. Search for the number of food
-        # and for the minimal distance between Pacman and a food
-        for i in range(foodMatrix.width):
-            for j in range(foodMatrix.height):
-                if foodMatrix[i][j]:
-                    nbFoods += 1
-                    tmp = self._compute_distance(pacmanPosition, (i, j))
-                    if tmp < minDistance:
-                        minDistance = tmp
-
-        # This happens if there no food left in the matrix. If so, set the
-        # distance to the closest food to 0
-        if minDistance == INF:
-            minDistance = 0
+
+        # Number of food left and distance between pacman and closest food
+        # dot, maintained along the search path
+        nbFoods, minDistance = features
 
         # Compute distance between pacman and the ghost
         distToGhost = self._compute_distance(pacmanPosition, ghostPosition)
 
         # Compute estimate
-        FOOD_COEF = -100
-        DIST_COEF = -5
-        GHOST_COEF = 1
-
-        estimate = nbFoods * FOOD_COEF + minDistance * DIST_COEF + \
-            state.getScore() + distToGhost * GHOST_COEF
+        estimate = nbFoods * self.FOOD_COEF + minDistance * self.DIST_COEF + \
+            state.getScore() + distToGhost * self.GHOST_COEF
 
         return estimate
 
+    def _getEvaluator(self, state):
+        """
+        Return the evaluator of the leaves for the layout of the state. It
+        computes the same estimate as `_getEstimate`, for a batch of states.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                `pacman.GameState`.
+
+        Return:
+        -------
+        - A `LeafEvaluator`
+        """
+
+        if self.evaluator is None or self.evaluator.layout is not state.layout:
+            self.evaluator = LeafEvaluator(
+                state.layout, self.FOOD_COEF, self.DIST_COEF,
+                self.GHOST_COEF)
+        return self.evaluator
+
+    def _getFeatures(self, state):
+        """
+        Compute the food features of a state from scratch.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                `pacman.GameState`.
+
+        Return:
+        -------
+        - A (number of food dots left, distance between Pacman and the
+          closest food dot) tuple
+        """
+
+        return (state.getNumFood(), self._getClosestFood(state))
+
+    def _updateFeatures(self, state, newState, features):
+        """
+        Compute the food features of a successor from the ones of its
+        parent. A ghost move changes neither the food nor Pacman's position,
+        so the features only change when Pacman moves.
+
+        Arguments:
+        ----------
+        - `state`: the parent game state.
+        - `newState`: the successor game state.
+        - `features`: the food features of `state`
+
+        Return:
+        -------
+        - The food features of `newState`
+        """
+
+        # Ghost move, or Pacman stayed still
+        if newState is state or newState.agentMoved != 0:
+            return features
+
+        nbFoods, minDistance = features
+        if newState.foodEaten is not None:
+            nbFoods -= 1
+
+        # Pacman moved by one cell and the food only shrank: no food dot is
+        # closer than the closest one of the parent minus one
+        return (nbFoods,
+                self._getClosestFood(newState, max(minDistance - 1, 0)))
+
+    def _getClosestFood(self, state, lowerBound=0):
+        """
+        Compute the distance between Pacman and the closest food dot.
+        Distances are memorized by Pacman position and food, so every
+        (position, food) pair met during a move is only computed once. A
+        new pair goes through the food dots of the layout by increasing
+        distance from Pacman, from `lowerBound` on, until one is left.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                `pacman.GameState`.
+        - `lowerBound`: a distance no food dot left is closer than
+
+        Return:
+        -------
+        - The distance to the closest food dot (0 if there is no food left)
+        """
+
+        pacmanPosition = state.getPacmanPosition()
+        food = state.getFood()
+        key = (pacmanPosition, food)
+
+        minDistance = self.closestFood.get(key)
+        if minDistance is None:
+            # If there is no food left, the distance to the closest food is 0
+            minDistance = 0
+            bits = food.getBits()
+            if bits:
+                distances, masks = self._getFoodOrder(state, pacmanPosition)
+                for index in range(bisect_left(distances, lowerBound),
+                                   len(distances)):
+                    if bits & masks[index]:
+                        minDistance = distances[index]
+                        break
+
+            self.closestFood[key] = minDistance
+
+        return minDistance
+
+    def _getFoodOrder(self, state, position):
+        """
+        Return the food dots of the layout of a state by increasing
+        distance from a cell.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                `pacman.GameState`.
+        - `position`: the cell
+
+        Return:
+        -------
+        - The sorted list of the distances from the cell to the food dots,
+          and the list of the bits of the dots in the food bitboards
+        """
+
+        layout = state.layout
+        if self.foodOrderLayout is not layout:
+            self.foodOrder = {}
+            self.foodOrderLayout = layout
+
+        order = self.foodOrder.get(position)
+        if order is None:
+            dots = sorted((self._compute_distance(position, (x, y)),
+                           x * layout.height + y)
+                          for x, y in layout.food.asList())
+            order = self.foodOrder[position] = (
+                [distance for distance, _ in dots],
+                [1 << bit for _, bit in dots])
+        return order
+
     def _shouldPrune(self, minimax, interval, player):
         """
         Check if the node should be pruned.
@@ -250,6 +727,8 @@ class PacmanAgent(Agent):
         # Pacman player
         if player == 0:
             nextStates = state.generatePacmanSuccessors()
+            if self.trapPruning:
+                nextStates = prunePacmanSuccessors(state, nextStates)
 
             # If we don't know the last move of Pacman, we cannot know if
             # he can stop moving
@@ -2,10 +2,16 @@
 
 from pacman_module.game import Agent
 from pacman_module.pacman import Directions
+from pacman_module.leafEvaluation import LeafEvaluator
 from math import inf as INF
 
 
 class PacmanAgent(Agent):
+
+    # Coefficients of the features of the evaluation function
+    FOOD_COEF = -10
+    DIST_COEF = -1
+
     def __init__(self, args):
         """
         Arguments:
@@ -15,6 +21,9 @@ class PacmanAgent(Agent):
         self.args = args
         self.maxDepth = 5
 
+        # Evaluation of the leaves, built for the layout of the game
+        self.evaluator = None
+
     def get_action(self, state):
         """
         Given a pacman game state, returns a legal move.
@@ -54,7 +63,13 @@ class PacmanAgent(Agent):
             return self.getEstimate(state)
 
         successors = self.generateSuccessors(state, player)
-        
+
+        # The successors of the nodes of the last level are all leaves, they
+        # are evaluated in one batch
+        if dpt + 1 == self.maxDepth:
+            return self.getBest(self.getEvaluator(state).evaluateStates(
+                [s[0] for s in successors]), player)
+
         sol = []
         
         for s in successors:
@@ -78,32 +93,21 @@ class PacmanAgent(Agent):
         -------
         - The computed estimated score
         """
-        
-        FOOD_COEF = -10
-        DIST_COEF = -1
 
-        pacmanPosition = state.getPacmanPosition()
-        foodMatrix = state.getFood()
-
-        # Distance between pacman and farthest food dot
-        maxDistance = 0
-
-        # Number of food left
-        nbFoods = 0
-
-        for i in range(foodMatrix.width):
-            for j in range(foodMatrix.height):
-                if foodMatrix[i][j]:
-                    nbFoods += 1
-                    tmp = self.__compute_distance(pacmanPosition, (i, j))
-                    if tmp > maxDistance:
-                        maxDistance = tmp
-
-        estimate = nbFoods * FOOD_COEF +  maxDistance * DIST_COEF + state.getScore()
-
-        return estimate
+        return self.getEvaluator(state).evaluateStates([state])[0]
 
+    def getEvaluator(self, state):
+        """
+        Return the evaluator of the leaves for the layout of the state. It
+        scores states with the number of food dots left and the distance
+        between pacman and the farthest food dot.
+        """
 
+        layout = state.data.layout
+        if self.evaluator is None or self.evaluator.layout is not layout:
+            self.evaluator = LeafEvaluator(
+                layout, self.FOOD_COEF, self.DIST_COEF, farthest=True)
+        return self.evaluator
 
     def generateSuccessors(self, state, player, lastmove=None):
         if player == 0:
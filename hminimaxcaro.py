@@ -2,8 +2,18 @@ from pacman_module.game import Agent
 from pacman_module.pacman import Directions
 from math import inf as INF
 from pacman_module.util import manhattanDistance
+from pacman_module.leafEvaluation import LeafEvaluator
 
 class PacmanAgent(Agent):
+
+    # Coefficients of the features of the evaluation function
+    FOOD_COEF = -100
+    DIST_COEF = -5
+    GHOST_COEF = 1
+
+    # Depth of the search: the nodes deeper than this are leaves
+    MAX_DEPTH = 6
+
     def __init__(self, args):
         """
         Arguments:
@@ -12,6 +22,9 @@ class PacmanAgent(Agent):
         """
         self.args = args
 
+        # Evaluation of the leaves, built for the layout of the game
+        self.evaluator = None
+
     def get_action(self, state):
         """
         Given a pacman game state, returns a legal move.
@@ -58,7 +71,7 @@ class PacmanAgent(Agent):
         - The score when Pacman loses or wins
         """
 
-        if state.isWin() or state.isLose() or depth > 6: 
+        if state.isWin() or state.isLose() or depth > self.MAX_DEPTH: 
             return self.evaluationFunction(state)
 
         # currentState = (hash(state.getPacmanPosition()), hash(state.getGhostPosition(1)), hash(state.getFood()))
@@ -77,10 +90,19 @@ class PacmanAgent(Agent):
             value = INF
             next = state.generateGhostSuccessors(agentIndex) 
 
-        for item in next:
-            #   Je sais pas comment commenter hihi
-            # newVisited = visited.copy()
-            score = self.minimax(item[0], self.nextAgent(state, agentIndex), alpha, beta, depth+1)
+        #   The successors of the nodes of the last level are all leaves,
+        #   they are evaluated in one batch
+        if depth + 1 > self.MAX_DEPTH:
+            leafScores = self.getEvaluator(state).evaluateStates(
+                [item[0] for item in next])
+
+        for index, item in enumerate(next):
+            if depth + 1 > self.MAX_DEPTH:
+                score = leafScores[index]
+            else:
+                score = self.minimax(item[0],
+                                     self.nextAgent(state, agentIndex),
+                                     alpha, beta, depth+1)
 
             if score is None:
                 continue
@@ -139,37 +161,29 @@ class PacmanAgent(Agent):
         - The computed estimated score
         """
 
-        FOOD_COEF = -100
-        DIST_COEF = -5
-        GHOST_COEF = 1
-
-        pacmanPosition = state.getPacmanPosition()
-        ghostPosition = state.getGhostPositions()[0]
-        foodMatrix = state.getFood()
-
-        # Distance between pacman and closest food dot
-        minDistance = INF
-
-        # Number of food left
-        nbFoods = 0
+        return self.getEvaluator(state).evaluateStates([state])[0]
 
-        for i in range(foodMatrix.width):
-            for j in range(foodMatrix.height):
-                if foodMatrix[i][j]:
-                    nbFoods += 1
-                    tmp = self.__compute_distance(pacmanPosition, (i, j))
-                    if tmp < minDistance:
-                        minDistance = tmp
-
-        if minDistance == INF:
-            minDistance = 0
-
-        distToGhost = self.__compute_distance(pacmanPosition, ghostPosition)
+    def getEvaluator(self, state):
+        """
+        Return the evaluator of the leaves for the layout of the state. It
+        scores states with the number of food dots left, the distance
+        between pacman and the closest food dot and the distance between
+        pacman and the ghost.
 
-        estimate = nbFoods * FOOD_COEF + minDistance * DIST_COEF + \
-            state.getScore() + distToGhost * GHOST_COEF
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                `pacman.GameState`.
+        Return:
+        -------
+        - A `LeafEvaluator`
+        """
 
-        return estimate
+        layout = state.data.layout
+        if self.evaluator is None or self.evaluator.layout is not layout:
+            self.evaluator = LeafEvaluator(
+                layout, self.FOOD_COEF, self.DIST_COEF, self.GHOST_COEF)
+        return self.evaluator
 
     def __compute_distance(self, position1, position2):
         """
@@ -0,0 +1,383 @@
+# Complete this class for all parts of the project
+
+from pacman_module.game import Agent
+from pacman_module.pacman import Directions
+from pacman_module.mazeGraph import getMazeGraph
+from pacman_module.searchContext import BudgetExhausted
+from pacman_module import instrumentation
+from pacman_module.instrumentation import currentMoveStats
+from pacman_module.leafEvaluation import LeafEvaluator
+from pacman_module.traps import prunePacmanSuccessors
+from math import inf as INF
+
+
+class Node:
+    """
+    A decision point of the search: `player` must choose a move in `state`.
+    Pacman may be walking a corridor meanwhile (the ghosts choose at every
+    crossing of the corridor): `plan` holds the moves he has left to play in
+    it.  `moves` is the number of moves of Pacman from the root.
+    """
+    __slots__ = ('state', 'player', 'plan', 'moves')
+
+    def __init__(self, state, player, plan, moves):
+        self.state = state
+        self.player = player
+        self.plan = plan
+        self.moves = moves
+
+
+class PacmanAgent(Agent):
+
+    # Coefficients of the features of the evaluation function
+    FOOD_COEF = -100
+    DIST_COEF = -5
+    GHOST_COEF = 1
+
+    # Value of a lost game, added to its estimate, and value of each move
+    # Pacman survived in it
+    LOSE_VALUE = -10 ** 6
+    SURVIVAL_VALUE = 1000
+
+    # Whether the moves into the dead-end pockets the ghosts can seal are
+    # pruned by default, see traps.prunePacmanSuccessors
+    TRAP_PRUNING = False
+
+    def __init__(self, args):
+        """
+        Arguments:
+        ----------
+        - `args`: Namespace of arguments from command-line prompt.
+        """
+        self.args = args
+        self.trapPruning = getattr(args, 'trappruning', None) or \
+            self.TRAP_PRUNING
+
+        # Maximum depth (in decisions of Pacman and of the ghosts) of the
+        # iterative deepening, and depth of the search when the moves have
+        # no deadline
+        self.maxDpt = 12
+
+        # Best move found so far by the current iteration
+        self.bestMove = None
+
+        # Depth limit of the current iteration, and deepest line of it, in
+        # moves (not decisions)
+        self.dptLimit = 0
+        self.searchedMoves = 0
+
+        # Evaluation of the leaves, built for the layout of the game
+        self.evaluator = None
+
+        # Statistics of the search of the current move, see searchStats
+        self.stats = currentMoveStats()
+
+    def get_action(self, state):
+        """
+        Given a pacman game state, returns a legal move.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+
+        Return:
+        -------
+        - A legal move as defined in `game.Directions`.
+        """
+
+        # Search on a compact snapshot of the state, which is much cheaper
+        # to expand than a full GameState
+        self.stats = currentMoveStats()
+        return self._iterativeDeepening(state.toCompact())
+
+    def _iterativeDeepening(self, state):
+        """
+        If the move has a deadline (see searchContext.py), run macro-action
+        H-minimax searches of increasing depth, up to `maxDpt` decisions,
+        until the deadline or the node expansion budget of the move is
+        reached. Each iteration searches the best root move of the previous
+        one first. Without a deadline, run a single search of depth
+        `maxDpt`.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+
+        Return:
+        -------
+        - The move chosen by the deepest finished iteration.
+        """
+
+        action = Directions.STOP
+
+        if instrumentation.current().searchContext.deadline is None:
+            depths = [self.maxDpt]
+        else:
+            depths = range(1, self.maxDpt + 1)
+
+        for iteration, dptLimit in enumerate(depths):
+            self.dptLimit = dptLimit
+            self.searchedMoves = 0
+            try:
+                action = self._minimax(state, action)
+            except BudgetExhausted:
+                # Keep the move of the last finished iteration, or the best
+                # move found so far by the first one
+                if iteration == 0 and self.bestMove is not None:
+                    action = self.bestMove
+                break
+
+        return action
+
+    def _minimax(self, state, firstMove):
+        """
+        Given a pacman game state, returns the best legal move computed with
+        the H-minimax algorithm with alphabeta pruning, Pacman and the
+        ghosts moving junction to junction.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+        - `firstMove`: the move searched first
+
+        Return:
+        -------
+        - A legal move as defined in `game.Directions`.
+        """
+
+        best = -INF
+        action = Directions.STOP
+        self.bestMove = None
+
+        children = self._expand(Node(state, 0, (), 0))
+        self.stats.visit(0)
+        children.sort(key=lambda child: child[1] != firstMove)
+        for child, move in children:
+            value = self._getValue(child, 1, best, INF)
+            if value > best:
+                best = value
+                action = move
+                self.bestMove = move
+
+        return action
+
+    def _getValue(self, node, dpt, alpha, beta):
+        """
+        Return the H-minimax value of a node, with alphabeta pruning.
+
+        Arguments:
+        ----------
+        - `node`: the Node searched
+        - `dpt`: the number of decisions from the root to the node
+        - `alpha`, `beta`: the bounds of the value of interest
+
+        Return:
+        -------
+        - The H-minimax value of the node
+        """
+
+        state = node.state
+        if self._isLeaf(node, dpt):
+            self.searchedMoves = max(self.searchedMoves, node.moves)
+            self.stats.evaluate(1, dpt)
+            return self._evaluate([node])[0]
+
+        children = self._expand(node)
+        self.stats.visit(dpt)
+        if not children:
+            self.stats.evaluate(1, dpt)
+            return self._evaluate([node])[0]
+
+        # The leaves among the children of the nodes of the search frontier
+        # are evaluated in one batch
+        values = {}
+        if dpt + 1 >= self.dptLimit:
+            leaves = [index for index, (child, _) in enumerate(children)
+                      if self._isLeaf(child, dpt + 1)]
+            if leaves:
+                self.stats.evaluate(len(leaves), dpt + 1)
+                values = dict(zip(leaves, self._evaluate(
+                    [children[index][0] for index in leaves])))
+                self.searchedMoves = max(
+                    [self.searchedMoves] +
+                    [children[index][0].moves for index in leaves])
+
+        if node.player == 0:
+            best = -INF
+            for index, (child, _) in enumerate(children):
+                value = values.get(index)
+                if value is None:
+                    value = self._getValue(child, dpt + 1, alpha, beta)
+                best = max(best, value)
+                if best >= beta:
+                    self.stats.cutoff(index)
+                    break
+                alpha = max(alpha, best)
+            return best
+
+        best = INF
+        for index, (child, _) in enumerate(children):
+            value = values.get(index)
+            if value is None:
+                value = self._getValue(child, dpt + 1, alpha, beta)
+            best = min(best, value)
+            if best <= alpha:
+                self.stats.cutoff(index)
+                break
+            beta = min(beta, best)
+        return best
+
+    def _isLeaf(self, node, dpt):
+        """
+        Check if a node is a leaf of the search: the game is over, or the
+        depth limit is reached and it is Pacman's turn (the ghosts always
+        answer the last move of Pacman).
+        """
+
+        state = node.state
+        return state.isWin() or state.isLose() or (
+            dpt >= self.dptLimit and node.player == 0)
+
+    def _expand(self, node):
+        """
+        Return the children of a node: one per move of its player, each
+        played until the next decision point (see `_advance`). A Pacman move
+        into a corridor is followed to the junction at its end.
+
+        Arguments:
+        ----------
+        - `node`: the Node to expand
+
+        Return:
+        -------
+        - A list of (Node, move) pairs
+        """
+
+        state = node.state
+        player = node.player
+        nextPlayer = (player + 1) % state.getNumAgents()
+
+        if player == 0:
+            graph = getMazeGraph(state.layout)
+            successors = state.generatePacmanSuccessors()
+            if self.trapPruning:
+                successors = prunePacmanSuccessors(state, successors)
+            children = []
+            for successor, move in successors:
+                corridor = graph.getCorridor(state.pacmanPosition, move)
+                plan = corridor.actions[1:] if corridor is not None else ()
+                children.append((self._advance(
+                    successor, nextPlayer, plan, node.moves + 1), move))
+            return children
+
+        return [(self._advance(successor, nextPlayer, node.plan, node.moves),
+                 move)
+                for successor, move in state.generateGhostSuccessors(player)]
+
+    def _advance(self, state, player, plan, moves):
+        """
+        Play the moves that need no decision from a state: the moves left in
+        the corridor Pacman walks, and the moves of the agents that have a
+        single legal move (e.g. the ghosts in corridors, which cannot turn
+        back). The agents move in turn, as in the game, so that the food of
+        the corridors is eaten and the captures in the corridors are seen
+        when they happen. Each move played counts as a node expansion, as
+        if the search had expanded the state with a single successor.
+
+        Arguments:
+        ----------
+        - `state`: the game state, `player` to move
+        - `player`: the id of the player to move
+        - `plan`: the moves Pacman has left to play in his corridor
+        - `moves`: the number of moves of Pacman from the root to the state
+
+        Return:
+        -------
+        - The Node of the next decision point, or of the end of the game
+        """
+
+        graph = getMazeGraph(state.layout)
+        numAgents = state.getNumAgents()
+        context = instrumentation.current().searchContext
+
+        while not (state.isWin() or state.isLose()):
+            if player == 0:
+                if plan:
+                    action, plan = plan[0], plan[1:]
+                else:
+                    actions = [action for action in state.getLegalActions(0)
+                               if action != Directions.STOP]
+                    if len(actions) != 1:
+                        break
+                    # Dead end: Pacman turns back into the corridor
+                    action = actions[0]
+                    corridor = graph.getCorridor(state.pacmanPosition, action)
+                    if corridor is not None:
+                        plan = corridor.actions[1:]
+                moves += 1
+            else:
+                actions = [action
+                           for action in state.getLegalActions(player)
+                           if action != Directions.STOP]
+                if len(actions) != 1:
+                    break
+                action = actions[0]
+            context.expand()
+            state = state.generateSuccessor(player, action)
+            player = (player + 1) % numAgents
+
+        return Node(state, player, plan, moves)
+
+    def _evaluate(self, nodes):
+        """
+        Return the estimates of a batch of leaves. A lost game is worth less
+        than any game going on, and more the later Pacman dies: the lines of
+        the macro-action searches are long enough to see the games lost
+        against perfect ghosts, and Pacman then runs for as long as he can
+        rather than grabbing the food before dying. Lost games of the same
+        length are told apart by their estimate, since the ghosts may not
+        play the winning moves.
+
+        Arguments:
+        ----------
+        - `nodes`: the Nodes of the leaves
+
+        Return:
+        -------
+        - The list of the estimates of the leaves
+        """
+
+        values = self._getEvaluator(nodes[0].state).evaluateStates(
+            [node.state for node in nodes])
+        for index, node in enumerate(nodes):
+            if node.state.isLose():
+                values[index] += self.LOSE_VALUE + \
+                    self.SURVIVAL_VALUE * node.moves
+        return values
+
+    def _getEvaluator(self, state):
+        """
+        Return the evaluator of the leaves for the layout of the state. It
+        scores states with the number of food dots left, the distance
+        between Pacman and the closest food dot and the distance between
+        Pacman and the ghost.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                `pacman.GameState`.
+
+        Return:
+        -------
+        - A `LeafEvaluator`
+        """
+
+        if self.evaluator is None or self.evaluator.layout is not state.layout:
+            # No ghost term on the mazes without ghosts
+            ghostCoef = self.GHOST_COEF if state.getNumAgents() > 1 else 0
+            self.evaluator = LeafEvaluator(
+                state.layout, self.FOOD_COEF, self.DIST_COEF, ghostCoef)
+        return self.evaluator
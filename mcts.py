@@ -0,0 +1,276 @@
+# Complete this class for all parts of the project
+
+from pacman_module.game import Agent
+from pacman_module.pacman import Directions
+from pacman_module.ghostAgents import GreedyGhost, SmartyGhost, DumbyGhost
+from pacman_module.rollout import getSimulator
+from pacman_module.rollout import RandomPolicy, GhostModelPolicy
+from pacman_module.searchContext import BudgetExhausted
+from pacman_module.instrumentation import currentMoveStats
+from pacman_module import instrumentation
+from math import log, sqrt
+import random
+
+# Ghost agents that can be modelled, by name (see `--ghostagent`)
+GHOST_MODELS = {
+    'greedy': GreedyGhost,
+    'smarty': SmartyGhost,
+    'dumby': DumbyGhost,
+}
+
+# Rollout policies, by name (see `--rolloutpolicy`), built from the class
+# of the ghost agent
+ROLLOUT_POLICIES = {
+    'random': lambda ghostClass: RandomPolicy(),
+    'ghost': GhostModelPolicy,
+}
+
+
+class Node:
+    """
+    A node of the search tree: a state, `player` to move, with the sum of
+    the scores of the rollouts through it. Its children are created, by
+    move, when it is expanded.
+    """
+    __slots__ = ('state', 'player', 'visits', 'total', 'children')
+
+    def __init__(self, state, player):
+        self.state = state
+        self.player = player
+        self.visits = 0
+        self.total = 0.0
+        self.children = None
+
+
+class PacmanAgent(Agent):
+
+    # Default number of rollouts of a move
+    ROLLOUTS = 1000
+
+    # Maximum number of moves of Pacman in a rollout
+    ROLLOUT_DEPTH = 30
+
+    # Coefficients of the food left and of the maze distance to the nearest
+    # food dot in the estimate of the end of a rollout that is not won
+    FOOD_COEF = -100
+    DIST_COEF = -5
+
+    # Exploration constant of UCT, in points of score
+    EXPLORATION = 100
+
+    def __init__(self, args):
+        """
+        Arguments:
+        ----------
+        - `args`: Namespace of arguments from command-line prompt.
+        """
+        self.args = args
+        self.rollouts = getattr(args, 'rollouts', None) or self.ROLLOUTS
+        self.rng = random.Random(getattr(args, 'seed', None))
+
+        # The ghosts are modelled by the ghost agent they play against, in
+        # the tree and in the rollouts
+        ghostName = getattr(args, 'ghostagent', None) or 'greedy'
+        self.ghostClass = GHOST_MODELS[ghostName]
+        self.ghostModels = {}
+        policyName = getattr(args, 'rolloutpolicy', None) or 'ghost'
+        self.policy = ROLLOUT_POLICIES[policyName](self.ghostClass)
+
+        # Statistics of the search of the current move, see searchStats
+        self.stats = currentMoveStats()
+
+    def get_action(self, state):
+        """
+        Given a pacman game state, returns a legal move.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+
+        Return:
+        -------
+        - A legal move as defined in `game.Directions`.
+        """
+
+        # Search on a compact snapshot of the state, which is much cheaper
+        # to expand than a full GameState
+        self.stats = currentMoveStats()
+        return self._mcts(state.toCompact())
+
+    def _mcts(self, state):
+        """
+        Run UCT iterations from a state until the rollout budget of the
+        move, or its deadline or node expansion budget (see
+        searchContext.py), is spent.
+
+        Arguments:
+        ----------
+        - `state`: the current game state. See FAQ and class
+                   `pacman.GameState`.
+
+        Return:
+        -------
+        - The most visited move of the root.
+        """
+
+        root = Node(state, 0)
+        simulator = getSimulator(state.layout)
+        context = instrumentation.current().searchContext
+
+        try:
+            for iteration in range(self.rollouts):
+                # The clock is read every 16 iterations
+                if iteration % 16 == 0:
+                    context.poll()
+                self._iterate(root, simulator)
+        except BudgetExhausted:
+            pass
+
+        if not root.children:
+            return Directions.STOP
+        return max(root.children.items(),
+                   key=lambda item: item[1].visits)[0]
+
+    def _iterate(self, root, simulator):
+        """
+        Select a path of the tree down to a node to expand, expand it, run a
+        rollout from one of its children and update the nodes of the path
+        with the score of the rollout.
+        """
+
+        path = [root]
+        node = root
+        while node.children:
+            node = self._select(node)
+            path.append(node)
+
+        state = node.state
+        if not (state.isWin() or state.isLose()):
+            if node.children is None:
+                self._expand(node)
+                self.stats.visit(len(path) - 1)
+            if node.children:
+                node = self._select(node)
+                path.append(node)
+        score = self._rollout(node, simulator)
+        self.stats.evaluate(1, len(path) - 1)
+
+        for node in path:
+            node.visits += 1
+            node.total += score
+
+    def _expand(self, node):
+        """
+        Create the children of a node, one per legal move of its player.
+        """
+
+        state = node.state
+        nextPlayer = (node.player + 1) % state.getNumAgents()
+        if node.player == 0:
+            successors = state.generatePacmanSuccessors()
+            # Moves onto a ghost lose at once: they are only searched if
+            # every move does
+            successors = [successor for successor in successors
+                          if not successor[0].isLose()] or successors
+        else:
+            successors = state.generateGhostSuccessors(node.player)
+        node.children = {move: Node(successor, nextPlayer)
+                         for successor, move in successors}
+
+    def _select(self, node):
+        """
+        Select the child of a node to search: the child of best UCT value if
+        Pacman is playing (unvisited children first, losing moves last), a
+        child drawn from the model of the ghost otherwise.
+        """
+
+        if node.player == 0:
+            best, selected = None, None
+            logVisits = log(node.visits + 1)
+            for child in node.children.values():
+                # Losing moves are known once tried: no need to try again
+                if child.visits > 0 and child.state.isLose():
+                    continue
+                if child.visits == 0:
+                    return child
+                value = child.total / child.visits + self.EXPLORATION * sqrt(
+                    logVisits / child.visits)
+                if best is None or value > best:
+                    best, selected = value, child
+            return selected or next(iter(node.children.values()))
+
+        distribution = self._getDistribution(node)
+        choice = self.rng.random() * sum(distribution.values())
+        for move, probability in distribution.items():
+            choice -= probability
+            if choice < 0:
+                return node.children[move]
+        return next(iter(node.children.values()))
+
+    def _getDistribution(self, node):
+        """
+        Return the distribution of the moves of the ghost playing in a node,
+        given by the ghost agent it plays against, restricted to the
+        children of the node.
+        """
+
+        model = self.ghostModels.get(node.player)
+        if model is None:
+            model = self.ghostClass(node.player)
+            self.ghostModels[node.player] = model
+
+        state = node.state
+        position, direction, scaredTimer = state.ghosts[node.player - 1]
+        table = model.getPolicyTable(state.layout)
+        index = table.lookup(position, direction, state.pacmanPosition,
+                             scaredTimer > 0) if table is not None else None
+        if index is not None:
+            distribution = table.supports[index]
+        else:
+            # The ghost agents expect a full GameState
+            distribution = model.getDistribution(state.toGameState())
+        distribution = {move: probability
+                        for move, probability in distribution.items()
+                        if probability > 0 and move in node.children}
+        return distribution or {move: 1 for move in node.children}
+
+    def _rollout(self, node, simulator):
+        """
+        Return the estimate of the end of a rollout from a node, played by
+        the rollout policy for at most ROLLOUT_DEPTH moves of Pacman. Games
+        that are not won are scored with the food Pacman left, so that the
+        rollouts that do not reach the end of the game still tell the moves
+        apart.
+        """
+
+        state = node.state
+        if state.isWin() or state.isLose():
+            return self._estimate(state, simulator)
+        if simulator.canSimulate(state):
+            return simulator.rollout(state, node.player, self.policy,
+                                     self.rng, self.ROLLOUT_DEPTH,
+                                     self.FOOD_COEF, self.DIST_COEF)
+
+        # Capsules and scared ghosts: step the compact states
+        player = node.player
+        moves = 0
+        while not (state.isWin() or state.isLose()):
+            if player == 0:
+                if moves >= self.ROLLOUT_DEPTH:
+                    break
+                moves += 1
+            state = state.generateSuccessor(
+                player, self.policy.stateMove(state, player, self.rng))
+            player = (player + 1) % state.getNumAgents()
+        return self._estimate(state, simulator)
+
+    def _estimate(self, state, simulator):
+        """
+        Return the estimate of the end of a rollout, see
+        `RolloutSimulator.estimate`.
+        """
+
+        return simulator.estimate(
+            simulator.cellIndex[state.pacmanPosition], state.food,
+            state.getScore(), self.FOOD_COEF, self.DIST_COEF)
@@ -2,11 +2,20 @@
 
 from pacman_module.game import Agent
 from pacman_module.pacman import Directions
+from pacman_module.transpositionTable import TranspositionTable
+from pacman_module.transpositionTable import ZobristHasher
+from pacman_module.searchContext import BudgetExhausted
+from pacman_module.instrumentation import currentMoveStats
+from pacman_module.tablebase import probeMove
+from pacman_module.transpositionTable import EXACT
 from math import inf as INF
 
 
 class PacmanAgent(Agent):
 
+    # Maximum number of entries of the transposition table
+    TABLE_CAPACITY = 2 ** 17
+
     def __init__(self, args):
         """
         Arguments:
@@ -14,7 +23,20 @@ class PacmanAgent(Agent):
         - `args`: Namespace of arguments from command-line prompt.
         """
         self.args = args
-        self.visited = {}
+
+        # Whether to probe the tablebase of the layout before searching
+        self.tablebase = getattr(args, 'tablebase', None) or False
+
+        # Minimax scores of the visited states, relative to the score of the
+        # state, by Zobrist key. Kept from one move to the next.
+        self.table = TranspositionTable(self.TABLE_CAPACITY, 'lru')
+        self.hasher = ZobristHasher()
+
+        # Keys of the states of the current path
+        self.path = set()
+
+        # Statistics of the search of the current move, see searchStats
+        self.stats = currentMoveStats()
 
     def get_action(self, state):
         """
@@ -30,7 +52,16 @@ class PacmanAgent(Agent):
         - A legal move as defined in `game.Directions`.
         """
 
-        action = self._minimax(state)
+        # Search on a compact snapshot of the state, which is much cheaper
+        # to expand than a full GameState
+        state = state.toCompact()
+        self.stats = currentMoveStats()
+
+        # The tablebase of the layout, if asked for and generated, gives the
+        # best move without searching
+        action = probeMove(state) if self.tablebase else None
+        if action is None:
+            action = self._minimax(state)
         return action
 
     def _minimax(self, state):
@@ -51,19 +82,32 @@ class PacmanAgent(Agent):
         max = -INF
         action = Directions.STOP
 
-        # Loop on the successors of this state
-        for s in state.generatePacmanSuccessors():
+        self.table.newSearch()
+        stateKey = self.hasher.hash(state)
 
-            # Update the best minimax score and action
-            minimax = self._minimaxrec(s[0], 1)
-            if minimax is not None and minimax > max:
-                max = minimax
-                action = s[1]
+        # Loop on the successors of this state
+        try:
+            successors = state.generatePacmanSuccessors()
+            self.stats.visit(0)
+            for s in successors:
+
+                # Update the best minimax score and action
+                minimax = self._minimaxrec(
+                    s[0], 1,
+                    stateKey=self.hasher.update(stateKey, state, s[0]))
+                if minimax is not None and minimax > max:
+                    max = minimax
+                    action = s[1]
+
+        # The node expansion budget is spent: keep the best move among the
+        # successors searched so far
+        except BudgetExhausted:
+            self.path.clear()
 
         return action
 
     def _minimaxrec(self, state, player, dpt=0, lastPacmanMove=None,
-                   lastGhostMove=None):
+                   lastGhostMove=None, stateKey=None):
         """
         Return the minimax score of a state.
 
@@ -75,6 +119,7 @@ class PacmanAgent(Agent):
         - `dpt`: the depth of the node
         - `lastPacmanMove`: the last move of Pacman
         - `lastGhostMove`: the last move of the ghost
+        - `stateKey`: the Zobrist key of the state
 
         Return:
         -------
@@ -83,57 +128,58 @@ class PacmanAgent(Agent):
 
         # Check if we won or lost
         if state.isWin() or state.isLose():
+            self.stats.evaluate(1, dpt + 1)
             return state.getScore()
 
         # Get the unique key of this game state
+        if stateKey is None:
+            stateKey = self.hasher.hash(state)
         currentStateHash = self._hash_state(
-            state, player, lastGhostMove, lastPacmanMove)
+            state, stateKey, player, lastGhostMove, lastPacmanMove)
 
-        # Check if this node is already visited
-        if currentStateHash in self.visited:
-            visitedNode = self.visited[currentStateHash]
-
-            # Visited is a parent
-            if visitedNode is None:
-                return None
+        # Visited is a parent
+        if currentStateHash in self.path:
+            return None
 
-            # Visited in another branch
-            dptDif = state.getScore() - visitedNode.currScore
-            return visitedNode.score + dptDif
+        # Visited in another branch
+        entry = self.table.probe(currentStateHash)
+        if entry is not None:
+            return entry.value + state.getScore()
 
         # Generate the successors of this state
         successors = self._generateSuccessors(state, player, lastPacmanMove)
+        self.stats.visit(dpt + 1)
 
         # sol  will be the array conaining the minimax results of the children
         sol = []
 
-        self.visited[currentStateHash] = None
+        self.path.add(currentStateHash)
 
         for s in successors:
             newState = s[0]
             direction = s[1]
+            newStateKey = self.hasher.update(stateKey, state, newState)
 
             # Pacman is playing, update last Pacman move
             if(player == 0):
                 minimax = self._minimaxrec(newState, self._getNextPlayer(
-                    player), dpt + 1, direction, lastGhostMove)
+                    player), dpt + 1, direction, lastGhostMove, newStateKey)
             # Ghost is playing, update last ghost move
             else:
                 minimax = self._minimaxrec(newState, self._getNextPlayer(
-                    player), dpt + 1, lastPacmanMove, direction)
+                    player), dpt + 1, lastPacmanMove, direction, newStateKey)
             if minimax is not None:
                 sol.append(minimax)
 
         # Get the best minimax score
         best = self._getBest(sol, player)
 
-        # Memorize the minimax score if we found one
+        self.path.remove(currentStateHash)
+
+        # Memorize the minimax score if we found one. Otherwise, all the
+        # children of this node leads to a cycle.
         if best is not None:
-            self.visited[currentStateHash] = Node(dpt, best, state.getScore())
-        # We didn't find a minimax score (all the children of this node leads
-        # to a cycle)
-        else:
-            del self.visited[currentStateHash]
+            self.table.store(currentStateHash, best - state.getScore(), EXACT)
 
         return best
 
@@ -243,14 +289,16 @@ class PacmanAgent(Agent):
         else:
             return 0
 
-    def _hash_state(self, state, player, lastGhostMove, lastPacmanMove):
+    def _hash_state(self, state, stateKey, player, lastGhostMove,
+                    lastPacmanMove):
         """
-        Create an unique tuple representing this game state.
+        Create an unique key representing this game state.
 
         Arguments:
         ----------
         - `state`: the current game state. See FAQ and class
                     `pacman.GameState`.
+        - `stateKey`: the Zobrist key of the state
         - `player`: the id of the current player
         - `lastGhostMove`: the last move of the ghost
         - `lastPacmanMove`: the last move of Pacman
@@ -258,18 +306,10 @@ class PacmanAgent(Agent):
 
         Return:
         -------
-        - A unique tuple representing this game state
+        - A unique 64 bits key representing this game state
         """
 
-        return (state.getPacmanPosition(),
-                state.getGhostPositions()[0],
-                hash(state.getFood()), player, lastGhostMove,
-                self._canPacmanStop(state, lastPacmanMove))
-
-
-class Node:
-
-    def __init__(self, dpt, score, currScore=0):
-        self.dpt = dpt
-        self.score = score
-        self.currScore = currScore
+        return stateKey ^ self.hasher.token(('player', player)) ^ \
+            self.hasher.token(('lastGhostMove', lastGhostMove)) ^ \
+            self.hasher.token(('canStop',
+                               self._canPacmanStop(state, lastPacmanMove)))
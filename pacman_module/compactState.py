@@ -0,0 +1,394 @@
+# compactState.py
+# ---------------
+# Compact, immutable game states for adversarial search.
+#
+# A GameState carries a full GameStateData: a copied capsule list, one
+# AgentState and one Configuration per agent, an _eaten list, ...  This is
+# what the game itself needs, but a search agent exploring millions of nodes
+# only needs the positions, the food and the score.  CompactGameState holds
+# exactly that, in a handful of slots, and implements the same successor
+# functions (and node expansion accounting) as GameState.
+
+from .game import Directions
+from .game import Actions
+from .game import AgentState
+from .game import Configuration
+from .game import BitGrid
+from .util import nearestPoint
+from .util import manhattanDistance
+from . import instrumentation
+from . import pacman
+
+
+class CompactGameState:
+    """
+    An immutable snapshot of a pacman game state.
+
+    Ghosts are stored as a tuple holding one (position, direction,
+    scaredTimer) triple per ghost and the food as an int bitboard using the
+    BitGrid bit ordering.  The layout is shared between all the snapshots of
+    a game.  Successors share every field they do not change with their
+    parent, so the instances must never be modified.
+
+    CompactGameState offers the accessors of GameState that agents use, so
+    a search agent can run on `state.toCompact()` and call
+    generatePacmanSuccessors()/generateGhostSuccessors() as usual.
+    """
+    __slots__ = ('layout', 'starts', 'pacmanPosition', 'pacmanDirection',
+                 'ghosts', 'food', 'numFood', 'capsules', 'score', 'win',
+                 'lose', 'agentMoved', 'foodEaten', '_foodGrid')
+
+    def __init__(self, layout, starts, pacmanPosition, pacmanDirection,
+                 ghosts, food, numFood, capsules, score, win=False,
+                 lose=False, agentMoved=None, foodEaten=None, foodGrid=None):
+        self.layout = layout
+        self.starts = starts
+        self.pacmanPosition = pacmanPosition
+        self.pacmanDirection = pacmanDirection
+        self.ghosts = ghosts
+        self.food = food
+        self.numFood = numFood
+        self.capsules = capsules
+        self.score = score
+        self.win = win
+        self.lose = lose
+        self.agentMoved = agentMoved
+        self.foodEaten = foodEaten
+        self._foodGrid = foodGrid
+
+    def fromGameState(state):
+        """
+        Builds the compact snapshot of a GameState.
+        """
+        data = state.data
+        food = data.food
+        if not isinstance(food, BitGrid):
+            food = BitGrid.fromGrid(food)
+        pacmanState = data.agentStates[0]
+        ghosts = tuple((ghostState.configuration.pos,
+                        ghostState.configuration.direction,
+                        ghostState.scaredTimer)
+                       for ghostState in data.agentStates[1:])
+        starts = tuple(agentState.start.pos
+                       for agentState in data.agentStates)
+        return CompactGameState(
+            data.layout, starts, pacmanState.configuration.pos,
+            pacmanState.configuration.direction, ghosts, food.getBits(),
+            food.count(), tuple(data.capsules), data.score, data._win,
+            data._lose, data._agentMoved, data._foodEaten, food)
+    fromGameState = staticmethod(fromGameState)
+
+    def toGameState(self):
+        """
+        Rebuilds a full GameState holding the same information.
+        """
+        state = pacman.GameState()
+        data = state.data
+        data.layout = self.layout
+        data.food = BitGrid(self.layout.width, self.layout.height,
+                            bits=self.food)
+        data.capsules = list(self.capsules)
+        data.score = self.score
+        data.scoreChange = 0
+        data.agentStates = [AgentState(
+            Configuration(self.starts[0], Directions.STOP), True)]
+        data.agentStates[0].configuration = Configuration(
+            self.pacmanPosition, self.pacmanDirection)
+        for index, (position, direction, scaredTimer) in enumerate(
+                self.ghosts):
+            ghostState = AgentState(
+                Configuration(self.starts[index + 1], Directions.STOP), False)
+            ghostState.configuration = Configuration(position, direction)
+            ghostState.scaredTimer = scaredTimer
+            data.agentStates.append(ghostState)
+        data._eaten = [False for a in data.agentStates]
+        data._win = self.win
+        data._lose = self.lose
+        data._agentMoved = self.agentMoved
+        data._foodEaten = self.foodEaten
+        return state
+
+    def toCompact(self):
+        return self
+
+    ####################################################
+    # Accessor methods, mirroring the GameState ones   #
+    ####################################################
+
+    def getLegalActions(self, agentIndex=0):
+        """
+        Returns the legal actions for the agent specified.
+        """
+        if self.win or self.lose:
+            return []
+
+        if agentIndex == 0:
+            actions = self.layout.pacmanActions.get(self.pacmanPosition)
+            if actions is None:
+                return Actions.getPossibleActionsAt(
+                    self.pacmanPosition, self.pacmanDirection,
+                    self.layout.walls)
+            return list(actions)
+        position, direction, _ = self.ghosts[agentIndex - 1]
+        return pacman.GhostRules.getLegalActionsAt(position, direction,
+                                                   self.layout)
+
+    def getLegalPacmanActions(self):
+        return self.getLegalActions(0)
+
+    def generateSuccessor(self, agentIndex, action):
+        """
+        Returns the successor state after the specified agent takes the
+        action, following the rules of PacmanRules and GhostRules.
+        """
+        if self.win or self.lose:
+            raise Exception('Can\'t generate a successor of a terminal state.')
+
+        if agentIndex == 0:
+            return self._pacmanSuccessor(action)
+        return self._ghostSuccessor(agentIndex, action)
+
+    def generatePacmanSuccessor(self, action):
+        return self.generateSuccessor(0, action)
+
+    def generatePacmanSuccessors(self):
+        """
+        Returns a list of pairs of successor states and moves for the pacman
+        agent.  Counts as a node expansion exactly like
+        GameState.generatePacmanSuccessors.
+        """
+        counters = instrumentation.current()
+        counters.searchContext.expand()
+        successors = [(self._pacmanSuccessor(action), action)
+                      for action in self.getLegalActions(0)
+                      if action != Directions.STOP]
+        counters.generated += len(successors)
+        return successors
+
+    def generateGhostSuccessors(self, index):
+        """
+        Returns a list of pairs of successor states and moves for the ghost
+        agent `index` (>0).  Counts as a node expansion exactly like
+        GameState.generateGhostSuccessors.
+        """
+        if index == 0:
+            return None
+        counters = instrumentation.current()
+        counters.searchContext.expand()
+        successors = [(self._ghostSuccessor(index, action), action)
+                      for action in self.getLegalActions(index)
+                      if action != Directions.STOP]
+        counters.generated += len(successors)
+        return successors
+
+    def getPacmanPosition(self):
+        return self.pacmanPosition
+
+    def getPacmanState(self):
+        pacmanState = AgentState(
+            Configuration(self.starts[0], Directions.STOP), True)
+        pacmanState.configuration = Configuration(self.pacmanPosition,
+                                                  self.pacmanDirection)
+        return pacmanState
+
+    def getGhostState(self, agentIndex):
+        if agentIndex == 0 or agentIndex >= self.getNumAgents():
+            raise Exception("Invalid index passed to getGhostState")
+        position, direction, scaredTimer = self.ghosts[agentIndex - 1]
+        ghostState = AgentState(
+            Configuration(self.starts[agentIndex], Directions.STOP), False)
+        ghostState.configuration = Configuration(position, direction)
+        ghostState.scaredTimer = scaredTimer
+        return ghostState
+
+    def getGhostStates(self):
+        return [self.getGhostState(index)
+                for index in range(1, self.getNumAgents())]
+
+    def getGhostPosition(self, agentIndex):
+        if agentIndex == 0:
+            raise Exception("Pacman's index passed to getGhostPosition")
+        return self.ghosts[agentIndex - 1][0]
+
+    def getGhostPositions(self):
+        return [tuple(map(int, ghost[0])) for ghost in self.ghosts]
+
+    def getGhostDirection(self, agentIndex):
+        return self.ghosts[agentIndex - 1][1]
+
+    def getGhostScaredTimer(self, agentIndex):
+        return self.ghosts[agentIndex - 1][2]
+
+    def getNumAgents(self):
+        return len(self.ghosts) + 1
+
+    def getScore(self):
+        return float(self.score)
+
+    def getCapsules(self):
+        return self.capsules
+
+    def getNumFood(self):
+        return self.numFood
+
+    def getFood(self):
+        """
+        Returns a BitGrid of boolean food indicator variables, built once per
+        food configuration.  It must not be modified.
+        """
+        if self._foodGrid is None:
+            self._foodGrid = BitGrid(self.layout.width, self.layout.height,
+                                     bits=self.food)
+        return self._foodGrid
+
+    def getWalls(self):
+        return self.layout.walls
+
+    def hasFood(self, x, y):
+        return (self.food >> (x * self.layout.height + y)) & 1 == 1
+
+    def hasWall(self, x, y):
+        return self.layout.walls[x][y]
+
+    def isLose(self):
+        return self.lose
+
+    def isWin(self):
+        return self.win
+
+    def __eq__(self, other):
+        """
+        Allows two states to be compared.
+        """
+        if not isinstance(other, CompactGameState):
+            return False
+        return (self.pacmanPosition == other.pacmanPosition and
+                self.pacmanDirection == other.pacmanDirection and
+                self.ghosts == other.ghosts and
+                self.food == other.food and
+                self.capsules == other.capsules and
+                self.score == other.score)
+
+    def __hash__(self):
+        """
+        Allows states to be keys of dictionaries.
+        """
+        instrumentation.current().hashed += 1
+        return hash((self.pacmanPosition, self.pacmanDirection, self.ghosts,
+                     self.food, self.capsules, self.score))
+
+    def __str__(self):
+        return str(self.toGameState())
+
+    ####################################################
+    # Successor functions                              #
+    ####################################################
+
+    def _pacmanSuccessor(self, action):
+        """
+        Compact version of PacmanRules.applyAction followed by the time
+        penalty and GhostRules.checkDeath.
+        """
+        moves = self.layout.moves.get(self.pacmanPosition)
+        if moves is not None:
+            position = moves.get(action)
+            if position is None:
+                raise Exception("Illegal action " + str(action))
+        else:
+            if action not in self.getLegalActions(0):
+                raise Exception("Illegal action " + str(action))
+            x, y = self.pacmanPosition
+            dx, dy = Actions.directionToVector(
+                action, pacman.PacmanRules.PACMAN_SPEED)
+            position = (x + dx, y + dy)
+        direction = self.pacmanDirection if action == Directions.STOP \
+            else action
+
+        food = self.food
+        numFood = self.numFood
+        capsules = self.capsules
+        ghosts = self.ghosts
+        foodEaten = None
+        scoreChange = -pacman.TIME_PENALTY
+        win = False
+        lose = False
+
+        # Eat
+        nearest = nearestPoint(position)
+        if manhattanDistance(nearest, position) <= 0.5:
+            mask = 1 << (nearest[0] * self.layout.height + nearest[1])
+            if food & mask:
+                scoreChange += 10
+                food ^= mask
+                numFood -= 1
+                foodEaten = nearest
+                if numFood == 0:
+                    scoreChange += 500
+                    win = True
+            if nearest in capsules:
+                capsules = tuple(c for c in capsules if c != nearest)
+                ghosts = tuple((ghostPosition, ghostDirection,
+                                pacman.SCARED_TIME)
+                               for ghostPosition, ghostDirection, _ in ghosts)
+
+        # Anyone can kill pacman
+        for index, ghost in enumerate(ghosts):
+            if pacman.GhostRules.canKill(position, ghost[0]):
+                if ghost[2] > 0:
+                    scoreChange += 200
+                    ghosts = ghosts[:index] + \
+                        ((self.starts[index + 1], Directions.STOP, 0),) + \
+                        ghosts[index + 1:]
+                elif not win:
+                    scoreChange -= 500
+                    lose = True
+
+        return CompactGameState(
+            self.layout, self.starts, position, direction, ghosts, food,
+            numFood, capsules, self.score + scoreChange, win, lose, 0,
+            foodEaten, self._foodGrid if food == self.food else None)
+
+    def _ghostSuccessor(self, agentIndex, action):
+        """
+        Compact version of GhostRules.applyAction followed by
+        GhostRules.decrementTimer and GhostRules.checkDeath.
+        """
+        position, direction, scaredTimer = self.ghosts[agentIndex - 1]
+        if action not in pacman.GhostRules.getLegalActionsAt(
+                position, direction, self.layout):
+            raise Exception("Illegal ghost action " + str(action))
+
+        speed = pacman.GhostRules.GHOST_SPEED
+        if scaredTimer > 0:
+            speed /= 2.0
+        x, y = position
+        dx, dy = Actions.directionToVector(action, speed)
+        position = (x + dx, y + dy)
+        if action != Directions.STOP:
+            direction = action
+
+        # Time passes
+        if scaredTimer == 1:
+            position = nearestPoint(position)
+        scaredTimer = max(0, scaredTimer - 1)
+
+        scoreChange = 0
+        lose = False
+        if pacman.GhostRules.canKill(self.pacmanPosition, position):
+            if scaredTimer > 0:
+                scoreChange += 200
+                position = self.starts[agentIndex]
+                direction = Directions.STOP
+                scaredTimer = 0
+            else:
+                scoreChange -= 500
+                lose = True
+
+        ghosts = self.ghosts[:agentIndex - 1] + \
+            ((position, direction, scaredTimer),) + \
+            self.ghosts[agentIndex:]
+        return CompactGameState(
+            self.layout, self.starts, self.pacmanPosition,
+            self.pacmanDirection, ghosts, self.food, self.numFood,
+            self.capsules, self.score + scoreChange, False, lose, agentIndex,
+            None, self._foodGrid)
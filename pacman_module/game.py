@@ -26,6 +26,9 @@ import os
 import traceback
 import sys
 import pacman_module as pacmodule
+from .searchContext import BudgetExhausted
+from . import instrumentation as instrumentationModule
+from math import inf as INF
 
 #######################
 # Parts worth reading #
@@ -38,6 +41,7 @@ class Agent:
     following methods which will be called if they exist:
 
     def registerInitialState(self, state): # inspects the starting state
+    def final(self, state): # called when the game ends, to free resources
     """
 
     def __init__(self, index=0):
@@ -305,6 +309,151 @@ class Grid:
         return bools
 
 
+class BitGrid(Grid):
+    """
+    A boolean Grid backed by a single Python int instead of a list of lists.
+    Cell (x,y) is stored in bit x * height + y, which is the same ordering
+    Grid.__hash__ uses, so both kinds of grids hash identically.
+
+    Reads still go through grid[x][y].  The hash and the number of True
+    cells are cached, and copy() only shares the (immutable) int, so a copy
+    followed by a single write allocates O(1) objects.
+    """
+
+    def __init__(self, width, height, initialValue=False, bits=0):
+        if initialValue not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+
+        self.width = width
+        self.height = height
+        if initialValue:
+            bits = (1 << (width * height)) - 1
+        self._bits = bits
+        self._count = None
+        self._hash = None
+
+    def fromGrid(grid):
+        """
+        Builds a BitGrid holding the same cells as a list-backed Grid.
+        """
+        bits = 0
+        index = 0
+        for column in grid.data:
+            for cell in column:
+                if cell:
+                    bits |= 1 << index
+                index += 1
+        return BitGrid(grid.width, grid.height, bits=bits)
+    fromGrid = staticmethod(fromGrid)
+
+    def getBits(self):
+        return self._bits
+
+    def get(self, x, y):
+        return (self._bits >> (x * self.height + y)) & 1 == 1
+
+    def set(self, x, y, value):
+        mask = 1 << (x * self.height + y)
+        isSet = self._bits & mask != 0
+        if isSet == bool(value):
+            return
+        self._bits ^= mask
+        self._hash = None
+        if self._count is not None:
+            self._count += 1 if value else -1
+
+    @property
+    def data(self):
+        return [[self.get(x, y) for y in range(self.height)]
+                for x in range(self.width)]
+
+    def __getitem__(self, i):
+        # Column views are built on demand, so that copies stay O(1)
+        if i < 0:
+            i += self.width
+        if i < 0 or i >= self.width:
+            raise IndexError('BitGrid column index out of range')
+        return _BitGridColumn(self, i)
+
+    def __setitem__(self, key, item):
+        raise TypeError('BitGrid columns cannot be replaced, '
+                        'assign cells with grid[x][y] = value')
+
+    def __eq__(self, other):
+        if other is None:
+            return False
+        if isinstance(other, BitGrid):
+            return self.width == other.width and \
+                self.height == other.height and self._bits == other._bits
+        return self.data == other.data
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self._bits)
+        return self._hash
+
+    def copy(self):
+        g = BitGrid(self.width, self.height, bits=self._bits)
+        g._count = self._count
+        g._hash = self._hash
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        # Like Grid.shallowCopy, the result shares its cells with this grid
+        return self
+
+    def count(self, item=True):
+        if self._count is None:
+            self._count = bin(self._bits).count('1')
+        if item:
+            return self._count
+        return self.width * self.height - self._count
+
+    def asList(self, key=True):
+        bits = self._bits
+        if not key:
+            bits ^= (1 << (self.width * self.height)) - 1
+        list = []
+        while bits:
+            lowest = bits & -bits
+            list.append(divmod(lowest.bit_length() - 1, self.height))
+            bits ^= lowest
+        return list
+
+
+class _BitGridColumn:
+    """
+    Column view returned by BitGrid.__getitem__ so that grid[x][y] reads and
+    writes go to the underlying bitboard.
+    """
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        grid = self.grid
+        if y < 0:
+            y += grid.height
+        if y < 0 or y >= grid.height:
+            raise IndexError('BitGrid row index out of range')
+        return (grid._bits >> (self.x * grid.height + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if y < 0:
+            y += self.grid.height
+        if y < 0 or y >= self.grid.height:
+            raise IndexError('BitGrid row index out of range')
+        self.grid.set(self.x, y, value)
+
+
 def reconstituteGrid(bitRep):
     if not isinstance(bitRep, type((1, 2))):
         return bitRep
@@ -362,13 +511,23 @@ class Actions:
     directionToVector = staticmethod(directionToVector)
 
     def getPossibleActions(config, walls):
+        return Actions.getPossibleActionsAt(config.pos, config.direction,
+                                            walls)
+
+    getPossibleActions = staticmethod(getPossibleActions)
+
+    def getPossibleActionsAt(position, direction, walls):
+        """
+        Same as getPossibleActions, for an agent described by its bare
+        position and direction instead of a Configuration.
+        """
         possible = []
-        x, y = config.pos
+        x, y = position
         x_int, y_int = int(x + 0.5), int(y + 0.5)
 
         # In between grid points, all agents must continue straight
         if (abs(x - x_int) + abs(y - y_int) > Actions.TOLERANCE):
-            return [config.getDirection()]
+            return [direction]
 
         for dir, vec in Actions._directionsAsList:
             dx, dy = vec
@@ -379,7 +538,7 @@ class Actions:
 
         return possible
 
-    getPossibleActions = staticmethod(getPossibleActions)
+    getPossibleActionsAt = staticmethod(getPossibleActionsAt)
 
     def getLegalNeighbors(position, walls):
         x, y = position
@@ -590,7 +749,9 @@ class Game:
             rules,
             startingIndex=0,
             muteAgents=False,
-            catchExceptions=False):
+            catchExceptions=False,
+            instrumentation=None,
+            headless=False):
         self.agentCrashed = False
         self.agents = agents
         self.display = display
@@ -600,11 +761,20 @@ class Game:
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
         self.moveHistory = []
+        # Set by the rules creating the game
+        self.initialState = None
+        self.quiet = False
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
         import io
         self.agentOutput = [io.StringIO() for agent in agents]
+        # Counters of the work of the agents, see instrumentation.py
+        if instrumentation is None:
+            instrumentation = instrumentationModule.Instrumentation()
+        self.instrumentation = instrumentation
+        # Play with the fast loop of run() (no display, no muting)
+        self.headless = headless
 
     def getProgress(self):
         if self.gameOver:
@@ -620,42 +790,52 @@ class Game:
         self.agentCrashed = True
         self.rules.agentCrash(self, agentIndex)
 
-    OLD_STDOUT = None
-    OLD_STDERR = None
-
     def mute(self, agentIndex):
         if not self.muteAgents:
             return
-        global OLD_STDOUT, OLD_STDERR
-        import io
-        OLD_STDOUT = sys.stdout
-        OLD_STDERR = sys.stderr
+        self.oldStdout = sys.stdout
+        self.oldStderr = sys.stderr
         sys.stdout = self.agentOutput[agentIndex]
         sys.stderr = self.agentOutput[agentIndex]
 
     def unmute(self):
         if not self.muteAgents:
             return
-        global OLD_STDOUT, OLD_STDERR
         # Revert stdout/stderr to originals
-        sys.stdout = OLD_STDOUT
-        sys.stderr = OLD_STDERR
+        sys.stdout = self.oldStdout
+        sys.stderr = self.oldStderr
 
     def run(self):
         """
-        Main control loop for game play.
+        Main control loop for game play. The instrumentation of the game is
+        active in the current thread while the game is played. The agents
+        that define a `final` method are given the last state of the game,
+        even if the game raised an exception.
         """
+        previous = instrumentationModule.activate(self.instrumentation)
+        try:
+            if self.headless:
+                return self._runHeadless()
+            return self._run()
+        finally:
+            for agent in self.agents:
+                final = getattr(agent, 'final', None)
+                if final is not None:
+                    final(self.state)
+            instrumentationModule.activate(previous)
+
+    def _run(self):
         self.display.initialize(self.state.data)
         self.numMoves = 0
 
         agentIndex = self.startingIndex
         numAgents = len(self.agents)
         previous_action = Directions.STOP
-        expout = int(self.rules.getMoveTimeout(agentIndex))
+        expout = self.rules.getMoveTimeout(agentIndex)
         totalComputationTime = 0
         totalExpandedNodes = 0
-        if (expout > 0):
-            pacmodule.pacman.GameState.setMaximumExpanded(expout)
+        # Node expansion budget of a move (0 means unlimited)
+        maxExpanded = expout if expout > 0 else INF
         while not self.gameOver:
             # Fetch the next agent
             agent = self.agents[agentIndex]
@@ -667,24 +847,26 @@ class Game:
             # Solicit an action
             action = None
             self.mute(agentIndex)
-            pacmodule.pacman.GameState.resetNodeExpansionCounter()
+            context = self.instrumentation.newMove(
+                maxExpanded, self.rules.getMoveTime(agentIndex), agentIndex)
             violated = False
             t = time.time()
-            if expout == 0:
-                action = agent.get_action(observation)
-            else:
-                #TODO : node expansion control through getSuccessors
+            try:
                 action = agent.get_action(observation)
-                if pacmodule.pacman.GameState.countExpanded > expout:
-                    violated = True
-            totalComputationTime += (time.time() - t)
-            totalExpandedNodes += pacmodule.pacman.GameState.countExpanded
-            if action not in self.state.getLegalActions(agentIndex):
-                print("Illegal move !")
-                action = previous_action
-            elif violated:
+            except BudgetExhausted:
+                # The agent did not stop searching by itself at the end of
+                # its budget
+                violated = True
+            elapsed = time.time() - t
+            totalComputationTime += elapsed
+            totalExpandedNodes += context.expanded
+            self.instrumentation.endMove(elapsed)
+            if violated:
                 print("Node expansion budget violated !")
                 action = previous_action
+            elif action not in self.state.getLegalActions(agentIndex):
+                print("Illegal move !")
+                action = previous_action
 
             if action not in self.state.getLegalActions(agentIndex):
                 action = Directions.STOP
@@ -714,3 +896,57 @@ class Game:
 
         self.display.finish()
         return totalScore,totalComputationTime,totalExpandedNodes
+
+    def _runHeadless(self):
+        """
+        Game loop without display, playing the same moves as _run.  The
+        agents get shallow copies of the state instead of deep copies, the
+        legal actions are computed once per move, and the display, muting
+        and progress reporting are skipped.
+        """
+        self.numMoves = 0
+
+        agents = self.agents
+        numAgents = len(agents)
+        agentIndex = self.startingIndex
+        instrumentation = self.instrumentation
+        moveHistory = self.moveHistory
+        previous_action = Directions.STOP
+        expout = self.rules.getMoveTimeout(agentIndex)
+        totalComputationTime = 0
+        totalExpandedNodes = 0
+        # Node expansion budget of a move (0 means unlimited)
+        maxExpanded = expout if expout > 0 else INF
+        state = self.state
+        while not self.gameOver:
+            context = instrumentation.newMove(
+                maxExpanded, self.rules.getMoveTime(agentIndex), agentIndex)
+            violated = False
+            t = time.time()
+            try:
+                action = agents[agentIndex].get_action(state.shallowCopy())
+            except BudgetExhausted:
+                violated = True
+            elapsed = time.time() - t
+            totalComputationTime += elapsed
+            totalExpandedNodes += context.expanded
+            instrumentation.endMove(elapsed)
+
+            legal = state.getLegalActions(agentIndex)
+            if violated:
+                print("Node expansion budget violated !")
+                action = previous_action
+            elif action not in legal:
+                print("Illegal move !")
+                action = previous_action
+            if action not in legal:
+                action = Directions.STOP
+
+            moveHistory.append((agentIndex, action))
+            previous_action = action
+            state = state.generateSuccessor(agentIndex, action)
+            self.state = state
+            self.rules.process(state, self)
+            agentIndex = (agentIndex + 1) % numAgents
+
+        return state.getScore(), totalComputationTime, totalExpandedNodes
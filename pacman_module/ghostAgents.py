@@ -17,16 +17,27 @@ from .game import Agent
 from .game import Actions
 from .game import Directions
 from .util import manhattanDistance
-from .util import PriorityQueue
 from . import util
+from . import ghostPolicy
 import numpy as np
 
 
 class GhostAgent(Agent):
+    """
+    A ghost agent. The agents whose distribution only depends on the
+    position and direction of the ghost, on the position of Pacman and on
+    whether the ghost is scared define `policyKey`, `policyChoices` and
+    `policyDistribution`, and their distributions are then looked up in a
+    policy table of the layout (see `ghostPolicy`).
+    """
+
     def __init__(self, index):
         self.index = index
 
     def get_action(self, state):
+        index = self._lookupPolicy(state)
+        if index is not None:
+            return self.policy.sample(index)
         dist = self.getDistribution(state)
         if len(dist) == 0:
             return Directions.STOP
@@ -36,27 +47,86 @@ class GhostAgent(Agent):
     def getDistribution(self, state):
         """Returns a Counter encoding a distribution
            over actions from the provided state."""
+        index = self._lookupPolicy(state)
+        if index is not None:
+            return self.policy.getDistribution(index)
+        return self.computeDistribution(state)
+
+    def computeDistribution(self, state):
+        """Computes the distribution of getDistribution, without the
+           policy table."""
+        util.raiseNotDefined()
+
+    def getPolicyTable(self, layout):
+        """Returns the policy table of the agent on a layout, None if the
+           agent has none."""
+        if getattr(self, 'policyLayout', None) is not layout:
+            self.policy = ghostPolicy.getPolicyTable(self, layout)
+            self.policyLayout = layout
+        return self.policy
+
+    def _lookupPolicy(self, state):
+        if self.getPolicyTable(state.data.layout) is None:
+            return None
+        ghostState = state.getGhostState(self.index)
+        return self.policy.lookup(
+            ghostState.configuration.pos, ghostState.configuration.direction,
+            state.getPacmanPosition(), ghostState.scaredTimer > 0)
+
+    def policyKey(self):
+        """Returns the parameters of the policy of the agent, None if it
+           has no policy table."""
+        return None
+
+    def policyChoices(self, layout, cell, direction, legalActions, scared,
+                      pacmanCells):
+        """Returns the indices in `legalActions` of the actions chosen by
+           the agent for every Pacman cell (-1 for none)."""
+        util.raiseNotDefined()
+
+    def policyDistribution(self, legalActions, choice, scared):
+        """Returns the Counter of the distribution of the agent when it
+           chose the action of index `choice` in `legalActions`."""
         util.raiseNotDefined()
 
 
 class DumbyGhost(GhostAgent):
     "A dumb ghost."
 
-    def getDistribution(self, state):
-        dist = util.Counter()
+    def computeDistribution(self, state):
         legal = state.getLegalActions(self.index)
         current = state.getGhostState(self.index).configuration.direction
+        action = self._chooseAction(legal, current)
+        return self.policyDistribution(
+            legal, -1 if action is None else legal.index(action), False)
+
+    def _chooseAction(self, legal, current):
         if current == Directions.STOP:
             current = Directions.NORTH
         left = Directions.LEFT[current]
         if left in legal:
-            dist[left] = 1.0
+            return left
         elif current in legal:
-            dist[current] = 1.0
+            return current
         elif Directions.RIGHT[current] in legal:
-            dist[Directions.RIGHT[current]] = 1.0
+            return Directions.RIGHT[current]
         elif Directions.LEFT[left] in legal:
-            dist[Directions.LEFT[left]] = 1.0
+            return Directions.LEFT[left]
+        return None
+
+    def policyKey(self):
+        return ()
+
+    def policyChoices(self, layout, cell, direction, legalActions, scared,
+                      pacmanCells):
+        action = self._chooseAction(legalActions, direction)
+        choice = -1 if action is None else legalActions.index(action)
+        return np.full(len(pacmanCells), choice)
+
+    def policyDistribution(self, legalActions, choice, scared):
+        dist = util.Counter()
+        if choice >= 0:
+            dist[legalActions[choice]] = 1.0
         dist.normalize()
         return dist
 
@@ -69,7 +139,7 @@ class GreedyGhost(GhostAgent):
         self.prob_attack = prob_attack
         self.prob_scaredFlee = prob_scaredFlee
 
-    def getDistribution(self, state):
+    def computeDistribution(self, state):
         # Read variables from state
         ghostState = state.getGhostState(self.index)
         legalActions = state.getLegalActions(self.index)
@@ -86,21 +156,33 @@ class GreedyGhost(GhostAgent):
         newPositions = [(pos[0] + a[0], pos[1] + a[1]) for a in actionVectors]
         pacmanPosition = state.getPacmanPosition()
 
-        # Select best actions given the state
+        # Select best action given the state
         distancesToPacman = [
             manhattanDistance(
                 pos, pacmanPosition) for pos in newPositions]
         if isScared:
             bestScore = max(distancesToPacman)
-            bestProb = self.prob_scaredFlee
         else:
             bestScore = min(distancesToPacman)
+        choice = distancesToPacman.index(bestScore)
+
+        return self.policyDistribution(legalActions, choice, isScared)
+
+    def policyKey(self):
+        return (self.prob_attack, self.prob_scaredFlee)
+
+    def policyChoices(self, layout, cell, direction, legalActions, scared,
+                      pacmanCells):
+        return ghostPolicy.manhattanChoices(
+            cell, legalActions, 0.5 if scared else 1, pacmanCells,
+            farthest=scared)
+
+    def policyDistribution(self, legalActions, choice, scared):
+        if scared:
+            bestProb = self.prob_scaredFlee
+        else:
             bestProb = self.prob_attack
-        bestActions = [[
-            action for action,
-            distance in zip(
-                legalActions,
-                distancesToPacman) if distance == bestScore][0]]
+        bestActions = [legalActions[choice]] if choice >= 0 else []
 
         # Construct distribution
         dist = util.Counter()
@@ -109,7 +191,7 @@ class GreedyGhost(GhostAgent):
         for a in legalActions:
             dist[a] += (1 - bestProb) / len(legalActions)
         dist.normalize()
-        
+
         return dist
 
 
@@ -118,111 +200,57 @@ class SmartyGhost(GhostAgent):
 
     def __init__(self, index):
         self.index = index
-        self.fscore = None
-        self.gscore = None
-        self.wasScared = False
-        self.corners = None
         self.gghost = GreedyGhost(index)
 
-    def _pathsearch(self, state, fscore_in, gscore_in, goal):
-        fringe = PriorityQueue()
-        closed = np.full(
-            (state.data.layout.width,
-             state.data.layout.height),
-            False)
-        initpos = tuple(map(lambda x: int(x),
-                            state.getGhostPosition(self.index)))
-        if gscore_in is not None:
-            gscore = gscore_in
-        else:
-            gscore = np.full(
-                (state.data.layout.width, state.data.layout.height), np.inf)
-            gscore[initpos] = 0
-        if fscore_in is not None:
-            fscore = fscore_in
-        else:
-            fscore = np.full(
-                (state.data.layout.width, state.data.layout.height), np.inf)
-            fscore[initpos] = manhattanDistance(goal, initpos)
-        fringe.push((state, [], closed), fscore[initpos])
-        openset = np.full(
-            (state.data.layout.width, state.data.layout.height), False)
-        openset[initpos] = True
-        while not fringe.isEmpty():
-            _, node = fringe.pop()
-            curNode, actions, closed = node
-            if curNode.getGhostPosition(self.index) == goal:
-                return actions[0], fscore, gscore
-            closed = np.copy(closed)
-            ghostpos = tuple(
-                map(lambda x: int(x), curNode.getGhostPosition(self.index)))
-            closed[ghostpos] = True
-            openset[ghostpos] = False
-            succs = [(curNode.generateSuccessor(self.index, action), action)
-                     for action in curNode.getLegalActions(self.index)]
-
-            for succNode in succs:
-                action = succNode[1]
-                succNode = succNode[0]
-
-                succghostpos = tuple(
-                    map(lambda x: int(x),
-                        succNode.getGhostPosition(self.index)))
-                tentative_gscore = gscore[succghostpos] + 1
-                tentative_fscore = tentative_gscore + \
-                    manhattanDistance(goal, succghostpos)
-
-                if closed[succghostpos]:
-                    if tentative_fscore <= fscore[succghostpos]:
-                        closed[succghostpos] = False
-                    else:
-                        continue
-
-                if not openset[succghostpos]:
-                    openset[succghostpos] = True
-                elif tentative_gscore >= gscore[succghostpos]:
-                    continue
-
-                gscore[succghostpos] = tentative_gscore
-                fscore[succghostpos] = tentative_fscore
-                fringe.push(
-                    (succNode,
-                     actions + [action],
-                        closed),
-                    fscore[succghostpos])
-        return actions[0], fscore, gscore
+    def _pathAction(self, state, legalActions, goal):
+        """
+        Returns the legal action starting a shortest path from the ghost to
+        `goal`.  The maze distances to `goal` are read from the distance
+        table of the layout, so each action is evaluated with a lookup.
+        """
+        layout = state.data.layout
+        pos = state.getGhostPosition(self.index)
+        bestAction = None
+        bestDistance = np.inf
+        for action in legalActions:
+            dx, dy = Actions.directionToVector(action)
+            nextPos = (int(pos[0] + dx), int(pos[1] + dy))
+            if layout.walls[nextPos[0]][nextPos[1]]:
+                continue
+            distance = layout.mazeDistance(nextPos, goal)
+            if distance < bestDistance:
+                bestAction = action
+                bestDistance = distance
+        return bestAction
 
-    def getDistribution(self, state):
-        if self.corners is None:
-            self.corners = [
-                (1,
-                 1),
-                (1,
-                 state.data.layout.height),
-                (state.data.layout.width,
-                 1),
-                (state.data.layout.width,
-                 state.data.layout.height)]
+    def computeDistribution(self, state):
         ghostState = state.getGhostState(self.index)
         isScared = ghostState.scaredTimer > 0
-        dist = util.Counter()
+        if isScared:
+            return self.gghost.computeDistribution(state)
+
         legalActions = state.getLegalActions(self.index)
+        a = self._pathAction(state, legalActions, state.getPacmanPosition())
+        return self.policyDistribution(
+            legalActions, -1 if a is None else legalActions.index(a), False)
+
+    def policyKey(self):
+        return ()
+
+    def policyChoices(self, layout, cell, direction, legalActions, scared,
+                      pacmanCells):
+        if scared:
+            return self.gghost.policyChoices(
+                layout, cell, direction, legalActions, scared, pacmanCells)
+        return ghostPolicy.mazeChoices(layout, cell, legalActions)
+
+    def policyDistribution(self, legalActions, choice, scared):
+        if scared:
+            return self.gghost.policyDistribution(legalActions, choice,
+                                                  scared)
+        dist = util.Counter()
         for a in legalActions:
             dist[a] = 0
-        ghostpos = state.getGhostPosition(self.index)
-        goal = state.getPacmanPosition() if not isScared \
-            else self.corners[
-            np.argmax(list(map(lambda pos:
-                               manhattanDistance(pos,
-                                                 ghostpos),
-                               self.corners)))
-        ]
-        if not isScared:
-            a, self.fscore, self.gscore = self._pathsearch(
-                state, self.fscore, self.gscore, goal)
-            dist[a] = 1
-        else:
-            dist = self.gghost.getDistribution(state)
-
-        self.wasScared = isScared
+        if choice >= 0:
+            dist[legalActions[choice]] = 1
         return dist
@@ -0,0 +1,186 @@
+# ghostPolicy.py
+# --------------
+# Precomputed policy tables of the ghost agents.
+#
+# The distribution of the actions of the ghost agents only depends on the
+# position and direction of the ghost, on the position of Pacman and on
+# whether the ghost is scared.  A PolicyTable enumerates these inputs once
+# per layout and stores, for each of them, the id of the resulting
+# distribution in a NumPy array of shape
+#
+#     (free cells, directions, free cells, 2)
+#
+# indexed by ghost cell, ghost direction, Pacman cell and scared flag.  The
+# tables hold few distinct distributions (one per legal actions and chosen
+# action), which are built once, by the same code as the distributions
+# computed on the fly.  Looking up a distribution is then O(1).
+#
+# Only ghosts standing on a cell are in the tables: scared ghosts, which
+# move at half speed, can stand in between two cells, and the agents compute
+# their distribution as before there.
+
+import threading
+
+import numpy as np
+
+from .game import Actions, Directions
+from . import util
+
+# Directions, in the order of the second axis of the tables
+DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST,
+              Directions.WEST, Directions.STOP]
+DIRECTION_INDEX = {direction: index
+                   for index, direction in enumerate(DIRECTIONS)}
+
+# Policy tables, by (ghost class, policy parameters, layout text)
+POLICY_TABLE_CACHE = {}
+POLICY_TABLE_LOCK = threading.Lock()
+
+
+class PolicyTable:
+    """
+    The distributions of the actions of a ghost agent on a layout.
+
+    `ids[g, d, p, s]` is the index in `distributions` of the distribution of
+    a ghost on the free cell of index `g`, travelling in direction
+    `DIRECTIONS[d]`, when Pacman is on the free cell of index `p` and the
+    ghost is scared (`s` = 1) or not (`s` = 0).  Cells are indexed like
+    `layout.freeCells`.
+    """
+
+    def __init__(self, layout, ids, distributions):
+        self.layout = layout
+        self.ids = ids
+        self.cellOf = {cell: index
+                       for index, cell in enumerate(layout.freeCells)}
+
+        # The distributions as util.Counters, as (probabilities, actions)
+        # lists sorted like util.sample sorts a Counter, and as dictionaries
+        # without the actions of probability 0
+        self.distributions = distributions
+        self.samplers = []
+        self.supports = []
+        for distribution in distributions:
+            items = sorted(distribution.items())
+            self.samplers.append(([item[1] for item in items],
+                                  [item[0] for item in items]))
+            self.supports.append({action: probability
+                                  for action, probability in items
+                                  if probability > 0})
+
+    def lookup(self, ghostPosition, ghostDirection, pacmanPosition, scared):
+        """
+        Returns the index of the distribution of the ghost, None if the
+        ghost or Pacman is not on a cell of the table.
+        """
+        ghost = self.cellOf.get(ghostPosition)
+        pacman = self.cellOf.get(pacmanPosition)
+        if ghost is None or pacman is None:
+            return None
+        return int(self.ids[ghost, DIRECTION_INDEX[ghostDirection], pacman,
+                            1 if scared else 0])
+
+    def getDistribution(self, index):
+        """
+        Returns a copy of the distribution of index `index`, as a Counter.
+        """
+        return self.distributions[index].copy()
+
+    def sample(self, index):
+        """
+        Samples an action from the distribution of index `index`, drawing
+        the same random number as util.chooseFromDistribution would for the
+        Counter.
+        """
+        probabilities, actions = self.samplers[index]
+        if not actions:
+            return Directions.STOP
+        return util.sample(probabilities, actions)
+
+
+def getPolicyTable(agent, layout):
+    """
+    Returns the policy table of a ghost agent on a layout, compiled on first
+    use and shared by the agents of the same class and parameters. Returns
+    None if the agent has no policy table (`agent.policyKey()` is None).
+    """
+    parameters = agent.policyKey()
+    if parameters is None:
+        return None
+    key = (type(agent), parameters, layout.layoutText)
+    table = POLICY_TABLE_CACHE.get(key)
+    if table is None:
+        with POLICY_TABLE_LOCK:
+            table = POLICY_TABLE_CACHE.get(key)
+            if table is None:
+                table = compilePolicyTable(agent, layout)
+                POLICY_TABLE_CACHE[key] = table
+    return table
+
+
+def compilePolicyTable(agent, layout):
+    """
+    Enumerates the inputs of the policy of a ghost agent on a layout.
+
+    The agent chooses an action with `agent.policyChoices(layout, cell,
+    direction, legalActions, scared, pacmanCells)`, which returns the
+    indices in `legalActions` of the actions chosen for every Pacman cell
+    (-1 for none), and turns a choice into a distribution with
+    `agent.policyDistribution(legalActions, choice, scared)`.
+    """
+    freeCells = layout.freeCells
+    pacmanCells = np.array(freeCells, dtype=float)
+    ids = np.empty((len(freeCells), len(DIRECTIONS), len(freeCells), 2),
+                   dtype=np.int16)
+
+    distributions = []
+    idOf = {}
+    for g, cell in enumerate(freeCells):
+        for d, direction in enumerate(DIRECTIONS):
+            legalActions = layout.ghostActions[(cell, direction)]
+            for scared in (0, 1):
+                choices = agent.policyChoices(
+                    layout, cell, direction, legalActions, scared,
+                    pacmanCells)
+                for choice in np.unique(choices).tolist():
+                    key = (legalActions, choice, scared)
+                    if key not in idOf:
+                        idOf[key] = len(distributions)
+                        distributions.append(agent.policyDistribution(
+                            legalActions, choice, scared))
+                    ids[g, d, choices == choice, scared] = idOf[key]
+
+    return PolicyTable(layout, ids, distributions)
+
+
+def manhattanChoices(cell, legalActions, speed, pacmanCells, farthest):
+    """
+    Returns, for every Pacman cell, the index of the first legal action
+    bringing the ghost closest to (or farthest from, if `farthest` is set)
+    Pacman in Manhattan distance, -1 if there is no legal action.
+    """
+    if not legalActions:
+        return np.full(len(pacmanCells), -1)
+    newPositions = np.array(
+        [Actions.directionToVector(action, speed)
+         for action in legalActions]) + cell
+    distances = np.abs(
+        newPositions[:, None, :] - pacmanCells[None, :, :]).sum(axis=2)
+    if farthest:
+        return distances.argmax(axis=0)
+    return distances.argmin(axis=0)
+
+
+def mazeChoices(layout, cell, legalActions):
+    """
+    Returns, for every Pacman cell, the index of the first legal action
+    starting a shortest path from the ghost to Pacman, -1 if there is no
+    legal action.
+    """
+    if not legalActions:
+        return np.full(len(layout.freeCells), -1)
+    if layout.distances is None:
+        layout.initializeMazeDistances()
+    rows = [layout.cellIndex[layout.moves[cell][action]]
+            for action in legalActions]
+    return layout.distances[rows].argmin(axis=0)
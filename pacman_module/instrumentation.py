@@ -0,0 +1,158 @@
+# instrumentation.py
+# ------------------
+# Per-game counters of the work done by the agents.
+#
+# Every Game owns an Instrumentation, which Game.run activates for the
+# thread playing the game.  The game rules (GameState, CompactGameState)
+# and the search helpers (transposition tables) record their work in the
+# instrumentation active in the current thread, so that several games can
+# be played at once in one process without sharing counters.
+#
+# The instrumentation also keeps the search statistics of every move (see
+# searchStats.py), which the search agents publish in
+# `currentMoveStats()`, and, if profiling is enabled, the timers of the hot
+# paths of the game (see profiling.py).
+
+from math import inf as INF
+import threading
+
+from . import profiling
+from .searchContext import SearchContext
+from .searchStats import MoveStats, summarize
+
+
+class Instrumentation:
+    """
+    Counters of a game:
+
+    - `expanded`: node expansions (calls to generatePacmanSuccessors and
+      generateGhostSuccessors) of the finished moves, see `searchContext`
+      for the current move;
+    - `generated`: successor states generated;
+    - `hashed`: hashes of whole states computed;
+    - `cacheHits`, `cacheMisses`: probes of the agents' caches
+      (transposition tables);
+    - `explored`: the set of the states seen by generateSuccessor, only
+      kept if `trackExplored` is set, None otherwise;
+    - `moveStats`: the search statistics of the current move, and `moves`
+      the ones of the finished moves, of every agent;
+    - `profile`: the profiling.Profile of the game, None if profiling is
+      disabled.
+    """
+
+    def __init__(self, trackExplored=False):
+        self.expanded = 0
+        self.generated = 0
+        self.hashed = 0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.explored = set() if trackExplored else None
+        self.searchContext = SearchContext()
+        self.moveStats = MoveStats()
+        self.moves = []
+        self._moveCacheProbes = (0, 0)
+        self.profile = profiling.newProfile()
+
+    def newMove(self, maxExpanded=INF, moveTime=None, agentIndex=0):
+        """
+        Starts the search of a move of agent `agentIndex`, with a new search
+        context holding its expansion budget and deadline, and new search
+        statistics.
+        """
+        self.searchContext = SearchContext(maxExpanded, moveTime)
+        self.moveStats = MoveStats(agentIndex)
+        self._moveCacheProbes = (self.cacheHits, self.cacheMisses)
+        if self.profile is not None:
+            self.profile.newMove(agentIndex)
+        return self.searchContext
+
+    def endMove(self, elapsed=None):
+        """
+        Adds the expansions of the current move to the game counter, and
+        keeps its search statistics, with its computation time `elapsed`.
+        """
+        if self.profile is not None:
+            self.profile.endMove()
+
+        stats = self.moveStats
+        stats.expanded = self.searchContext.expanded
+        stats.time = elapsed
+        stats.cacheHits = self.cacheHits - self._moveCacheProbes[0]
+        stats.cacheMisses = self.cacheMisses - self._moveCacheProbes[1]
+        self.moves.append(stats)
+
+        self.expanded += self.searchContext.expanded
+        self.searchContext = SearchContext()
+        self.moveStats = MoveStats()
+
+    def recordCacheProbe(self, hit):
+        if hit:
+            self.cacheHits += 1
+        else:
+            self.cacheMisses += 1
+
+    def getAndResetExplored(self):
+        """
+        Returns the states seen so far (None if they are not tracked) and
+        starts a new set.
+        """
+        explored = self.explored
+        if explored is not None:
+            self.explored = set()
+        return explored
+
+    def report(self):
+        """
+        Returns the counters as a dictionary.
+        """
+        return {
+            'expanded': self.expanded + self.searchContext.expanded,
+            'generated': self.generated,
+            'hashed': self.hashed,
+            'cacheHits': self.cacheHits,
+            'cacheMisses': self.cacheMisses,
+        }
+
+    def searchReport(self, agentIndex=0):
+        """
+        Returns the report of the search statistics of the moves of agent
+        `agentIndex`, see searchStats.summarize.
+        """
+        return summarize([stats for stats in self.moves
+                          if stats.agentIndex == agentIndex])
+
+
+# Instrumentation of the game played by each thread
+_active = threading.local()
+
+
+def current():
+    """
+    Returns the instrumentation active in the current thread. Outside of
+    a game, each thread records in an instrumentation of its own.
+    """
+    try:
+        return _active.instrumentation
+    except AttributeError:
+        _active.instrumentation = Instrumentation()
+        return _active.instrumentation
+
+
+def currentMoveStats():
+    """
+    Returns the search statistics of the move searched in the current
+    thread, in which the search agents publish their statistics.
+    """
+    return current().moveStats
+
+
+def activate(instrumentation):
+    """
+    Makes `instrumentation` the active one in the current thread and
+    returns the previous one (to be activated back when done).
+    """
+    previous = getattr(_active, 'instrumentation', None)
+    _active.instrumentation = instrumentation
+    profiling.activate(
+        instrumentation.profile if instrumentation is not None else None)
+    return previous
@@ -14,30 +14,72 @@
 
 from .util import manhattanDistance
 from .game import Grid
+from .game import BitGrid
+from .game import Actions
+from .game import Directions
 import os
 import random
+import struct
+import threading
+import hashlib
+from collections import deque
 from functools import reduce
+import numpy as np
 
 VISIBILITY_MATRIX_CACHE = {}
+MOVE_TABLE_CACHE = {}
+MAZE_DISTANCE_CACHE = {}
+
+# Layouts loaded from pickles, by layout text, see Layout.__reduce__
+UNPICKLED_LAYOUT_CACHE = {}
+
+# Layouts loaded from files, by (absolute path, SHA-1 of the file content)
+LAYOUT_CACHE = {}
+
+# Extension of the precompiled layouts, see compileLayout
+COMPILED_EXTENSION = '.layc'
+COMPILED_MAGIC = b'LAYC'
+COMPILED_FORMAT_VERSION = 1
+# Magic, version, width, height, number of capsules, of agents and of free
+# cells, length of the text
+COMPILED_HEADER = struct.Struct('<4s7I')
+
+# Serializes the computation of the maze distance tables, so that games
+# played in threads compute each table once
+MAZE_DISTANCE_LOCK = threading.Lock()
+
+# Maze distance tables are also saved in this folder, keyed by layout text
+MAZE_DISTANCE_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'layouts', '.cache')
+
+# Maze distance between two cells that are not connected
+UNREACHABLE = np.iinfo(np.int16).max
 
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts are immutable once built and shared by every state of a game
+    (and by the games played on the same maze file, see getLayout): the
+    game states copy the food and capsules they modify.
     """
 
     def __init__(self, layoutText):
         self.width = len(layoutText[0])
         self.height = len(layoutText)
         self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
+        self.food = BitGrid(self.width, self.height, False)
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
-        self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.layoutText = tuple(layoutText)
+        self.totalFood = self.food.count()
         # self.initializeVisibilityMatrix()
+        self.initializeMoveTables()
+        # Computed on first use, see initializeMazeDistances
+        self.distances = None
 
     def getNumGhosts(self):
         return self.numGhosts
@@ -75,6 +117,157 @@ class Layout:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(
                 str.__add__, self.layoutText)]
 
+    def initializeMoveTables(self):
+        """
+        Precomputes the legal moves from every free cell, so that the game
+        rules can answer legality questions with a dictionary lookup:
+
+         - `moves[(x, y)]` maps each legal pacman action from (x, y), in the
+           order of Actions.getPossibleActions, to its destination cell;
+         - `pacmanActions[(x, y)]` is the tuple of those actions;
+         - `ghostActions[((x, y), direction)]` is the tuple of legal actions
+           of a ghost standing on (x, y) and travelling in `direction`
+           (ghosts cannot stop, nor turn around unless in a dead end).
+
+        It also numbers the free cells: `freeCells` lists them and
+        `cellIndex` is a width x height array holding the index of each free
+        cell in `freeCells` (-1 on walls).
+
+        Only integer positions are in the tables, agents in between grid
+        points (scared ghosts) still use the Actions computation.
+        """
+        key = "\n".join(self.layoutText)
+        if key not in MOVE_TABLE_CACHE:
+            moves = {}
+            for x in range(self.width):
+                for y in range(self.height):
+                    if self.walls[x][y]:
+                        continue
+                    cellMoves = {}
+                    for direction, (dx, dy) in Actions._directionsAsList:
+                        nextX, nextY = x + dx, y + dy
+                        if 0 <= nextX < self.width and \
+                                0 <= nextY < self.height and \
+                                not self.walls[nextX][nextY]:
+                            cellMoves[direction] = (nextX, nextY)
+                    moves[(x, y)] = cellMoves
+            MOVE_TABLE_CACHE[key] = self._buildMoveTables(moves)
+        self.moves, self.pacmanActions, self.ghostActions, self.freeCells, \
+            self.cellIndex = MOVE_TABLE_CACHE[key]
+
+    def _buildMoveTables(self, moves):
+        """
+        Returns the move tables (see initializeMoveTables) derived from the
+        `moves` table.
+        """
+        pacmanActions = {}
+        ghostActions = {}
+        # The legal ghost actions only depend on the actions of the cell
+        ghostActionsOf = {}
+        for cell, cellMoves in moves.items():
+            actions = tuple(cellMoves)
+            pacmanActions[cell] = actions
+            if actions not in ghostActionsOf:
+                ghostActionsOf[actions] = []
+                for direction, _ in Actions._directionsAsList:
+                    legal = [a for a in actions if a != Directions.STOP]
+                    reverse = Actions.reverseDirection(direction)
+                    if reverse in legal and len(legal) > 1:
+                        legal.remove(reverse)
+                    ghostActionsOf[actions].append((direction, tuple(legal)))
+            for direction, legal in ghostActionsOf[actions]:
+                ghostActions[(cell, direction)] = legal
+        freeCells = sorted(moves)
+        cellIndex = np.full((self.width, self.height), -1, dtype=np.int32)
+        for index, cell in enumerate(freeCells):
+            cellIndex[cell] = index
+        return moves, pacmanActions, ghostActions, freeCells, cellIndex
+
+    def initializeMazeDistances(self):
+        """
+        Computes the all-pairs shortest path distances between the free
+        cells of the maze, with one breadth-first search per cell.
+
+        `distances` is the int16 matrix of the distances between free cells,
+        indexed like `freeCells`, with UNREACHABLE between disconnected
+        cells.  The matrix is cached in memory and on disk, keyed by layout
+        text.
+        """
+        with MAZE_DISTANCE_LOCK:
+            self._loadMazeDistances()
+
+    def _loadMazeDistances(self):
+        key = "\n".join(self.layoutText)
+        if key not in MAZE_DISTANCE_CACHE:
+            freeCells = self.freeCells
+            path = os.path.join(
+                MAZE_DISTANCE_CACHE_DIR, 'distances-%s.npy' %
+                hashlib.sha1(key.encode('utf-8')).hexdigest())
+            distances = None
+            if os.path.exists(path):
+                distances = np.load(path)
+                if distances.shape != (len(freeCells), len(freeCells)):
+                    distances = None
+            if distances is None:
+                distances = self._computeMazeDistances()
+                try:
+                    # Written under another name and renamed, so that other
+                    # processes never read a partial file
+                    os.makedirs(MAZE_DISTANCE_CACHE_DIR, exist_ok=True)
+                    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+                    with open(tmpPath, 'wb') as f:
+                        np.save(f, distances)
+                    os.replace(tmpPath, path)
+                except OSError:
+                    pass
+            MAZE_DISTANCE_CACHE[key] = (distances, distances.tolist())
+        # `distances` is set last: other threads test it without the lock
+        self._cellIndexOf = {cell: index
+                             for index, cell in enumerate(self.freeCells)}
+        self._distanceRows = MAZE_DISTANCE_CACHE[key][1]
+        self.distances = MAZE_DISTANCE_CACHE[key][0]
+
+    def _computeMazeDistances(self):
+        freeCells = self.freeCells
+        neighbors = [[self.cellIndex[cell] for direction, cell in
+                      self.moves[source].items()
+                      if direction != Directions.STOP]
+                     for source in freeCells]
+        distances = np.full((len(freeCells), len(freeCells)), UNREACHABLE,
+                            dtype=np.int16)
+        for source in range(len(freeCells)):
+            row = distances[source]
+            row[source] = 0
+            fringe = deque([source])
+            while fringe:
+                cell = fringe.popleft()
+                distance = row[cell] + 1
+                for neighbor in neighbors[cell]:
+                    if row[neighbor] == UNREACHABLE:
+                        row[neighbor] = distance
+                        fringe.append(neighbor)
+        return distances
+
+    def mazeDistance(self, pos1, pos2):
+        """
+        Returns the length of the shortest path between two free cells.
+        """
+        if self.distances is None:
+            self.initializeMazeDistances()
+        return self._distanceRows[self._cellIndexOf[pos1]][
+            self._cellIndexOf[pos2]]
+
+    def distancesFrom(self, pos):
+        """
+        Returns the int16 array of the maze distances from a free cell to
+        every free cell, ordered like `freeCells`.  Distances to arbitrary
+        cells are obtained with `distancesFrom(pos)[cellIndex[xs, ys]]`.
+        The array is shared and must not be modified.
+        """
+        if self.distances is None:
+            self.initializeMazeDistances()
+        return self.distances[self._cellIndexOf[pos]]
+
     def isWall(self, pos):
         x, col = pos
         return self.walls[x][col]
@@ -106,7 +299,16 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        # Layouts are immutable, copies can share them
+        return self
+
+    def __reduce__(self):
+        """
+        Layouts are pickled as their text. The receiving process rebuilds
+        the tables from it (or finds them in its caches), and loads every
+        pickle of the same layout as the same object.
+        """
+        return (_loadPickledLayout, (self.layoutText,))
 
     def processLayoutText(self, layoutText):
         """
@@ -146,28 +348,185 @@ class Layout:
             self.numGhosts += 1
 
 
+def _loadPickledLayout(layoutText):
+    layout = UNPICKLED_LAYOUT_CACHE.get(layoutText)
+    if layout is None:
+        layout = Layout(layoutText)
+        UNPICKLED_LAYOUT_CACHE[layoutText] = layout
+    return layout
+
+
 def getLayout(name, back=2):
-    if name.endswith('.lay'):
-        layout = tryToLoad('pacman_module/layouts/' + name)
-        if layout is None:
-            layout = tryToLoad(name)
+    """
+    Returns the layout `name`, looked for in the layout folder of the package
+    and in the current directory and its `back` parents. `name` may end with
+    `.lay`, with `.layc` (compiled layout) or have no extension, in which
+    case the compiled layout is used if it is at least as recent as the
+    text one. Returns None if the layout cannot be found.
+    """
+    path = findLayoutFile(name, back)
+    if path is None:
+        return None
+    return tryToLoad(path)
+
+
+def findLayoutFile(name, back=2):
+    """
+    Returns the path of the file of the layout `name` (see getLayout), None
+    if there is none.
+    """
+    if name.endswith('.lay') or name.endswith(COMPILED_EXTENSION):
+        names = [name]
     else:
-        layout = tryToLoad('pacman_module/layouts/' + name + '.lay')
-        if layout is None:
-            layout = tryToLoad(name + '.lay')
-    if layout is None and back >= 0:
-        curdir = os.path.abspath('.')
-        os.chdir('..')
-        layout = getLayout(name, back - 1)
-        os.chdir(curdir)
-    return layout
+        names = [name + COMPILED_EXTENSION, name + '.lay']
+
+    folder = os.path.abspath('.')
+    folders = []
+    for _ in range(back + 1):
+        folders.append(folder)
+        folder = os.path.dirname(folder)
+
+    for folder in folders:
+        for directory in (os.path.join(folder, 'pacman_module', 'layouts'),
+                          folder):
+            paths = [os.path.join(directory, n) for n in names]
+            paths = [path for path in paths if os.path.exists(path)]
+            if len(paths) == 2 and \
+                    os.path.getmtime(paths[0]) < os.path.getmtime(paths[1]):
+                # The compiled layout is older than the text one
+                paths = paths[1:]
+            if paths:
+                return paths[0]
+    return None
 
 
 def tryToLoad(fullname):
-    if(not os.path.exists(fullname)):
+    """
+    Returns the layout of the file `fullname` (text or compiled), None if
+    the file does not exist. A file is only parsed once per process: the
+    layouts are cached by path and content.
+    """
+    if not os.path.exists(fullname):
         return None
-    f = open(fullname)
-    try:
-        return Layout([line.strip() for line in f])
-    finally:
-        f.close()
+    with open(fullname, 'rb') as f:
+        content = f.read()
+    key = (os.path.abspath(fullname), hashlib.sha1(content).hexdigest())
+    layout = LAYOUT_CACHE.get(key)
+    if layout is None:
+        if fullname.endswith(COMPILED_EXTENSION):
+            layout = _loadCompiledLayout(content)
+        else:
+            layout = Layout([line.strip() for line in
+                             content.decode('utf-8').splitlines()])
+        LAYOUT_CACHE[key] = layout
+    return layout
+
+
+def compileLayout(layout, fullname):
+    """
+    Saves `layout` in the compiled format: a header (see
+    COMPILED_HEADER) followed by the layout text, the walls and food as
+    width x height bytes, then the capsules, agent starts (isPacman, x, y),
+    free cells and neighbor table of the free cells as int32 arrays.
+    `neighbors[i, d]` is the index of the cell reached from free cell `i` by
+    the d-th action of Actions._directionsAsList, -1 if the move is illegal.
+    """
+    text = "\n".join(layout.layoutText).encode('utf-8')
+    directions = [direction for direction, _ in Actions._directionsAsList]
+    neighbors = np.full((len(layout.freeCells), len(directions)), -1,
+                        dtype=np.int32)
+    for index, cell in enumerate(layout.freeCells):
+        for d, direction in enumerate(directions):
+            destination = layout.moves[cell].get(direction)
+            if destination is not None:
+                neighbors[index, d] = layout.cellIndex[destination]
+    arrays = [
+        np.array(layout.walls.data, dtype=np.uint8),
+        np.array(layout.food.data, dtype=np.uint8),
+        np.array(layout.capsules, dtype=np.int32).reshape(-1, 2),
+        np.array([(isPacman, x, y) for isPacman, (x, y) in
+                  layout.agentPositions], dtype=np.int32).reshape(-1, 3),
+        np.array(layout.freeCells, dtype=np.int32).reshape(-1, 2),
+        neighbors,
+    ]
+    with open(fullname, 'wb') as f:
+        f.write(COMPILED_HEADER.pack(
+            COMPILED_MAGIC, COMPILED_FORMAT_VERSION, layout.width,
+            layout.height, len(layout.capsules), len(layout.agentPositions),
+            len(layout.freeCells), len(text)))
+        f.write(text)
+        for array in arrays:
+            f.write(array.astype(array.dtype.newbyteorder('<')).tobytes())
+
+
+def _loadCompiledLayout(content):
+    """
+    Builds a layout from the content of a compiled layout file, without
+    parsing its text (see compileLayout).
+    """
+    magic, version, width, height, numCapsules, numAgents, numFree, \
+        textLength = COMPILED_HEADER.unpack_from(content)
+    if magic != COMPILED_MAGIC or version != COMPILED_FORMAT_VERSION:
+        raise Exception('Unsupported compiled layout format')
+    offset = COMPILED_HEADER.size
+    text = content[offset:offset + textLength].decode('utf-8')
+    offset += textLength
+
+    def read(dtype, shape):
+        nonlocal offset
+        array = np.frombuffer(content, dtype, int(np.prod(shape)), offset)
+        offset += array.nbytes
+        return array.reshape(shape)
+
+    walls = read(np.uint8, (width, height))
+    food = read(np.uint8, (width, height))
+    capsules = read('<i4', (numCapsules, 2))
+    agents = read('<i4', (numAgents, 3))
+    freeCells = read('<i4', (numFree, 2))
+    neighbors = read('<i4', (numFree, len(Actions._directionsAsList)))
+
+    layout = Layout.__new__(Layout)
+    layout.width, layout.height = width, height
+    layout.walls = Grid(width, height)
+    layout.walls.data = walls.astype(bool).tolist()
+    bits = 0
+    for index in np.flatnonzero(food).tolist():
+        bits |= 1 << index
+    layout.food = BitGrid(width, height, bits=bits)
+    layout.capsules = [tuple(cell) for cell in capsules.tolist()]
+    layout.agentPositions = [(bool(isPacman), (x, y)) for isPacman, x, y in
+                             agents.tolist()]
+    layout.numGhosts = sum(1 for isPacman, _ in layout.agentPositions
+                           if not isPacman)
+    layout.layoutText = tuple(text.split("\n"))
+    layout.totalFood = layout.food.count()
+
+    if text not in MOVE_TABLE_CACHE:
+        directions = [direction for direction, _ in
+                      Actions._directionsAsList]
+        freeCells = [tuple(cell) for cell in freeCells.tolist()]
+        moves = {}
+        for cell, row in zip(freeCells, neighbors.tolist()):
+            moves[cell] = {directions[d]: freeCells[neighbor]
+                           for d, neighbor in enumerate(row)
+                           if neighbor >= 0}
+        MOVE_TABLE_CACHE[text] = layout._buildMoveTables(moves)
+    layout.moves, layout.pacmanActions, layout.ghostActions, \
+        layout.freeCells, layout.cellIndex = MOVE_TABLE_CACHE[text]
+    layout.distances = None
+    return layout
+
+
+if __name__ == '__main__':
+    # python -m pacman_module.layout <name>...: compiles the layouts next
+    # to their text files
+    import sys
+    for name in sys.argv[1:]:
+        if not name.endswith('.lay'):
+            name += '.lay'
+        path = findLayoutFile(name)
+        if path is None:
+            sys.exit("The layout %s cannot be found" % name)
+        compiledPath = path[:-len('.lay')] + COMPILED_EXTENSION
+        compileLayout(tryToLoad(path), compiledPath)
+        print("Compiled %s" % compiledPath)
@@ -0,0 +1,153 @@
+# leafEvaluation.py
+# -----------------
+# Batched evaluation of the leaves of the H-minimax searches.
+#
+# The H-minimax agents score a leaf from the number of food dots left, the
+# Manhattan distance from Pacman to the nearest (or farthest) food dot and
+# the Manhattan distance from Pacman to the ghost.  Scoring the leaves one at
+# a time costs a Python loop over the food of every leaf.  A LeafEvaluator
+# scores a batch of leaves (e.g. all the children of a node of the search
+# frontier) with a few NumPy operations: the food bitboards are unpacked into
+# a leaves x cells boolean matrix, and the distances from Pacman to the food
+# are reduced along its rows.  The food part of the estimate only depends on
+# Pacman's position and the food, and the same pairs come back all over a
+# search tree, so it is memorized: only the new pairs of a batch go through
+# NumPy.
+
+from math import inf as INF
+
+import numpy as np
+
+from .compactState import CompactGameState
+from .game import BitGrid
+
+
+class LeafEvaluator:
+    """
+    Scores batches of leaves of a layout with
+
+        foodCoef * food left + distCoef * food distance + score
+            + ghostCoef * distance to the ghost
+
+    where the food distance is the Manhattan distance from Pacman to the
+    nearest food dot (to the farthest one if `farthest` is set), 0 if there
+    is no food left.
+    """
+
+    # Maximum number of memorized food terms
+    MEMO_CAPACITY = 2 ** 16
+
+    def __init__(self, layout, foodCoef, distCoef, ghostCoef=0,
+                 farthest=False):
+        self.layout = layout
+        self.foodCoef = foodCoef
+        self.distCoef = distCoef
+        self.ghostCoef = ghostCoef
+        self.farthest = farthest
+
+        # Food part of the estimate, by (Pacman position, food bitboard)
+        self.foodTerms = {}
+
+        # Coordinates of the cells, in the BitGrid bit order
+        self.numCells = layout.width * layout.height
+        self.numBytes = (self.numCells + 7) // 8
+        cells = np.arange(self.numCells)
+        self.cellX = (cells // layout.height).astype(float)
+        self.cellY = (cells % layout.height).astype(float)
+
+    def evaluate(self, pacmanPositions, ghostPositions, foods, scores):
+        """
+        Scores a batch of leaves.
+
+        Arguments:
+        ----------
+        - `pacmanPositions`: the positions of Pacman, one per leaf
+        - `ghostPositions`: the positions of the ghost, one per leaf (unused,
+            and may be None, if `ghostCoef` is 0)
+        - `foods`: the food bitboards, as ints in the BitGrid bit order
+        - `scores`: the game scores
+
+        Return:
+        -------
+        - The list of the estimates of the leaves
+        """
+
+        keys = list(zip(pacmanPositions, foods))
+        foodTerms = self.foodTerms
+        missing = [key for key in keys if key not in foodTerms]
+        if missing:
+            missing = list(dict.fromkeys(missing))
+            if len(foodTerms) + len(missing) > self.MEMO_CAPACITY:
+                foodTerms.clear()
+            foodTerms.update(zip(missing, self._foodTerms(missing)))
+
+        if self.ghostCoef == 0:
+            return [foodTerms[key] + score
+                    for key, score in zip(keys, scores)]
+        ghostCoef = self.ghostCoef
+        return [foodTerms[key] + score + ghostCoef * (
+                abs(key[0][0] - ghost[0]) + abs(key[0][1] - ghost[1]))
+                for key, ghost, score in zip(keys, ghostPositions, scores)]
+
+    def _foodTerms(self, keys):
+        """
+        Computes `foodCoef * food left + distCoef * food distance` for a
+        batch of (Pacman position, food bitboard) pairs, in NumPy.
+        """
+
+        n = len(keys)
+
+        # Pairs x cells matrix of the food
+        buffer = b''.join(bits.to_bytes(self.numBytes, 'little')
+                          for _, bits in keys)
+        food = np.unpackbits(
+            np.frombuffer(buffer, np.uint8).reshape(n, self.numBytes),
+            axis=1, count=self.numCells, bitorder='little').view(bool)
+        numFood = food.sum(axis=1)
+
+        pacman = np.array([position for position, _ in keys], dtype=float)
+        distances = np.abs(self.cellX - pacman[:, 0:1]) + \
+            np.abs(self.cellY - pacman[:, 1:2])
+        if self.farthest:
+            foodDistance = np.where(food, distances, 0).max(axis=1)
+        else:
+            foodDistance = np.where(food, distances, INF).min(axis=1)
+            foodDistance[numFood == 0] = 0
+
+        return (self.foodCoef * numFood +
+                self.distCoef * foodDistance).tolist()
+
+    def evaluateStates(self, states):
+        """
+        Scores a batch of game states (GameState or CompactGameState) of the
+        layout, see `evaluate`.
+        """
+
+        if states and isinstance(states[0], CompactGameState):
+            # Read the slots directly, this is the common case in searches
+            ghostPositions = [state.ghosts[0][0] for state in states] \
+                if self.ghostCoef != 0 else None
+            return self.evaluate(
+                [state.pacmanPosition for state in states], ghostPositions,
+                [state.food for state in states],
+                [state.score for state in states])
+
+        ghostPositions = None
+        if self.ghostCoef != 0:
+            ghostPositions = [state.getGhostPosition(1) for state in states]
+        return self.evaluate(
+            [state.getPacmanPosition() for state in states], ghostPositions,
+            [foodBits(state) for state in states],
+            [state.getScore() for state in states])
+
+
+def foodBits(state):
+    """
+    Returns the food of a game state as an int bitboard.
+    """
+    if isinstance(state, CompactGameState):
+        return state.food
+    food = state.getFood()
+    if not isinstance(food, BitGrid):
+        food = BitGrid.fromGrid(food)
+    return food.getBits()
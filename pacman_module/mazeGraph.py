@@ -0,0 +1,119 @@
+# mazeGraph.py
+# ------------
+# Corridor-compressed graph of a maze.
+#
+# A corridor cell has exactly two free neighbours: an agent walking through
+# it can only go on or turn back.  The other free cells (dead ends, bends of
+# open areas, crossings) are the junctions of the maze.  A MazeGraph
+# collapses the corridors into weighted edges between junctions: from any
+# cell, a Corridor is the walk that leaves the cell in a direction and goes
+# straight on through corridor cells until it reaches a junction, with its
+# length in moves as weight.  The edges of the graph are the corridors
+# leaving the junctions.
+#
+# Searches that move the agents junction to junction (see macrominimax.py)
+# only branch at the junctions, and play the moves in between without
+# searching them.
+
+from .game import Actions, Directions
+
+# Maze graphs, by layout text
+MAZE_GRAPH_CACHE = {}
+
+
+class Corridor:
+    """
+    A walk from cell `start` to junction `end` (or back to `start` on a
+    maze without junctions): the `actions` played and the `cells` reached by
+    each of them, `length` moves in total.  `mask` is the food bitboard mask
+    of the cells of the walk.
+    """
+    __slots__ = ('start', 'end', 'actions', 'cells', 'length', 'mask')
+
+    def __init__(self, start, actions, cells, height):
+        self.start = start
+        self.end = cells[-1]
+        self.actions = actions
+        self.cells = cells
+        self.length = len(actions)
+        self.mask = 0
+        for x, y in cells:
+            self.mask |= 1 << (x * height + y)
+
+
+class MazeGraph:
+    """
+    The corridor-compressed graph of a layout, see the module documentation.
+
+    - `junctions`: the free cells which are not corridor cells;
+    - `corridors[(cell, action)]`: the Corridor leaving a free cell with
+      a legal action (but STOP), for every free cell;
+    - `edges[junction]`: the Corridors leaving a junction.
+    """
+
+    def __init__(self, layout):
+        self.layout = layout
+        moves = layout.moves
+        self.isCorridor = {
+            cell: len([action for action in cellMoves
+                       if action != Directions.STOP]) == 2
+            for cell, cellMoves in moves.items()}
+        self.junctions = [cell for cell in layout.freeCells
+                          if not self.isCorridor[cell]]
+
+        self.corridors = {}
+        for cell in layout.freeCells:
+            for action in layout.pacmanActions[cell]:
+                if action != Directions.STOP:
+                    self.corridors[(cell, action)] = self._walk(cell, action)
+        self.edges = {junction: [self.corridors[(junction, action)]
+                                 for action in layout.pacmanActions[junction]
+                                 if action != Directions.STOP]
+                      for junction in self.junctions}
+
+    def _walk(self, start, action):
+        """
+        Returns the Corridor leaving `start` with `action`.
+        """
+        moves = self.layout.moves
+        actions = [action]
+        cells = [moves[start][action]]
+        # A maze without junctions is a loop: stop when back to the start
+        while self.isCorridor[cells[-1]] and cells[-1] != start:
+            reverse = Actions.reverseDirection(actions[-1])
+            cell = cells[-1]
+            action = next(a for a in moves[cell]
+                          if a != Directions.STOP and a != reverse)
+            actions.append(action)
+            cells.append(moves[cell][action])
+        return Corridor(start, tuple(actions), tuple(cells),
+                        self.layout.height)
+
+    def getCorridor(self, cell, action):
+        """
+        Returns the Corridor leaving `cell` with `action`, or None if `cell`
+        is not a free cell (e.g. a position in between two cells) or
+        `action` is not legal there.
+        """
+        return self.corridors.get((cell, action))
+
+    def compression(self):
+        """
+        Returns the average length of the edges of the graph, in moves: how
+        many moves a junction to junction search plays per decision.
+        """
+        lengths = [corridor.length for edges in self.edges.values()
+                   for corridor in edges]
+        return sum(lengths) / len(lengths) if lengths else 0
+
+
+def getMazeGraph(layout):
+    """
+    Returns the maze graph of a layout, built on first use.
+    """
+    key = layout.layoutText
+    graph = MAZE_GRAPH_CACHE.get(key)
+    if graph is None:
+        graph = MazeGraph(layout)
+        MAZE_GRAPH_CACHE[key] = graph
+    return graph
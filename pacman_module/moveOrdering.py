@@ -0,0 +1,151 @@
+# moveOrdering.py
+# ---------------
+# Move ordering heuristics for the alpha-beta agents.
+#
+# Alpha-beta prunes the most when the best move of a node is searched first.
+# The heuristics below guess that move from what the search already saw:
+#
+# - 'tt': the best move stored in the transposition table for the node;
+# - 'killers': the last moves that caused a cutoff at the same ply;
+# - 'history': the moves that caused cutoffs anywhere in the tree, by
+#   (player, cell of the player, direction), weighted by the height of the
+#   node that was cut.
+
+
+class MoveOrdering:
+    """
+    Orders the successors of the nodes of a search and records which moves
+    caused cutoffs.
+
+    The counters are never reset, the agents read them to report the cutoff
+    rate of their searches:
+
+    - `nodes`: the number of nodes recorded;
+    - `cutoffs`: the number of those nodes that were cut;
+    - `firstMoveCutoffs`: the number of cuts caused by the first successor.
+    """
+
+    HEURISTICS = ('tt', 'killers', 'history')
+
+    # Number of killer moves kept per ply
+    KILLERS_PER_PLY = 2
+
+    def __init__(self, heuristics=HEURISTICS):
+        unknown = set(heuristics) - set(self.HEURISTICS)
+        if unknown:
+            raise ValueError("Unknown move ordering heuristics " +
+                             ", ".join(sorted(unknown)))
+        self.heuristics = tuple(heuristics)
+        self.useTT = 'tt' in heuristics
+        self.useKillers = 'killers' in heuristics
+        self.useHistory = 'history' in heuristics
+
+        self.killers = []
+        self.history = {}
+
+        self.nodes = 0
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+
+    def newSearch(self):
+        """
+        Marks the beginning of a new search (a new move). Killer moves are
+        forgotten and the history scores are halved, so that the cutoffs of
+        the current position weigh more than the old ones.
+        """
+        self.killers = []
+        for key in self.history:
+            self.history[key] >>= 1
+
+    def order(self, successors, player, cell, ply, ttMove=None):
+        """
+        Sorts successors by decreasing chance of causing a cutoff. The
+        transposition table move comes first, then the killer moves of the
+        ply, then the others by history score. Ties keep the order of
+        `successors`, which is kept as is without heuristics.
+
+        Arguments:
+        ----------
+        - `successors`: the successors of the node, as (state, move) pairs
+        - `player`: the id of the player to move
+        - `cell`: the position of the player to move
+        - `ply`: the distance between the node and the root
+        - `ttMove`: the best move stored in the transposition table for the
+            node, if any
+
+        Return:
+        -------
+        - The ordered successors, in a new list
+        """
+
+        if len(successors) < 2 or not self.heuristics:
+            return successors
+
+        if not self.useTT:
+            ttMove = None
+        if self.useKillers and ply < len(self.killers):
+            killers = self.killers[ply]
+        else:
+            killers = ()
+        history = self.history if self.useHistory else {}
+
+        def priority(successor):
+            move = successor[1]
+            if move == ttMove:
+                return (2, 0)
+            if move in killers:
+                return (1, -killers.index(move))
+            return (0, history.get((player, cell, move), 0))
+
+        return sorted(successors, key=priority, reverse=True)
+
+    def record(self, player, cell, move, ply, height, index, cutoff):
+        """
+        Records the result of a node.
+
+        Arguments:
+        ----------
+        - `player`: the id of the player to move
+        - `cell`: the position of the player to move
+        - `move`: the best move found at the node
+        - `ply`: the distance between the node and the root
+        - `height`: the remaining search depth below the node (1 when the
+            search is not depth limited)
+        - `index`: the index of `move` in the ordered successors
+        - `cutoff`: whether `move` caused a cutoff
+        """
+
+        self.nodes += 1
+        if not cutoff:
+            return
+
+        self.cutoffs += 1
+        if index == 0:
+            self.firstMoveCutoffs += 1
+
+        if self.useKillers:
+            while len(self.killers) <= ply:
+                self.killers.append([])
+            killers = self.killers[ply]
+            if move in killers:
+                killers.remove(move)
+            killers.insert(0, move)
+            del killers[self.KILLERS_PER_PLY:]
+
+        if self.useHistory:
+            key = (player, cell, move)
+            self.history[key] = self.history.get(key, 0) + height * height
+
+    def cutoffRate(self):
+        """
+        Returns the fraction of the recorded nodes that were cut.
+        """
+        return self.cutoffs / self.nodes if self.nodes > 0 else 0.0
+
+    def firstMoveCutoffRate(self):
+        """
+        Returns the fraction of the cutoffs caused by the first successor,
+        i.e. how often the ordering guessed right.
+        """
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs > 0 \
+            else 0.0
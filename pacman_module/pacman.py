@@ -45,7 +45,8 @@ from .game import Directions
 from .game import Actions
 from .util import nearestPoint
 from .util import manhattanDistance
-from . import textDisplay, graphicsDisplay
+from . import instrumentation
+from . import textDisplay
 from . import util, layout
 import sys
 import types
@@ -58,7 +59,31 @@ import numpy as np
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
 ###################################################
 
-class GameState:
+class _GameStateCounters(type):
+    """
+    Keeps GameState.countExpanded and GameState.maximumExpanded, the
+    class-level counters of the original engine, readable and writable:
+    they are views of the search context of the current move.
+    """
+
+    @property
+    def countExpanded(cls):
+        return cls.getSearchContext().expanded
+
+    @countExpanded.setter
+    def countExpanded(cls, value):
+        cls.getSearchContext().expanded = value
+
+    @property
+    def maximumExpanded(cls):
+        return cls.getSearchContext().maxExpanded
+
+    @maximumExpanded.setter
+    def maximumExpanded(cls, value):
+        cls.getSearchContext().maxExpanded = value
+
+
+class GameState(metaclass=_GameStateCounters):
     """
     A GameState specifies the full game state, including the food, capsules,
     agent configurations and score changes.
@@ -77,23 +102,33 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions
-    explored = set()
-    # static variable keeps track of number of calls of
-    # /!\ XXX: Do NOT modify this variable during get_action call.
+    # The number of calls of generatePacmanSuccessors and
+    # generateGhostSuccessors, and the expansion budget, of the current move
+    # are kept in the search context of the instrumentation of the game (see
+    # instrumentation.py). Game.run sets a new context before each move.
+    # /!\ XXX: Do NOT modify the search context during get_action call.
     # /!\ Otherwise, your project won't be graded
-    countExpanded=0
-    maximumExpanded = np.inf
+
+    def getSearchContext():
+        return instrumentation.current().searchContext
+    getSearchContext = staticmethod(getSearchContext)
+
+    # Shims of the original class-level counters, acting on the search
+    # context of the current move
     def resetNodeExpansionCounter():
-        GameState.countExpanded=0
+        GameState.getSearchContext().expanded = 0
+    resetNodeExpansionCounter = staticmethod(resetNodeExpansionCounter)
 
     def setMaximumExpanded(m):
-        GameState.maximumExpanded = m
+        GameState.getSearchContext().maxExpanded = m
+    setMaximumExpanded = staticmethod(setMaximumExpanded)
 
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
-        return tmp
+        """
+        Returns the states seen by generateSuccessor, if the game tracks
+        them (see Instrumentation), None otherwise.
+        """
+        return instrumentation.current().getAndResetExplored()
     getAndResetExplored = staticmethod(getAndResetExplored)
 
     def getLegalActions(self, agentIndex=0):
@@ -139,8 +174,11 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        counters = instrumentation.current()
+        counters.generated += 1
+        if counters.explored is not None:
+            counters.explored.add(self)
+            counters.explored.add(state)
         return state
 
     def getLegalPacmanActions(self):
@@ -155,20 +193,22 @@ class GameState:
     def generatePacmanSuccessors(self):
         """
         Returns a list of pairs of successor states and moves given the current state s for the pacman agent.
+        Raises searchContext.BudgetExhausted if the expansion budget of the
+        move is spent.
         """
-        if (GameState.countExpanded >= GameState.maximumExpanded):
-            return None
-        GameState.countExpanded += 1
+        instrumentation.current().searchContext.expand()
         return [(self.generateSuccessor(0, action),action) for action in self.getLegalPacmanActions() if action != Directions.STOP]
 
     def generateGhostSuccessors(self,index):
         """
          Returns a list of pairs of successor states and moves given the current state s for the ghost agent (>0).
+        Raises searchContext.BudgetExhausted if the expansion budget of the
+        move is spent.
         """
 
-        if (GameState.countExpanded >= GameState.maximumExpanded or index == 0):
+        if index == 0:
             return None
-        GameState.countExpanded += 1
+        instrumentation.current().searchContext.expand()
 
         return [(self.generateSuccessor(index, action),action) for action in self.getLegalActions(index) if action != Directions.STOP]
 
@@ -270,6 +310,33 @@ class GameState:
         state.data = self.data.deepCopy()
         return state
 
+    def shallowCopy(self):
+        """
+        Returns a copy of this state that shares its layout with it, unlike
+        deepCopy which also copies the layout.  The agent states, capsules
+        and food are copied (the food in O(1)), so the copy can be handed
+        to an agent without exposing the state of the game.
+        """
+        state = GameState(self)
+        state.data.food = self.data.food.copy()
+        return state
+
+    def toCompact(self):
+        """
+        Returns an immutable CompactGameState snapshot of this state (see
+        compactState.py).  It offers the same accessors and successor
+        functions, at a fraction of the cost, for search agents.
+        """
+        from .compactState import CompactGameState
+        return CompactGameState.fromGameState(self)
+
+    def fromCompact(compact):
+        """
+        Rebuilds a full GameState from a CompactGameState snapshot.
+        """
+        return compact.toGameState()
+    fromCompact = staticmethod(fromCompact)
+
     def __eq__(self, other):
         """
         Allows two states to be compared.
@@ -280,6 +347,7 @@ class GameState:
         """
         Allows states to be keys of dictionaries.
         """
+        instrumentation.current().hashed += 1
         return hash(self.data)
 
     def __str__(self):
@@ -308,10 +376,18 @@ class ClassicGameRules:
     """
     These game rules manage the control flow of a game, deciding when
     and how the game starts and ends.
+
+    The rules only hold settings: the state of a game (its initial state,
+    whether it is quiet) is kept by the Game, so that one rules object can
+    be shared by games played at the same time.
+
+    `timeout` is the node expansion budget of a move and `moveTime` the
+    time budget of a move of Pacman, in seconds (None or 0 for none).
     """
 
-    def __init__(self, timeout=30):
+    def __init__(self, timeout=30, moveTime=None):
         self.timeout = timeout
+        self.moveTime = moveTime or None
 
     def newGame(
             self,
@@ -320,14 +396,17 @@ class ClassicGameRules:
             ghostAgents,
             display,
             quiet=False,
-            catchExceptions=False):
+            catchExceptions=False,
+            instrumentation=None,
+            headless=False):
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
         initState = GameState()
         initState.initialize(layout, len(ghostAgents))
-        game = Game(agents, display, self, catchExceptions=catchExceptions)
+        game = Game(agents, display, self, catchExceptions=catchExceptions,
+                    instrumentation=instrumentation, headless=headless)
         game.state = initState
-        self.initialState = initState.deepCopy()
-        self.quiet = quiet
+        game.initialState = initState.deepCopy()
+        game.quiet = quiet
         return game
 
     def process(self, state, game):
@@ -345,12 +424,12 @@ class ClassicGameRules:
         game.gameOver = True
 
     def lose(self, state, game):
-        if not self.quiet:
+        if not game.quiet:
             print("Pacman died! Score: %d" % state.data.score)
         game.gameOver = True
 
     def getProgress(self, game):
-        return float(game.state.getNumFood()) / self.initialState.getNumFood()
+        return float(game.state.getNumFood()) / game.initialState.getNumFood()
 
     def agentCrash(self, game, agentIndex):
         if agentIndex == 0:
@@ -370,6 +449,13 @@ class ClassicGameRules:
     def getMoveTimeout(self, agentIndex):
         return self.timeout
 
+    def getMoveTime(self, agentIndex):
+        """
+        Returns the time budget of a move of agent `agentIndex`, in seconds,
+        None if the move has no deadline. The ghosts have none.
+        """
+        return self.moveTime if agentIndex == 0 else None
+
     def getMaxTimeWarnings(self, agentIndex):
         return 0
 
@@ -385,9 +471,12 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions(
-            state.getPacmanState().configuration,
-            state.data.layout.walls)
+        configuration = state.data.agentStates[0].configuration
+        actions = state.data.layout.pacmanActions.get(configuration.pos)
+        if actions is None:
+            return Actions.getPossibleActions(
+                configuration, state.data.layout.walls)
+        return list(actions)
     getLegalActions = staticmethod(getLegalActions)
 
     def applyAction(state, action):
@@ -421,7 +510,7 @@ class PacmanRules:
             state.data.food = state.data.food.copy()
             state.data.food[x][y] = False
             state.data._foodEaten = position
-            # TODO: cache numFood?
+            # The food grid is a BitGrid, its count is cached
             numFood = state.getNumFood()
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
@@ -448,15 +537,29 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState(ghostIndex).configuration
-        possibleActions = Actions.getPossibleActions(
-            conf, state.data.layout.walls)
-        reverse = Actions.reverseDirection(conf.direction)
+        return GhostRules.getLegalActionsAt(
+            conf.pos, conf.direction, state.data.layout)
+    getLegalActions = staticmethod(getLegalActions)
+
+    def getLegalActionsAt(position, direction, layout):
+        """
+        Same as getLegalActions, for a ghost described by its bare position
+        and direction.
+        """
+        actions = layout.ghostActions.get((position, direction))
+        if actions is not None:
+            return list(actions)
+
+        # Scared ghosts move at half speed and can stand in between cells
+        possibleActions = Actions.getPossibleActionsAt(
+            position, direction, layout.walls)
+        reverse = Actions.reverseDirection(direction)
         if Directions.STOP in possibleActions:
             possibleActions.remove(Directions.STOP)
         if reverse in possibleActions and len(possibleActions) > 1:
             possibleActions.remove(reverse)
         return possibleActions
-    getLegalActions = staticmethod(getLegalActions)
+    getLegalActionsAt = staticmethod(getLegalActionsAt)
 
     def applyAction(state, action, ghostIndex):
 
@@ -795,9 +898,6 @@ def runGames(
         numTraining=0,
         catchExceptions=False,
         timeout=30):
-    import __main__
-    __main__.__dict__['_display'] = display
-
     rules = ClassicGameRules(timeout)
     games = []
 
@@ -807,10 +907,8 @@ def runGames(
                 # Suppress output and graphics
             from . import textDisplay
             gameDisplay = textDisplay.NullGraphics()
-            rules.quiet = True
         else:
             gameDisplay = display
-            rules.quiet = False
         game = rules.newGame(
             layout,
             pacman,
@@ -846,18 +944,45 @@ def runGames(
     return games
 
 
-def runGame(
+def createGame(
         layout_name,
         pacman,
         ghosts,
         displayGraphics,
-        expout=np.inf):
-    display = graphicsDisplay.PacmanGraphics(
-        1.0, frameTime=0.1) if displayGraphics else textDisplay.NullGraphics()
-    import __main__
-    __main__.__dict__['_display'] = display
+        expout=np.inf,
+        instrumentation=None,
+        moveTime=None):
+    """
+    Returns a new game, ready to be run.  Headless games (without
+    `displayGraphics`) share no mutable state: several of them can be
+    played at the same time, e.g. in threads.  The graphical display is a
+    single window, so only one graphical game can be played at a time.
+
+    `expout` is the node expansion budget of a move and `moveTime` the time
+    budget of a move of Pacman, in seconds: the search context of the move
+    (see searchContext.py) stops the search at its deadline. Without
+    `moveTime`, the moves have no deadline and the search agents search to
+    a fixed depth, so that the games are reproducible.
+    """
+    if displayGraphics:
+        from . import graphicsDisplay
+        display = graphicsDisplay.PacmanGraphics(1.0, frameTime=0.1)
+    else:
+        display = textDisplay.NullGraphics()
     lay = layout.getLayout(layout_name)
 
-    rules = ClassicGameRules(expout)
-    game = rules.newGame(lay, pacman, ghosts, display, False, False)
+    rules = ClassicGameRules(expout, moveTime)
+    return rules.newGame(lay, pacman, ghosts, display, False, False,
+                         instrumentation, headless=not displayGraphics)
+
+
+def runGame(
+        layout_name,
+        pacman,
+        ghosts,
+        displayGraphics,
+        expout=np.inf,
+        moveTime=None):
+    game = createGame(layout_name, pacman, ghosts, displayGraphics, expout,
+                      moveTime=moveTime)
     return game.run()
@@ -0,0 +1,169 @@
+# parallelSearch.py
+# -----------------
+# Root-split parallel search for the alphabeta agents.
+#
+# The successors of the root are searched by a pool of worker processes, one
+# task per successor.  Each worker keeps its own copy of the agent (built
+# from the agent class and its command-line arguments), so that its tables
+# survive from one task to the next.  The scores of the successors are
+# shared by all the workers: a task prunes with the best score found so far
+# among the successors that come before its own (the root alpha), as the
+# sequential search does.  A task started after those finished gets the same
+# bound as in the sequential search, so the same move is chosen.
+#
+# The nodes expanded by the workers are added back to the search context of
+# the move, and their other counters to the instrumentation of the game.
+# The remaining expansion budget is split between the tasks, so that the
+# reporting and the budget of Game.run stay correct, and the tasks stop at
+# the deadline of the move.  A task that runs out of budget has no result.
+
+from concurrent.futures import ProcessPoolExecutor
+from math import inf as INF
+import multiprocessing
+import time
+
+from . import instrumentation
+from .searchContext import BudgetExhausted
+
+# Maximum number of successors of the root whose scores are shared
+ROOT_SLOTS = 16
+
+# Scores of the successors of the root shared with the parent, and index of
+# the successor searched by the current task, in the workers
+_rootScores = None
+_taskIndex = 0
+
+# Agents of this worker, by agent class
+_agents = {}
+
+
+def _initWorker(rootScores):
+    global _rootScores
+    _rootScores = rootScores
+
+
+def rootAlpha():
+    """
+    Returns the best score found so far among the successors of the root
+    that come before the one of the current task (-inf outside of a
+    worker).
+    """
+    if _rootScores is None or _taskIndex == 0:
+        return -INF
+    return max(_rootScores[:min(_taskIndex, ROOT_SLOTS)])
+
+
+def publishScore(value):
+    """
+    Shares the score of the successor of the current task with the tasks of
+    the next successors.
+    """
+    if _rootScores is None or value is None or _taskIndex >= ROOT_SLOTS:
+        return
+    _rootScores[_taskIndex] = value
+
+
+def _runTask(agentClass, args, index, task, maxExpanded, deadline):
+    global _taskIndex
+    _taskIndex = index
+
+    agent = _agents.get(agentClass)
+    if agent is None:
+        agent = agentClass(args)
+        _agents[agentClass] = agent
+
+    # The task records its work in an instrumentation of its own
+    counters = instrumentation.Instrumentation()
+    # The timers of the hot paths only profile the main process
+    counters.profile = None
+    instrumentation.activate(counters)
+    # The deadline of the move is a wall-clock time, which is the same in
+    # all the processes, and the queued tasks get the time left when they
+    # start
+    moveTime = None
+    if deadline is not None:
+        moveTime = max(deadline - time.time(), 0.0)
+    context = counters.newMove(maxExpanded, moveTime)
+    try:
+        result, error = agent.searchRootChild(task), None
+    except BudgetExhausted:
+        result, error = None, None
+    except Exception as e:
+        result, error = None, e
+    return result, error, context.expanded, counters.report(), \
+        counters.moveStats
+
+
+class RootSplitter:
+    """
+    A pool of worker processes searching the successors of the root.
+
+    The agents using it implement `searchRootChild(task)`, which searches
+    the successor described by `task` (a picklable object, e.g. a tuple
+    holding a CompactGameState) and returns a picklable result.  They read
+    the root alpha with `rootAlpha()` before searching, and share the score
+    they found with `publishScore(score)`.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.scores = multiprocessing.Array('d', ROOT_SLOTS, lock=False)
+        self.executor = ProcessPoolExecutor(
+            workers, initializer=_initWorker, initargs=(self.scores,))
+
+    def search(self, agent, tasks):
+        """
+        Runs `agent.searchRootChild` on every task in the workers.
+
+        Arguments:
+        ----------
+        - `agent`: the agent, whose class and `args` are used to build the
+            agents of the workers
+        - `tasks`: the tasks, one per successor of the root
+
+        Return:
+        -------
+        - The results of the tasks, in the order of `tasks`, None for the
+          tasks that ran out of budget. If a task raised another exception,
+          it is raised again once all the tasks are finished and their
+          expanded nodes counted.
+        """
+
+        counters = instrumentation.current()
+        context = counters.searchContext
+        for index in range(ROOT_SLOTS):
+            self.scores[index] = -INF
+
+        # Split the remaining expansion budget between the tasks
+        budget = context.nodesLeft()
+        if budget != INF:
+            budget = budget // max(len(tasks), 1)
+
+        deadline = None
+        if context.deadline is not None:
+            deadline = time.time() + context.timeLeft()
+
+        futures = [self.executor.submit(
+            _runTask, type(agent), agent.args, index, task, budget,
+            deadline) for index, task in enumerate(tasks)]
+
+        results = []
+        firstError = None
+        for future in futures:
+            result, error, expanded, report, stats = future.result()
+            context.expanded += expanded
+            counters.moveStats.merge(stats)
+            counters.generated += report['generated']
+            counters.hashed += report['hashed']
+            counters.cacheHits += report['cacheHits']
+            counters.cacheMisses += report['cacheMisses']
+            if error is not None and firstError is None:
+                firstError = error
+            results.append(result)
+
+        if firstError is not None:
+            raise firstError
+        return results
+
+    def shutdown(self):
+        self.executor.shutdown()
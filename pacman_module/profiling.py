@@ -0,0 +1,306 @@
+# profiling.py
+# ------------
+# Opt-in timers and counters on the hot paths of the engine and the agents.
+#
+# Profiling a whole game under cProfile slows every call down and drowns the
+# few functions that matter in the rest.  Instead, `enable` wraps a fixed
+# list of hot paths (HOT_PATHS: the successor functions of the rules, the
+# hash of the grids, the evaluation of the leaves) in named timers, and
+# `instrumentAgent` does the same for the evaluation functions of an agent
+# (AGENT_HOT_PATHS).  Nothing is wrapped until profiling is enabled, so that
+# it costs nothing when disabled.
+#
+# The timers record in the Profile of the game played by the current thread
+# (see instrumentation.py, which creates a Profile per game when profiling
+# is enabled and activates it with the game): the calls, the cumulative time
+# and the self time (without the time of the timers called inside) of each
+# hot path.  Each move is a timer too, `move`, whose self time is the time
+# spent out of the hot paths.  The Profile can also run cProfile on every
+# move and keep the slowest ones, to be dumped as cProfile files and as
+# collapsed stacks of the timers (for flame graphs).
+#
+# Profiling is enabled by `run.py --profile`, or by the PACMAN_PROFILE
+# environment variable (see `enableFromEnvironment`).
+
+import cProfile
+import heapq
+import importlib
+import os
+import threading
+from functools import wraps
+from time import perf_counter
+
+# Environment variables enabling profiling, and giving the number of slowest
+# moves to keep for dumping
+PROFILE_VARIABLE = 'PACMAN_PROFILE'
+DUMP_VARIABLE = 'PACMAN_PROFILE_DUMP'
+
+# Hot paths of the engine, as (module, class, attribute) triples
+HOT_PATHS = [
+    ('pacman', 'GameState', 'generateSuccessor'),
+    ('pacman', 'PacmanRules', 'applyAction'),
+    ('pacman', 'GhostRules', 'applyAction'),
+    ('pacman', 'GhostRules', 'checkDeath'),
+    ('game', 'Grid', '__hash__'),
+    ('compactState', 'CompactGameState', '_pacmanSuccessor'),
+    ('compactState', 'CompactGameState', '_ghostSuccessor'),
+    ('leafEvaluation', 'LeafEvaluator', 'evaluate'),
+    ('leafEvaluation', 'LeafEvaluator', 'evaluateStates'),
+]
+
+# Evaluation functions of the agents, by method name
+AGENT_HOT_PATHS = ['_getEstimate', 'evaluationFunction', '_evaluate',
+                   '_rollout']
+
+# Original functions of the wrapped hot paths, by (owner, attribute)
+_originals = {}
+
+# Number of slowest moves the profiles of the games keep, None if profiling
+# is disabled
+_dumpSlowest = None
+
+# Profile of the game played by each thread
+_active = threading.local()
+
+
+class Timer:
+    """
+    The calls of a hot path: their number, their cumulative time and their
+    self time, in seconds.
+    """
+    __slots__ = ('name', 'calls', 'total', 'selfTime')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.selfTime = 0.0
+
+
+class Profile:
+    """
+    The timers of a game, see the module documentation.
+
+    - `timers`: the Timers, by name;
+    - `dumpSlowest`: the number of slowest moves to keep, each profiled
+      with cProfile (0 not to run cProfile);
+    - `slowest`: the kept moves, as (time, move number, agent index,
+      cProfile.Profile, collapsed stacks) tuples, in a heap.
+    """
+
+    def __init__(self, dumpSlowest=0):
+        self.timers = {}
+        self.dumpSlowest = dumpSlowest
+        self.slowest = []
+        self.moveNumber = 0
+        self.agentIndex = 0
+
+        # Frames of the running timers: [name, start, time of the timers
+        # called inside]
+        self.frames = []
+
+        # Profiling of the current move, if dumped: cProfile and self time
+        # of the timers by collapsed stack
+        self.profiler = None
+        self.stacks = None
+
+    def enter(self, name):
+        self.frames.append([name, perf_counter(), 0.0])
+
+    def exit(self):
+        name, start, inside = self.frames.pop()
+        elapsed = perf_counter() - start
+
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = Timer(name)
+        timer.calls += 1
+        timer.total += elapsed
+        timer.selfTime += elapsed - inside
+
+        if self.frames:
+            self.frames[-1][2] += elapsed
+        if self.stacks is not None:
+            stack = ';'.join([frame[0] for frame in self.frames] + [name])
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + \
+                elapsed - inside
+        return elapsed
+
+    def newMove(self, agentIndex):
+        """
+        Starts the `move` timer of a move of agent `agentIndex`, and its
+        cProfile if the slowest moves are kept.
+        """
+        self.agentIndex = agentIndex
+        if self.dumpSlowest:
+            self.stacks = {}
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.enter('move')
+
+    def endMove(self):
+        """
+        Stops the `move` timer, and keeps the move if it is one of the
+        slowest.
+        """
+        elapsed = self.exit()
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            heapq.heappush(self.slowest, (
+                elapsed, self.moveNumber, self.agentIndex, self.profiler,
+                self.stacks))
+            if len(self.slowest) > self.dumpSlowest:
+                heapq.heappop(self.slowest)
+            self.profiler = None
+            self.stacks = None
+        self.moveNumber += 1
+
+    def report(self):
+        """
+        Returns the timers as a dictionary: calls, cumulative time and self
+        time (in seconds), by name.
+        """
+        return {name: {'calls': timer.calls, 'total': timer.total,
+                       'self': timer.selfTime}
+                for name, timer in self.timers.items()}
+
+    def format(self):
+        """
+        Returns the timers as printable lines of text, by decreasing self
+        time.
+        """
+        lines = ['%-36s %10s %12s %12s' % ('Hot path', 'calls', 'total (s)',
+                                            'self (s)')]
+        for timer in sorted(self.timers.values(),
+                            key=lambda timer: -timer.selfTime):
+            lines.append('%-36s %10d %12.4f %12.4f' % (
+                timer.name, timer.calls, timer.total, timer.selfTime))
+        return '\n'.join(lines)
+
+    def dump(self, directory):
+        """
+        Writes the kept slowest moves in `directory`: the statistics of
+        cProfile (`move<number>-agent<index>.prof`, see pstats) and the
+        collapsed stacks of the timers with their self time in microseconds
+        (`move<number>-agent<index>.folded`). Returns the paths written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for elapsed, number, agentIndex, profiler, stacks in sorted(
+                self.slowest, reverse=True):
+            base = os.path.join(
+                directory, 'move%03d-agent%d' % (number, agentIndex))
+            profiler.dump_stats(base + '.prof')
+            with open(base + '.folded', 'w') as f:
+                for stack, selfTime in sorted(stacks.items()):
+                    f.write('%s %d\n' % (stack, round(selfTime * 1e6)))
+            paths += [base + '.prof', base + '.folded']
+        return paths
+
+
+def _timed(function, name):
+    """
+    Returns `function` wrapped in the timer `name` of the active profile.
+    """
+    @wraps(function)
+    def timed(*args, **kwargs):
+        profile = getattr(_active, 'profile', None)
+        if profile is None:
+            return function(*args, **kwargs)
+        profile.enter(name)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.exit()
+    return timed
+
+
+def _wrap(owner, attribute, name):
+    """
+    Replaces attribute `attribute` of class `owner` by its timed version,
+    once.
+    """
+    if (owner, attribute) in _originals:
+        return
+    original = owner.__dict__[attribute]
+    _originals[(owner, attribute)] = original
+    if isinstance(original, staticmethod):
+        setattr(owner, attribute,
+                staticmethod(_timed(original.__func__, name)))
+    else:
+        setattr(owner, attribute, _timed(original, name))
+
+
+def enable(dumpSlowest=0):
+    """
+    Enables profiling: wraps the hot paths in timers, and makes the games
+    created from now on keep a Profile, with the `dumpSlowest` slowest moves
+    profiled by cProfile.
+    """
+    global _dumpSlowest
+    _dumpSlowest = dumpSlowest
+    for module, className, attribute in HOT_PATHS:
+        owner = getattr(importlib.import_module('.' + module, __package__),
+                        className)
+        _wrap(owner, attribute, '%s.%s' % (className, attribute))
+
+
+def enableFromEnvironment():
+    """
+    Enables profiling if the PACMAN_PROFILE environment variable is set (to
+    anything but 0), keeping the PACMAN_PROFILE_DUMP slowest moves. Returns
+    whether profiling is enabled.
+    """
+    if os.environ.get(PROFILE_VARIABLE, '0') not in ('', '0'):
+        enable(int(os.environ.get(DUMP_VARIABLE) or 0))
+    return isEnabled()
+
+
+def disable():
+    """
+    Disables profiling: restores the original hot paths.
+    """
+    global _dumpSlowest
+    _dumpSlowest = None
+    for (owner, attribute), original in _originals.items():
+        setattr(owner, attribute, original)
+    _originals.clear()
+
+
+def isEnabled():
+    return _dumpSlowest is not None
+
+
+def instrumentAgent(agent):
+    """
+    Wraps the evaluation functions of the class of `agent` (the methods of
+    AGENT_HOT_PATHS it defines) in timers, if profiling is enabled.
+    """
+    if not isEnabled():
+        return
+    agentClass = type(agent)
+    for attribute in AGENT_HOT_PATHS:
+        for owner in agentClass.__mro__:
+            if attribute in owner.__dict__:
+                _wrap(owner, attribute, '%s.%s' % (
+                    owner.__module__, attribute))
+                break
+
+
+def newProfile():
+    """
+    Returns a new Profile for a game if profiling is enabled, None
+    otherwise.
+    """
+    if _dumpSlowest is None:
+        return None
+    return Profile(_dumpSlowest)
+
+
+def activate(profile):
+    """
+    Makes `profile` (None for none) the one the timers of the current thread
+    record in.
+    """
+    _active.profile = profile
@@ -0,0 +1,324 @@
+# rollout.py
+# ----------
+# A position-level copy of PacmanRules and GhostRules, to play the end of
+# games fast in Monte Carlo searches.
+#
+# Stepping a CompactGameState builds a new object per move and goes through
+# the generic checks of the rules.  A rollout only needs to know who wins
+# and with which score, so RolloutSimulator plays it on bare integers: the
+# indices of the cells of the agents (in `layout.freeCells`), the indices of
+# the directions of the ghosts (in ghostPolicy.DIRECTIONS) and the food
+# bitboard, with the moves of every cell precomputed.  The rules are the
+# ones of the game for ghosts standing on cells (Pacman eats, wins when the
+# food is gone and dies on the cell of a ghost).  Capsules and scared
+# ghosts, which move at half speed, are not simulated: rollouts from such
+# states step CompactGameStates instead.
+#
+# What the agents play in the rollouts is chosen by a rollout policy, see
+# RandomPolicy and GhostModelPolicy.
+
+from .game import Directions
+from . import ghostPolicy
+from . import pacman
+
+# Simulators, by layout text
+SIMULATOR_CACHE = {}
+
+
+class RolloutSimulator:
+    """
+    Plays rollouts on a layout, see the module documentation.
+
+    `pacmanMoves[c]` lists the (action, destination) pairs of the moves of
+    Pacman (but STOP) from cell `c`, `ghostMoves[c][d]` the (action,
+    destination, direction) triples of the moves of a ghost on cell `c`
+    travelling in direction `d`, `around[c]` the set of cell `c` and of the
+    cells next to it, `safeMoves[c][g]` the moves of Pacman from cell `c`
+    out of `around[g]` (all of them if there are none), and `cellBits[c]`
+    is the food bitboard mask of cell `c`.
+    """
+
+    # Maximum number of memorized food distances
+    MEMO_CAPACITY = 2 ** 16
+
+    def __init__(self, layout):
+        self.layout = layout
+        cellIndex = {cell: index
+                     for index, cell in enumerate(layout.freeCells)}
+        self.cellIndex = cellIndex
+        self.cellBits = [1 << (x * layout.height + y)
+                         for x, y in layout.freeCells]
+        self.pacmanMoves = [
+            [(action, cellIndex[layout.moves[cell][action]])
+             for action in layout.pacmanActions[cell]
+             if action != Directions.STOP]
+            for cell in layout.freeCells]
+        self.ghostMoves = [
+            [[(action, cellIndex[layout.moves[cell][action]],
+               ghostPolicy.DIRECTION_INDEX[action])
+              for action in layout.ghostActions[(cell, direction)]]
+             for direction in ghostPolicy.DIRECTIONS]
+            for cell in layout.freeCells]
+        self.around = [frozenset([index] + [cell for _, cell in moves])
+                       for index, moves in enumerate(self.pacmanMoves)]
+        self.safeMoves = [
+            [[move for move in moves if move[1] not in around] or moves
+             for around in self.around]
+            for moves in self.pacmanMoves]
+        self.foodCells = [(self.cellBits[cellIndex[cell]], cellIndex[cell])
+                          for cell in layout.food.asList()]
+        if layout.distances is None:
+            layout.initializeMazeDistances()
+        self.distanceRows = layout.distances.tolist()
+        # Distances to the nearest food dot, by (cell, food bitboard)
+        self.foodDistances = {}
+
+    def canSimulate(self, state):
+        """
+        Returns whether the rollouts from a CompactGameState can be played
+        on cell indices: no capsule, no scared ghost, every agent on a cell.
+        """
+        if state.capsules or state.pacmanPosition not in self.cellIndex:
+            return False
+        for position, _, scaredTimer in state.ghosts:
+            if scaredTimer > 0 or position not in self.cellIndex:
+                return False
+        return True
+
+    def rollout(self, state, player, policy, rng, maxMoves, foodCoef=0,
+                distCoef=-1):
+        """
+        Plays a game from a CompactGameState, `player` to move, until it
+        ends or Pacman played `maxMoves` moves. A rollout that does not end
+        in a win is scored with the food Pacman left, see `estimate`.
+
+        Arguments:
+        ----------
+        - `state`: the CompactGameState, which `canSimulate`
+        - `player`: the index of the agent to move
+        - `policy`: the rollout policy choosing the moves of the agents
+        - `rng`: the random.Random instance of the rollout
+        - `maxMoves`: the maximum number of moves of Pacman
+        - `foodCoef`, `distCoef`: the coefficients of the food left and of
+            the distance to the nearest food dot, see `estimate`
+
+        Return:
+        -------
+        - The estimate of the end of the rollout
+        """
+        cellBits = self.cellBits
+        pacmanMoves = self.pacmanMoves
+        ghostMoves = self.ghostMoves
+        cellIndex = self.cellIndex
+        timePenalty = pacman.TIME_PENALTY
+
+        pacmanCell = cellIndex[state.pacmanPosition]
+        ghostCells = [cellIndex[position] for position, _, _ in state.ghosts]
+        ghostDirections = [ghostPolicy.DIRECTION_INDEX[direction]
+                           for _, direction, _ in state.ghosts]
+        food = state.food
+        score = state.score
+        numAgents = len(ghostCells) + 1
+        moves = 0
+
+        while True:
+            if player == 0:
+                if moves >= maxMoves:
+                    return self.estimate(pacmanCell, food, score, foodCoef,
+                                         distCoef)
+                moves += 1
+                _, pacmanCell = policy.pacmanMove(
+                    self, pacmanCell, ghostCells, food, rng)
+                score -= timePenalty
+                if food & cellBits[pacmanCell]:
+                    food ^= cellBits[pacmanCell]
+                    score += 10
+                    if not food:
+                        return score + 500
+                if pacmanCell in ghostCells:
+                    return self.estimate(pacmanCell, food, score - 500,
+                                         foodCoef, distCoef)
+            else:
+                choices = ghostMoves[ghostCells[player - 1]][
+                    ghostDirections[player - 1]]
+                if choices:
+                    _, cell, direction = policy.ghostMove(
+                        self, player, choices, ghostCells[player - 1],
+                        ghostDirections[player - 1], pacmanCell, rng)
+                    ghostCells[player - 1] = cell
+                    ghostDirections[player - 1] = direction
+                    if cell == pacmanCell:
+                        return self.estimate(pacmanCell, food, score - 500,
+                                             foodCoef, distCoef)
+            player = (player + 1) % numAgents
+
+    def estimate(self, cell, food, score, foodCoef=0, distCoef=-1):
+        """
+        Returns the estimate of a position of Pacman on a cell, with a food
+        bitboard and a score:
+
+            score + foodCoef * food left + distCoef * food distance
+
+        where the food distance is the maze distance from the cell to the
+        nearest food dot, see `foodDistance`. Both terms are 0 once the food
+        is eaten, so a won game is worth its score.
+        """
+        if not food:
+            return score
+        return score + foodCoef * bin(food).count('1') + \
+            distCoef * self.foodDistance(cell, food)
+
+    def foodDistance(self, cell, food):
+        """
+        Returns the maze distance from a cell to the nearest food dot of a
+        food bitboard (0 if there is none).
+        """
+        key = (cell, food)
+        distance = self.foodDistances.get(key)
+        if distance is None:
+            distances = self.distanceRows[cell]
+            distance = min((distances[foodCell]
+                            for bit, foodCell in self.foodCells
+                            if food & bit), default=0)
+            if len(self.foodDistances) >= self.MEMO_CAPACITY:
+                self.foodDistances.clear()
+            self.foodDistances[key] = distance
+        return distance
+
+
+def getSimulator(layout):
+    """
+    Returns the rollout simulator of a layout, built on first use.
+    """
+    key = layout.layoutText
+    simulator = SIMULATOR_CACHE.get(key)
+    if simulator is None:
+        simulator = RolloutSimulator(layout)
+        SIMULATOR_CACHE[key] = simulator
+    return simulator
+
+
+class RandomPolicy:
+    """
+    Rollout policy where Pacman and the ghosts play uniformly random moves.
+    """
+
+    def pacmanMove(self, simulator, pacmanCell, ghostCells, food, rng):
+        moves = simulator.pacmanMoves[pacmanCell]
+        return moves[int(rng.random() * len(moves))]
+
+    def ghostMove(self, simulator, index, choices, ghostCell,
+                  ghostDirection, pacmanCell, rng):
+        return choices[int(rng.random() * len(choices))]
+
+    def stateMove(self, state, player, rng):
+        """
+        Returns the move of `player` in a CompactGameState, for the
+        rollouts that cannot be simulated on cells.
+        """
+        actions = [action for action in state.getLegalActions(player)
+                   if action != Directions.STOP]
+        return actions[int(rng.random() * len(actions))] if actions \
+            else Directions.STOP
+
+
+class GhostModelPolicy(RandomPolicy):
+    """
+    Rollout policy where Pacman keeps away from the cells next to the
+    ghosts, eats the food next to him and otherwise heads for the nearest
+    food dot (with probability FOOD_GREED) or plays a random move, and the
+    ghosts play like a ghost agent, sampled from its policy table (see
+    ghostPolicy).
+    """
+
+    # Probability that Pacman heads for the nearest food dot
+    FOOD_GREED = 0.75
+
+    def __init__(self, ghostClass):
+        self.ghostClass = ghostClass
+        self.models = {}
+
+        # Moves of the ghosts on the layout, per ghost index: lists of
+        # (cumulative probability, move) pairs, without the moves of
+        # probability 0, by [ghost cell][ghost direction][Pacman cell]
+        self.layout = None
+        self.tables = {}
+
+    def _getTable(self, simulator, index):
+        if simulator.layout is not self.layout:
+            self.layout = simulator.layout
+            self.tables = {}
+        table = self.tables.get(index)
+        if table is None:
+            model = self.models.get(index)
+            if model is None:
+                model = self.ghostClass(index)
+                self.models[index] = model
+            policy = model.getPolicyTable(simulator.layout)
+            table = False if policy is None else \
+                self._buildTable(simulator, policy)
+            self.tables[index] = table
+        return table
+
+    def _buildTable(self, simulator, policy):
+        ids = policy.ids[:, :, :, 0].tolist()
+        table = []
+        for cell, cellIds in enumerate(ids):
+            cellTable = []
+            for direction, directionIds in enumerate(cellIds):
+                choices = {move[0]: move for move in
+                           simulator.ghostMoves[cell][direction]}
+                entries = {}
+                for distribution in set(directionIds):
+                    probabilities, actions = policy.samplers[distribution]
+                    cumulative, total = [], 0
+                    for probability, action in zip(probabilities, actions):
+                        if probability > 0 and action in choices:
+                            total += probability
+                            cumulative.append((total, choices[action]))
+                    entries[distribution] = cumulative
+                cellTable.append([entries[distribution]
+                                  for distribution in directionIds])
+            table.append(cellTable)
+        return table
+
+    def pacmanMove(self, simulator, pacmanCell, ghostCells, food, rng):
+        if len(ghostCells) == 1:
+            moves = simulator.safeMoves[pacmanCell][ghostCells[0]]
+        else:
+            moves = simulator.pacmanMoves[pacmanCell]
+            around = simulator.around
+            safe = [move for move in moves if not any(
+                move[1] in around[cell] for cell in ghostCells)]
+            if safe:
+                moves = safe
+        cellBits = simulator.cellBits
+        eating = [move for move in moves if food & cellBits[move[1]]]
+        if eating:
+            moves = eating
+        if len(moves) == 1:
+            return moves[0]
+        if rng.random() < self.FOOD_GREED:
+            return min(moves, key=lambda move: simulator.foodDistance(
+                move[1], food))
+        return moves[int(rng.random() * len(moves))]
+
+    def ghostMove(self, simulator, index, choices, ghostCell,
+                  ghostDirection, pacmanCell, rng):
+        if simulator.layout is self.layout and index in self.tables:
+            table = self.tables[index]
+        else:
+            table = self._getTable(simulator, index)
+        entries = table[ghostCell][ghostDirection][pacmanCell] if table \
+            else None
+        if not entries:
+            return RandomPolicy.ghostMove(
+                self, simulator, index, choices, ghostCell, ghostDirection,
+                pacmanCell, rng)
+        if len(entries) == 1:
+            return entries[0][1]
+        choice = rng.random() * entries[-1][0]
+        for total, move in entries:
+            if choice < total:
+                return move
+        return entries[-1][1]
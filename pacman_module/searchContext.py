@@ -0,0 +1,82 @@
+# searchContext.py
+# ----------------
+# Limits of the search of a move: node expansion budget and deadline.
+#
+# Game.run gives every move a fresh SearchContext.  Each call to
+# generatePacmanSuccessors / generateGhostSuccessors counts one expansion in
+# it, and raises BudgetExhausted once the budget is spent.  Agents catch the
+# exception (or poll the context) to stop searching and return the best
+# action found so far.
+
+from math import inf as INF
+import time
+
+
+class BudgetExhausted(Exception):
+    """
+    Raised when the node expansion budget or the deadline of a move is
+    reached.
+    """
+    pass
+
+
+class SearchContext:
+    """
+    The expansion counter and the limits of the search of one move.
+
+    - `expanded`: the number of expansions so far;
+    - `maxExpanded`: the expansion budget (inf if unlimited);
+    - `deadline`: the time.perf_counter() value at which the search must
+      stop, or None.
+
+    The clock is only read every CHECK_INTERVAL expansions, so that counting
+    an expansion stays cheap.
+    """
+
+    CHECK_INTERVAL = 64
+
+    def __init__(self, maxExpanded=INF, moveTime=None):
+        self.expanded = 0
+        self.maxExpanded = maxExpanded
+        self.deadline = None
+        if moveTime is not None:
+            self.deadline = time.perf_counter() + moveTime
+        self.toCheck = self.CHECK_INTERVAL
+
+    def expand(self):
+        """
+        Counts an expansion. Raises BudgetExhausted instead if the budget is
+        spent or the deadline is passed.
+        """
+        if self.expanded >= self.maxExpanded:
+            raise BudgetExhausted()
+        self.toCheck -= 1
+        if self.toCheck <= 0:
+            self.toCheck = self.CHECK_INTERVAL
+            self.poll()
+        self.expanded += 1
+
+    def poll(self):
+        """
+        Raises BudgetExhausted if the budget is spent or the deadline is
+        passed.
+        """
+        if self.isExhausted():
+            raise BudgetExhausted()
+
+    def isExhausted(self):
+        return self.expanded >= self.maxExpanded or (
+            self.deadline is not None and
+            time.perf_counter() >= self.deadline)
+
+    def nodesLeft(self):
+        return max(self.maxExpanded - self.expanded, 0)
+
+    def timeLeft(self):
+        """
+        Returns the time left before the deadline, in seconds (None if there
+        is no deadline).
+        """
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.perf_counter(), 0.0)
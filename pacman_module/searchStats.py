@@ -0,0 +1,233 @@
+# searchStats.py
+# --------------
+# Per-move statistics of the searches of the agents.
+#
+# Game.run gives every move a fresh MoveStats, in the instrumentation of the
+# game (see instrumentation.py), and keeps them once the move is played.
+# The search agents publish what their search did in the MoveStats of the
+# current move (instrumentation.currentMoveStats()): the nodes they expand,
+# by depth, the cutoffs of their alphabeta pruning, their evaluations of
+# leaves and the depth they reach.  The expansions, the time and the probes
+# of the transposition tables are filled in by the instrumentation itself.
+#
+# `summarize` aggregates the statistics of the moves of a game into a
+# report, and `writeJSONL` exports them, one JSON line per move.
+
+import json
+
+# Number of bisection steps of the effective branching factor
+BISECTION_STEPS = 40
+
+
+class MoveStats:
+    """
+    The statistics of the search of one move:
+
+    - `agentIndex`: the index of the agent that moved;
+    - `expanded`: its node expansions, and `time` its computation time, in
+      seconds;
+    - `nodesPerDepth[d]`: the number of nodes of depth `d` it expanded;
+    - `cutoffs`: the number of alphabeta cutoffs, `firstMoveCutoffs` the
+      number of them on the first successor searched;
+    - `cacheHits`, `cacheMisses`: the probes of its transposition tables;
+    - `evaluations`: the number of leaves it evaluated;
+    - `maxDepth`: the depth of its deepest node (expanded or leaf).
+    """
+    __slots__ = ('agentIndex', 'expanded', 'time', 'nodesPerDepth',
+                 'cutoffs', 'firstMoveCutoffs', 'cacheHits', 'cacheMisses',
+                 'evaluations', 'maxDepth')
+
+    def __init__(self, agentIndex=0):
+        self.agentIndex = agentIndex
+        self.expanded = 0
+        self.time = None
+        self.nodesPerDepth = []
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.evaluations = 0
+        self.maxDepth = 0
+
+    def visit(self, depth):
+        """
+        Counts the expansion of a node of depth `depth` (0 for the root).
+        """
+        nodes = self.nodesPerDepth
+        while len(nodes) <= depth:
+            nodes.append(0)
+        nodes[depth] += 1
+        if depth > self.maxDepth:
+            self.maxDepth = depth
+
+    def cutoff(self, index):
+        """
+        Counts an alphabeta cutoff, after the successor of index `index` in
+        the search order.
+        """
+        self.cutoffs += 1
+        if index == 0:
+            self.firstMoveCutoffs += 1
+
+    def evaluate(self, count=1, depth=0):
+        """
+        Counts the evaluation of `count` leaves of depth `depth`.
+        """
+        self.evaluations += count
+        if depth > self.maxDepth:
+            self.maxDepth = depth
+
+    def merge(self, other):
+        """
+        Adds the nodes, cutoffs and evaluations of `other`, the statistics
+        of a part of the same search (e.g. searched in another process).
+        """
+        for depth, count in enumerate(other.nodesPerDepth):
+            if depth == len(self.nodesPerDepth):
+                self.nodesPerDepth.append(0)
+            self.nodesPerDepth[depth] += count
+        self.cutoffs += other.cutoffs
+        self.firstMoveCutoffs += other.firstMoveCutoffs
+        self.evaluations += other.evaluations
+        self.maxDepth = max(self.maxDepth, other.maxDepth)
+
+    def branchingFactor(self):
+        """
+        Returns the effective branching factor of the search: the branching
+        factor `b` of the uniform tree of depth `maxDepth` with as many
+        nodes as the search expanded, `1 + b + ... + b ** maxDepth`, found
+        by bisection (None if the search expanded no node or only reached
+        its root).
+        """
+        nodes = sum(self.nodesPerDepth)
+        if nodes == 0 or self.maxDepth == 0:
+            return None
+
+        def treeSize(b):
+            size, level = 0, 1
+            for depth in range(self.maxDepth + 1):
+                size += level
+                if size > nodes:
+                    break
+                level *= b
+            return size
+
+        low, high = 0.0, float(nodes)
+        for i in range(BISECTION_STEPS):
+            middle = (low + high) / 2
+            if treeSize(middle) > nodes:
+                high = middle
+            else:
+                low = middle
+        return low
+
+    def firstMoveCutoffRate(self):
+        """
+        Returns the fraction of the cutoffs on the first successor searched
+        (None without cutoffs): how well the successors are ordered.
+        """
+        if self.cutoffs == 0:
+            return None
+        return self.firstMoveCutoffs / self.cutoffs
+
+    def asDict(self):
+        """
+        Returns the statistics, with the derived ones, as a dictionary.
+        """
+        return {
+            'agent': self.agentIndex,
+            'expanded': self.expanded,
+            'time': self.time,
+            'nodes_per_depth': list(self.nodesPerDepth),
+            'branching_factor': self.branchingFactor(),
+            'cutoffs': self.cutoffs,
+            'first_move_cutoffs': self.firstMoveCutoffs,
+            'first_move_cutoff_rate': self.firstMoveCutoffRate(),
+            'cache_hits': self.cacheHits,
+            'cache_misses': self.cacheMisses,
+            'evaluations': self.evaluations,
+            'max_depth': self.maxDepth,
+        }
+
+
+def summarize(moves):
+    """
+    Returns the report of the statistics of a list of moves, as a
+    dictionary: totals over the moves, and mean and maximum depth and
+    branching factor.
+    """
+    nodesPerDepth = []
+    for stats in moves:
+        for depth, count in enumerate(stats.nodesPerDepth):
+            if depth == len(nodesPerDepth):
+                nodesPerDepth.append(0)
+            nodesPerDepth[depth] += count
+    cutoffs = sum(stats.cutoffs for stats in moves)
+    firstMoveCutoffs = sum(stats.firstMoveCutoffs for stats in moves)
+    cacheHits = sum(stats.cacheHits for stats in moves)
+    cacheMisses = sum(stats.cacheMisses for stats in moves)
+    factors = [factor for factor in
+               (stats.branchingFactor() for stats in moves)
+               if factor is not None]
+
+    return {
+        'moves': len(moves),
+        'expanded': sum(stats.expanded for stats in moves),
+        'time': sum(stats.time or 0 for stats in moves),
+        'nodes_per_depth': nodesPerDepth,
+        'branching_factor': sum(factors) / len(factors) if factors
+        else None,
+        'cutoffs': cutoffs,
+        'first_move_cutoff_rate': firstMoveCutoffs / cutoffs if cutoffs
+        else None,
+        'cache_hits': cacheHits,
+        'cache_misses': cacheMisses,
+        'cache_hit_rate': cacheHits / (cacheHits + cacheMisses)
+        if cacheHits + cacheMisses else None,
+        'evaluations': sum(stats.evaluations for stats in moves),
+        'max_depth': max((stats.maxDepth for stats in moves), default=0),
+        'mean_max_depth': sum(stats.maxDepth for stats in moves) /
+        len(moves) if moves else 0,
+    }
+
+
+def formatReport(report):
+    """
+    Returns a report (see `summarize`) as printable lines of text.
+    """
+    def number(value, digits=2):
+        if value is None:
+            return '-'
+        if isinstance(value, float):
+            return '%.*f' % (digits, value)
+        return str(value)
+
+    return '\n'.join([
+        'Search statistics of %d moves:' % report['moves'],
+        '  expanded nodes      : %s' % number(report['expanded']),
+        '  nodes per depth     : %s' % ' '.join(
+            number(count) for count in report['nodes_per_depth']),
+        '  branching factor    : %s' % number(report['branching_factor']),
+        '  cutoffs             : %s (%s on the first move)' % (
+            number(report['cutoffs']),
+            number(report['first_move_cutoff_rate'])),
+        '  cache hits / misses : %s / %s (%s)' % (
+            number(report['cache_hits']), number(report['cache_misses']),
+            number(report['cache_hit_rate'])),
+        '  evaluations         : %s' % number(report['evaluations']),
+        '  max depth           : %s (mean %s)' % (
+            number(report['max_depth']), number(report['mean_max_depth'])),
+    ])
+
+
+def writeJSONL(moves, f, **fields):
+    """
+    Writes the statistics of a list of moves in file `f`, one JSON line per
+    move, numbered from 0. The keyword arguments are added to every line
+    (e.g. the agent file and the layout of the game).
+    """
+    for number, stats in enumerate(moves):
+        line = dict(fields)
+        line['move'] = number
+        line.update(stats.asDict())
+        f.write(json.dumps(line) + '\n')
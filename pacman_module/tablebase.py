@@ -0,0 +1,360 @@
+# tablebase.py
+# ------------
+# Endgame tablebases: exact minimax values of every state of a small layout.
+#
+# On a layout with one ghost and no capsule, a game state (for the search
+# agents) is fully described by the food left, the cells of Pacman and of
+# the ghost, the direction of the ghost and the player to move: the score
+# only adds up.  For small layouts, all these states can be enumerated and
+# solved exactly by retrograde analysis.  The value of a state is the score
+# Pacman gains from it until the end of the game, Pacman maximizing it and
+# the ghost minimizing it.  Games the ghost can make last forever are worth
+# -inf to Pacman (the time penalty never stops).  The values are computed
+# by value iteration from -inf, over NumPy arrays of the transitions, until
+# they stop changing.  Pacman never stops, as in the search agents.
+#
+# The values are saved as an int32 array of shape
+#
+#     (2, 2 ** food dots, free cells, free cells, directions)
+#
+# indexed by player to move, subset of the food dots of the layout, Pacman
+# cell, ghost cell and ghost direction, in a .npy file read as a memory map.
+# Agents given the `tablebase` argument probe it with `probeMove(state)`,
+# which returns the best move of a state won by Pacman without expanding
+# any node, or None if there is no tablebase for the layout.  Probes only
+# read the tablebases generated ahead of time, for layouts of up to
+# MAX_STATES states:
+#
+#     python -m pacman_module.tablebase small_adv small_adv2
+
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from .game import Actions, Directions
+from . import layout as layoutModule
+from . import pacman
+
+# Directions, in the order of the last axis of the tables
+DIRECTIONS = [direction for direction, _ in Actions._directionsAsList]
+DIRECTION_INDEX = {direction: index
+                   for index, direction in enumerate(DIRECTIONS)}
+
+# Value of the states the ghost can make last forever, and of the states
+# that cannot be reached (Pacman and the ghost on the same cell)
+NO_VALUE = np.iinfo(np.int32).min
+
+# Largest number of states solved by default
+MAX_STATES = 2 ** 22
+
+# Tablebases are saved in this folder, keyed by layout text
+TABLEBASE_DIR = layoutModule.MAZE_DISTANCE_CACHE_DIR
+
+# Loaded tablebases (None if there is none), by layout text
+TABLEBASE_CACHE = {}
+TABLEBASE_LOCK = threading.Lock()
+
+
+def tablebasePath(layout):
+    """
+    Returns the path of the tablebase file of a layout.
+    """
+    key = "\n".join(layout.layoutText)
+    return os.path.join(TABLEBASE_DIR, 'tablebase-%s.npy' %
+                        hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def tableShape(layout):
+    """
+    Returns the shape of the tablebase of a layout (see the module
+    documentation), or raises an Exception if it cannot have one.
+    """
+    if layout.getNumGhosts() != 1 or layout.capsules:
+        raise Exception('Tablebases need a layout with one ghost and no '
+                        'capsule')
+    numCells = len(layout.freeCells)
+    return (2, 2 ** layout.food.count(), numCells, numCells, len(DIRECTIONS))
+
+
+class Tablebase:
+    """
+    The values of the states of a layout, see the module documentation.
+    """
+
+    def __init__(self, layout, values):
+        self.layout = layout
+        self.values = values
+        self.cellOf = {cell: index
+                       for index, cell in enumerate(layout.freeCells)}
+        # Bit of each food dot of the layout in the food bitboards
+        self.foodBits = [x * layout.height + y
+                         for x, y in sorted(layout.food.asList())]
+
+    def probe(self, state, player):
+        """
+        Returns the value of a CompactGameState of the layout, with `player`
+        to move: the score Pacman gains from it until the end of the game
+        if both players play perfectly. Returns None if the state is not in
+        the tablebase (e.g. a scared ghost), or if the ghost can make the
+        game last forever.
+        """
+        if state.layout is not self.layout and \
+                state.layout.layoutText != self.layout.layoutText:
+            return None
+        if len(state.ghosts) != 1 or state.capsules:
+            return None
+        ghostPosition, ghostDirection, scaredTimer = state.ghosts[0]
+        pacman = self.cellOf.get(state.pacmanPosition)
+        ghost = self.cellOf.get(ghostPosition)
+        if pacman is None or ghost is None or scaredTimer > 0:
+            return None
+
+        food = 0
+        for index, bit in enumerate(self.foodBits):
+            if (state.food >> bit) & 1:
+                food |= 1 << index
+        value = int(self.values[player, food, pacman, ghost,
+                                DIRECTION_INDEX[ghostDirection]])
+        return None if value == NO_VALUE else value
+
+    def bestMove(self, state):
+        """
+        Returns the move of Pacman of best value in a CompactGameState and
+        its value, (None, None) if the state is not in the tablebase or if
+        the ghost can make the game last forever. The successors are
+        generated one by one, so no node is expanded.
+        """
+        best, move = None, None
+        for action in state.getLegalActions(0):
+            if action == Directions.STOP:
+                continue
+            successor = state.generateSuccessor(0, action)
+            value = successor.score - state.score
+            if not (successor.isWin() or successor.isLose()):
+                successorValue = self.probe(successor, 1)
+                if successorValue is None:
+                    continue
+                value += successorValue
+            if best is None or value > best:
+                best, move = value, action
+        return move, best
+
+
+def getTablebase(layout, lazyMaxStates=0):
+    """
+    Returns the tablebase of a layout, memory-mapped from its file. If it
+    has not been generated, solves the layout and saves its tablebase if it
+    has at most `lazyMaxStates` states (none by default), returns None
+    otherwise.
+    """
+    key = layout.layoutText
+    if key not in TABLEBASE_CACHE:
+        with TABLEBASE_LOCK:
+            if key not in TABLEBASE_CACHE:
+                try:
+                    shape = tableShape(layout)
+                except Exception:
+                    shape = None
+                tablebase = None
+                path = tablebasePath(layout)
+                if os.path.exists(path):
+                    values = np.load(path, mmap_mode='r')
+                    if values.shape == shape:
+                        tablebase = Tablebase(layout, values)
+                elif shape is not None and \
+                        np.prod(shape) <= lazyMaxStates:
+                    values, _ = solve(layout, lazyMaxStates)
+                    try:
+                        _writeValues(path, values)
+                    except OSError:
+                        pass
+                    tablebase = Tablebase(layout, values)
+                TABLEBASE_CACHE[key] = tablebase
+    return TABLEBASE_CACHE[key]
+
+
+def probeMove(state):
+    """
+    Returns the best move of Pacman in a game state according to the
+    tablebase of its layout, None if there is no tablebase, if the state is
+    not in it or if Pacman cannot win against a perfect ghost (a positive
+    value: losing costs 500 points, more than the food of a small layout).
+    Lost states are left to the search, as the ghost actually played may
+    not be perfect. Search agents given the `tablebase` argument call it
+    before searching.
+    """
+    state = state.toCompact()
+    tablebase = getTablebase(state.layout)
+    if tablebase is None:
+        return None
+    move, value = tablebase.bestMove(state)
+    if value is None or value <= 0:
+        return None
+    return move
+
+
+def solve(layout, maxStates=MAX_STATES):
+    """
+    Computes the values of all the states of a layout by retrograde
+    analysis.
+
+    Return:
+    -------
+    - The int32 array of the values (see the module documentation) and the
+      number of iterations
+    """
+    shape = tableShape(layout)
+    if np.prod(shape) > maxStates:
+        raise Exception('The layout has %d states, more than %d' %
+                        (np.prod(shape), maxStates))
+    _, numSubsets, numCells, _, numDirections = shape
+
+    # Moves of the free cells, by slot: destination cell (-1 if illegal)
+    # for Pacman, and destination cell and direction for the ghost
+    freeCells = layout.freeCells
+    cellIndex = layout.cellIndex
+    pacmanMoves = np.full((numCells, 4), -1)
+    ghostMoves = np.full((numCells, numDirections, 4), -1)
+    ghostDirections = np.zeros((numCells, numDirections, 4), dtype=int)
+    for c, cell in enumerate(freeCells):
+        actions = [a for a in layout.pacmanActions[cell]
+                   if a != Directions.STOP]
+        for k, action in enumerate(actions):
+            pacmanMoves[c, k] = cellIndex[layout.moves[cell][action]]
+        for d, direction in enumerate(DIRECTIONS):
+            for k, action in enumerate(layout.ghostActions[(cell, direction)]):
+                ghostMoves[c, d, k] = cellIndex[layout.moves[cell][action]]
+                ghostDirections[c, d, k] = DIRECTION_INDEX[action]
+
+    # Index of the food dot of each free cell, -1 if there is none
+    foodCells = sorted(layout.food.asList())
+    foodOf = np.full(numCells, -1)
+    for index, cell in enumerate(foodCells):
+        foodOf[cellIndex[cell]] = index
+
+    # Coordinates of the states of one player, broadcast against each other
+    food, pac, ghost, direction = np.ix_(
+        np.arange(numSubsets), np.arange(numCells), np.arange(numCells),
+        np.arange(numDirections))
+    size = numSubsets * numCells * numCells * numDirections
+
+    def flatIndex(food, pac, ghost, direction):
+        return np.ravel_multi_index(
+            np.broadcast_arrays(food, pac, ghost, direction),
+            shape[1:]).reshape(-1)
+
+    # Transitions of the Pacman moves: successor in the ghost table and
+    # score change, and whether the successor ends the game
+    pacmanNext, pacmanReward, pacmanEnd, pacmanLegal = [], [], [], []
+    for k in range(4):
+        destination = pacmanMoves[pac, k]
+        legal = destination >= 0
+        destination = np.where(destination >= 0, destination, pac)
+        bit = foodOf[destination]
+        eats = (bit >= 0) & ((food >> np.maximum(bit, 0)) & 1 == 1)
+        newFood = np.where(eats, food & ~(1 << np.maximum(bit, 0)), food)
+        win = eats & (newFood == 0)
+        lose = ~win & (destination == ghost)
+        reward = -pacman.TIME_PENALTY + 10 * eats + 500 * win - 500 * lose
+        pacmanNext.append(flatIndex(newFood, destination, ghost, direction))
+        pacmanReward.append(np.broadcast_to(reward, shape[1:]).reshape(-1))
+        pacmanEnd.append(np.broadcast_to(win | lose, shape[1:]).reshape(-1))
+        pacmanLegal.append(np.broadcast_to(legal, shape[1:]).reshape(-1))
+
+    # Transitions of the ghost moves, successor in the Pacman table
+    ghostNext, ghostReward, ghostEnd, ghostLegal = [], [], [], []
+    for k in range(4):
+        destination = ghostMoves[ghost, direction, k]
+        legal = destination >= 0
+        destination = np.where(legal, destination, ghost)
+        lose = destination == pac
+        ghostNext.append(flatIndex(
+            food, pac, destination, ghostDirections[ghost, direction, k]))
+        ghostReward.append(np.broadcast_to(-500 * lose,
+                                           shape[1:]).reshape(-1))
+        ghostEnd.append(np.broadcast_to(lose, shape[1:]).reshape(-1))
+        ghostLegal.append(np.broadcast_to(legal, shape[1:]).reshape(-1))
+
+    pacmanNext, pacmanReward, pacmanEnd, pacmanLegal, ghostNext, \
+        ghostReward, ghostEnd, ghostLegal = map(np.stack, (
+            pacmanNext, pacmanReward, pacmanEnd, pacmanLegal, ghostNext,
+            ghostReward, ghostEnd, ghostLegal))
+
+    # Value iteration from -inf: the values only increase, and stop
+    # changing once every finite value is found
+    pacmanValues = np.full(size, -np.inf)
+    ghostValues = np.full(size, -np.inf)
+    iterations = 0
+    while True:
+        iterations += 1
+        newPacmanValues = np.where(
+            pacmanLegal, pacmanReward + np.where(
+                pacmanEnd, 0, ghostValues[pacmanNext]), -np.inf).max(axis=0)
+        newGhostValues = np.where(
+            ghostLegal, ghostReward + np.where(
+                ghostEnd, 0, newPacmanValues[ghostNext]), np.inf).min(axis=0)
+        newGhostValues[~ghostLegal.any(axis=0)] = -np.inf
+        if np.array_equal(newPacmanValues, pacmanValues) and \
+                np.array_equal(newGhostValues, ghostValues):
+            break
+        pacmanValues, ghostValues = newPacmanValues, newGhostValues
+
+    values = np.stack([pacmanValues, ghostValues]).reshape(shape)
+    values[:, :, np.arange(numCells), np.arange(numCells), :] = -np.inf
+    values = np.where(np.isfinite(values), values, NO_VALUE)
+    return values.astype(np.int32), iterations
+
+
+def saveTablebase(layout, values, path=None):
+    """
+    Saves the values of a layout as a .npy file (its tablebase file by
+    default), written under another name and renamed, so that other
+    processes never read a partial file.
+    """
+    if path is None:
+        path = tablebasePath(layout)
+    _writeValues(path, values)
+    with TABLEBASE_LOCK:
+        TABLEBASE_CACHE.pop(layout.layoutText, None)
+    return path
+
+
+def _writeValues(path, values):
+    """
+    Writes values as a .npy file under another name and renames it.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    table = np.lib.format.open_memmap(tmpPath, mode='w+', dtype=np.int32,
+                                      shape=values.shape)
+    table[...] = values
+    table.flush()
+    del table
+    os.replace(tmpPath, path)
+
+
+if __name__ == '__main__':
+    # python -m pacman_module.tablebase <name>...: solves the layouts and
+    # saves their tablebases
+    import sys
+    for name in sys.argv[1:]:
+        layout = layoutModule.getLayout(name)
+        if layout is None:
+            sys.exit("The layout %s cannot be found" % name)
+        start = time.perf_counter()
+        try:
+            values, iterations = solve(layout)
+        except Exception as e:
+            sys.exit("%s: %s" % (name, e))
+        path = saveTablebase(layout, values)
+
+        state = pacman.GameState()
+        state.initialize(layout, layout.getNumGhosts())
+        value = getTablebase(layout).probe(state.toCompact(), 0)
+        print("Solved %s: %d states, %d iterations, %.2f s, value %s, "
+              "saved in %s" % (name, values.size, iterations,
+                               time.perf_counter() - start,
+                               '-inf' if value is None else value, path))
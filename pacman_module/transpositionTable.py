@@ -0,0 +1,224 @@
+# transpositionTable.py
+# ---------------------
+# Transposition table and Zobrist hashing for the search agents.
+#
+# A Zobrist key is the XOR of one random 64 bit number per feature of a
+# state (pacman cell, each ghost, each food dot, each capsule).  A move only
+# changes a few features, so the key of a successor is obtained from the key
+# of its parent with a few XORs instead of hashing the whole state.
+
+from collections import OrderedDict
+import random
+
+from . import instrumentation
+
+# Kinds of values stored in the table
+EXACT = 0
+LOWER = 1   # The true value is >= the stored value
+UPPER = 2   # The true value is <= the stored value
+
+
+class ZobristHasher:
+    """
+    Computes the Zobrist keys of CompactGameStates.
+
+    The random number of a feature is drawn the first time the feature is
+    met, from a generator seeded with `seed`, so two hashers with the same
+    seed give the same keys to states met in the same order.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.tokens = {}
+
+    def token(self, feature):
+        """
+        Returns the random 64 bit number of a (hashable) feature.  Agents can
+        XOR tokens of their own features (player to move, ...) into keys.
+        """
+        value = self.tokens.get(feature)
+        if value is None:
+            value = self.random.getrandbits(64)
+            self.tokens[feature] = value
+        return value
+
+    def hash(self, state):
+        """
+        Computes the key of a state from scratch.
+        """
+        key = self.token(('pacman', state.getPacmanPosition()))
+        for index, ghost in enumerate(state.ghosts):
+            key ^= self.token(('ghost', index, ghost))
+        for position in state.getFood().asList():
+            key ^= self.token(('food', position))
+        for position in state.getCapsules():
+            key ^= self.token(('capsule', position))
+        return key
+
+    def update(self, key, state, successor):
+        """
+        Computes the key of `successor` from the key of its parent `state`.
+        """
+        if successor is state:
+            return key
+
+        if successor.pacmanPosition != state.pacmanPosition:
+            key ^= self.token(('pacman', state.pacmanPosition)) ^ \
+                self.token(('pacman', successor.pacmanPosition))
+
+        if successor.ghosts is not state.ghosts:
+            for index, (ghost, newGhost) in enumerate(
+                    zip(state.ghosts, successor.ghosts)):
+                if ghost != newGhost:
+                    key ^= self.token(('ghost', index, ghost)) ^ \
+                        self.token(('ghost', index, newGhost))
+
+        if successor.foodEaten is not None:
+            key ^= self.token(('food', successor.foodEaten))
+
+        if successor.capsules is not state.capsules:
+            for position in state.capsules:
+                if position not in successor.capsules:
+                    key ^= self.token(('capsule', position))
+
+        return key
+
+
+class TTEntry:
+    """
+    An entry of the transposition table.
+
+    - `value`: the value of the node, or a bound on it (see `flag`)
+    - `flag`: EXACT, LOWER or UPPER
+    - `depth`: the importance of the entry for the replacement policy, e.g.
+      the remaining search depth below the node
+    - `move`: the best move found at the node, if any
+    - `data`: anything else the agent wants to keep with the entry
+    """
+    __slots__ = ('key', 'value', 'flag', 'depth', 'move', 'data',
+                 'generation')
+
+    def __init__(self, key, value, flag, depth, move, data, generation):
+        self.key = key
+        self.value = value
+        self.flag = flag
+        self.depth = depth
+        self.move = move
+        self.data = data
+        self.generation = generation
+
+
+class TranspositionTable:
+    """
+    A transposition table with a fixed capacity.
+
+    Two replacement policies are available:
+
+    - 'depth': the table is an array of `capacity` slots indexed by the low
+      bits of the key.  A new entry replaces the one in its slot if that one
+      comes from an older search (see `newSearch`) or has a lower or equal
+      depth.
+    - 'lru': the least recently used entry is evicted when the table is
+      full.
+
+    The hits, misses, stores and evictions counters are never reset, the
+    agents read them to report hit rates.  Probes are also counted in the
+    instrumentation of the game.
+    """
+
+    def __init__(self, capacity=2 ** 18, policy='depth'):
+        if policy not in ('depth', 'lru'):
+            raise ValueError("Unknown replacement policy " + str(policy))
+        if policy == 'depth' and capacity & (capacity - 1):
+            raise ValueError("The capacity of a depth-preferred table must "
+                             "be a power of two")
+        self.capacity = capacity
+        self.policy = policy
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.clear()
+
+    def clear(self):
+        if self.policy == 'depth':
+            self.slots = [None] * self.capacity
+        else:
+            self.entries = OrderedDict()
+        self.size = 0
+
+    def newSearch(self):
+        """
+        Marks the beginning of a new search (a new move): entries stored by
+        previous searches are replaced first.
+        """
+        self.generation += 1
+
+    def probe(self, key):
+        """
+        Returns the entry stored for `key`, or None.
+        """
+        if self.policy == 'depth':
+            entry = self.slots[key & (self.capacity - 1)]
+            if entry is not None and entry.key != key:
+                entry = None
+        else:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        instrumentation.current().recordCacheProbe(entry is not None)
+        return entry
+
+    def store(self, key, value, flag, depth=0, move=None, data=None):
+        """
+        Stores a value, or a bound on it, for `key`.
+        """
+        entry = TTEntry(key, value, flag, depth, move, data, self.generation)
+        if self.policy == 'depth':
+            index = key & (self.capacity - 1)
+            old = self.slots[index]
+            if old is None:
+                self.size += 1
+            elif old.key != key and old.generation == self.generation and \
+                    old.depth > depth:
+                return
+            elif old.key != key:
+                self.evictions += 1
+            self.slots[index] = entry
+        else:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            else:
+                if self.size >= self.capacity:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+                else:
+                    self.size += 1
+            self.entries[key] = entry
+        self.stores += 1
+
+    def remove(self, key):
+        """
+        Removes the entry stored for `key`, if any.
+        """
+        if self.policy == 'depth':
+            index = key & (self.capacity - 1)
+            entry = self.slots[index]
+            if entry is not None and entry.key == key:
+                self.slots[index] = None
+                self.size -= 1
+        elif self.entries.pop(key, None) is not None:
+            self.size -= 1
+
+    def hitRate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes > 0 else 0.0
+
+    def __len__(self):
+        return self.size
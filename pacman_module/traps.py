@@ -0,0 +1,231 @@
+# traps.py
+# --------
+# Dead-end pockets of a maze, and safety pruning of the moves into them.
+#
+# An articulation point of the maze is a free cell whose removal disconnects
+# the free cells.  On the smaller side of an articulation point lies a
+# pocket: cells Pacman can only leave through the articulation point, its
+# entry.  Pacman goes into a pocket for its food: if the deepest food dot
+# of the pocket is `depth` moves from the entry (1 if the pocket holds no
+# food), Pacman needs `2 * depth + 1` moves to eat it and come out of the
+# pocket again: his round trip.  A ghost closer to the entry than that can
+# seal Pacman in.  A pocket holding all the food left is no trap: Pacman
+# wins there without coming out.
+#
+# A TrapAnalysis finds the articulation points and the pockets of a layout
+# once (a depth-first search for the articulation points, then one flood
+# fill per side of each of them), and `prunePacmanSuccessors` is the pruning
+# hook of the search agents: it drops the moves of Pacman from the entry of
+# a pocket into the pocket when a ghost can seal it.  The search never
+# explores these hopeless subtrees.
+
+from .compactState import CompactGameState
+from .game import BitGrid, Directions
+
+# Trap analyses, by layout text
+TRAP_ANALYSIS_CACHE = {}
+
+
+class Pocket:
+    """
+    A dead-end pocket: the `cells` Pacman can only leave through cell
+    `entry`, `depth` moves deep from it. `cellDepths` lists the depth of the
+    cells and their bit in the food bitboards, deepest first, and `mask`
+    has the bits of all the cells.
+    """
+    __slots__ = ('entry', 'cells', 'depth', 'cellDepths', 'mask')
+
+    def __init__(self, entry, cells, cellDepths):
+        self.entry = entry
+        self.cells = cells
+        self.cellDepths = sorted(cellDepths, reverse=True)
+        self.depth = self.cellDepths[0][0]
+        self.mask = 0
+        for _, bit in self.cellDepths:
+            self.mask |= bit
+
+    def roundTrip(self, food):
+        """
+        Returns the number of moves Pacman needs to go from the entry to the
+        deepest food dot of the pocket and out, given the food bitboard.
+        """
+        depth = 1
+        if food & self.mask:
+            for cellDepth, bit in self.cellDepths:
+                if food & bit:
+                    depth = max(cellDepth, 1)
+                    break
+        return 2 * depth + 1
+
+
+class TrapAnalysis:
+    """
+    The articulation points and the pockets of a layout, see the module
+    documentation.
+
+    - `articulationPoints`: the set of the articulation points;
+    - `pockets`: the list of the pockets;
+    - `pocketOf[(cell, action)]`: the pocket Pacman enters when playing
+      `action` from `cell` (the entry of the pocket), for the moves into a
+      pocket only.
+    """
+
+    def __init__(self, layout):
+        self.layout = layout
+        if layout.distances is None:
+            layout.initializeMazeDistances()
+        cellIndex = {cell: index
+                     for index, cell in enumerate(layout.freeCells)}
+        self.cellIndex = cellIndex
+        self.neighbors = [
+            [cellIndex[destination]
+             for action, destination in layout.moves[cell].items()
+             if action != Directions.STOP]
+            for cell in layout.freeCells]
+
+        self.articulationPoints = {
+            layout.freeCells[index]
+            for index in self._findArticulationPoints()}
+
+        self.pockets = []
+        self.pocketOf = {}
+        for entry in sorted(self.articulationPoints):
+            for action, cell in layout.moves[entry].items():
+                if action == Directions.STOP:
+                    continue
+                pocket = self._findPocket(entry, cell)
+                if pocket is not None:
+                    self.pockets.append(pocket)
+                    self.pocketOf[(entry, action)] = pocket
+
+    def _findArticulationPoints(self):
+        """
+        Returns the indices of the articulation points of the maze, with an
+        iterative depth-first search (Hopcroft and Tarjan).
+        """
+        neighbors = self.neighbors
+        numCells = len(neighbors)
+        order = [-1] * numCells
+        low = [0] * numCells
+        points = set()
+        counter = 0
+
+        for root in range(numCells):
+            if order[root] != -1:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            rootChildren = 0
+            stack = [(root, -1, iter(neighbors[root]))]
+            while stack:
+                cell, parent, children = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    stack.pop()
+                    if parent != -1:
+                        low[parent] = min(low[parent], low[cell])
+                        if parent != root and low[cell] >= order[parent]:
+                            points.add(parent)
+                    continue
+                if order[child] == -1:
+                    order[child] = low[child] = counter
+                    counter += 1
+                    if cell == root:
+                        rootChildren += 1
+                    stack.append((child, cell, iter(neighbors[child])))
+                elif child != parent:
+                    low[cell] = min(low[cell], order[child])
+            if rootChildren > 1:
+                points.add(root)
+
+        return points
+
+    def _findPocket(self, entry, cell):
+        """
+        Returns the Pocket beyond articulation point `entry` on the side of
+        its neighbour `cell`, or None if that side is the larger one.
+        """
+        entryIndex = self.cellIndex[entry]
+        seen = {entryIndex, self.cellIndex[cell]}
+        fringe = [self.cellIndex[cell]]
+        while fringe:
+            for neighbor in self.neighbors[fringe.pop()]:
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    fringe.append(neighbor)
+        seen.discard(entryIndex)
+
+        # The pocket is the side without the rest of the maze
+        if 2 * len(seen) >= len(self.neighbors):
+            return None
+
+        distances = self.layout.distancesFrom(entry)
+        height = self.layout.height
+        cells = [self.layout.freeCells[index] for index in sorted(seen)]
+        cellDepths = [(int(distances[self.cellIndex[(x, y)]]),
+                       1 << (x * height + y)) for x, y in cells]
+        return Pocket(entry, frozenset(cells), cellDepths)
+
+    def isSealed(self, pacmanPosition, action, ghostPositions, food):
+        """
+        Returns whether Pacman playing `action` from `pacmanPosition` enters
+        a pocket that a ghost of `ghostPositions` reaches the entry of
+        before Pacman can eat its food and come out of it. `food` is the
+        food bitboard (in the BitGrid bit order).
+        """
+        pocket = self.pocketOf.get((pacmanPosition, action))
+        if pocket is None or (food and not food & ~pocket.mask):
+            return False
+        roundTrip = pocket.roundTrip(food)
+        return any(self.layout.mazeDistance(pocket.entry, position) <
+                   roundTrip for position in ghostPositions)
+
+
+def getTrapAnalysis(layout):
+    """
+    Returns the trap analysis of a layout, built on first use.
+    """
+    key = layout.layoutText
+    analysis = TRAP_ANALYSIS_CACHE.get(key)
+    if analysis is None:
+        analysis = TrapAnalysis(layout)
+        TRAP_ANALYSIS_CACHE[key] = analysis
+    return analysis
+
+
+def prunePacmanSuccessors(state, successors):
+    """
+    Pruning hook of the search agents: returns the (state, move) successors
+    of Pacman in a game state but the moves into the pockets a ghost can
+    seal before Pacman eats their food and comes out (see
+    TrapAnalysis.isSealed). Scared ghosts, which cannot catch
+    Pacman, are ignored. If every move is sealed, all of them are kept.
+    """
+    isCompact = isinstance(state, CompactGameState)
+    analysis = getTrapAnalysis(
+        state.layout if isCompact else state.data.layout)
+    position = state.getPacmanPosition()
+    if not analysis.pocketOf or position not in analysis.articulationPoints:
+        return successors
+
+    if isCompact:
+        ghosts = [(ghostPosition, scaredTimer)
+                  for ghostPosition, _, scaredTimer in state.ghosts]
+        food = state.food
+    else:
+        ghosts = [(ghost.getPosition(), ghost.scaredTimer)
+                  for ghost in state.getGhostStates()]
+        food = state.getFood()
+        if not isinstance(food, BitGrid):
+            food = BitGrid.fromGrid(food)
+        food = food.getBits()
+    ghostPositions = [ghostPosition for ghostPosition, scaredTimer in ghosts
+                      if scaredTimer == 0 and
+                      ghostPosition in analysis.cellIndex]
+    if not ghostPositions:
+        return successors
+
+    pruned = [successor for successor in successors
+              if not analysis.isSealed(position, successor[1],
+                                       ghostPositions, food)]
+    return pruned or successors
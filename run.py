@@ -2,8 +2,11 @@ import imp
 import os
 from argparse import ArgumentParser, ArgumentTypeError
 
-from pacman_module.pacman import runGame
+from pacman_module.pacman import createGame
+from pacman_module.searchStats import formatReport, writeJSONL
+from pacman_module import profiling
 from pacman_module.ghostAgents import GreedyGhost, SmartyGhost, DumbyGhost
+from pacman_module.moveOrdering import MoveOrdering
 
 
 def restricted_float(x):
@@ -20,6 +23,15 @@ def positive_integer(x):
     return x
 
 
+def heuristics_list(x):
+    heuristics = tuple(h for h in x.split(',') if h)
+    for h in heuristics:
+        if h not in MoveOrdering.HEURISTICS:
+            raise ArgumentTypeError("%r is not one of %s" % (
+                h, ", ".join(MoveOrdering.HEURISTICS)))
+    return heuristics
+
+
 def load_agent_from_file(filepath):
     class_mod = None
     expected_class = 'PacmanAgent'
@@ -68,13 +80,81 @@ if __name__ == '__main__':
         '--silentdisplay',
         help="Disable the graphical display of the game.",
         action="store_true")
+    parser.add_argument(
+        '--movetime',
+        help='Time budget of a move of Pacman, in seconds: the search stops '
+             'at its deadline, and the agents that deepen their search '
+             '(e.g. `hminimax.py`) use all of it (default: no time budget, '
+             'the agents search to a fixed depth).',
+        type=float, default=None)
+    parser.add_argument(
+        '--ordering',
+        help='Comma-separated move ordering heuristics of the alphabeta '
+             'agents, among ' + ", ".join(MoveOrdering.HEURISTICS) +
+             ' (default: none, the successors are searched in the order '
+             'of the game rules).',
+        type=heuristics_list, default=None)
+    parser.add_argument(
+        '--tablebase',
+        help='Play the moves of the positions Pacman wins from the '
+             'tablebase of the layout, if one was generated, for the agents '
+             'that support it (e.g. `alphabeta.py`).',
+        action='store_true')
+    parser.add_argument(
+        '--trappruning',
+        help='Prune the moves of Pacman into the dead-end pockets the '
+             'ghosts can seal, for the agents that support it (e.g. '
+             '`hminimax.py`).',
+        action='store_true')
+    parser.add_argument(
+        '--workers',
+        help='Number of processes searching the successors of the root, '
+             'for the agents that support it (e.g. `alphabeta.py`).',
+        type=positive_integer, default=None)
+    parser.add_argument(
+        '--rollouts',
+        help='Number of rollouts of a move, for the Monte Carlo agents '
+             '(e.g. `mcts.py`).',
+        type=positive_integer, default=None)
+    parser.add_argument(
+        '--rolloutpolicy',
+        help='Rollout policy of the Monte Carlo agents, among `random` and '
+             '`ghost` (default: `ghost`).',
+        choices=['random', 'ghost'], default=None)
+    parser.add_argument(
+        '--stats',
+        help='Print the search statistics of Pacman\'s moves and write '
+             'them in this file, as JSON lines (`-` to only print them).',
+        default=None)
+    parser.add_argument(
+        '--profile',
+        help='Time the hot paths of the engine and of the agent (also '
+             'enabled by the PACMAN_PROFILE environment variable) and print '
+             'their calls, cumulative and self time at the end of the game.',
+        action="store_true")
+    parser.add_argument(
+        '--profiledump',
+        help='With --profile, profile every move with cProfile and dump '
+             'the given number of slowest moves in --profiledir, as cProfile '
+             'and collapsed-stack files.',
+        type=positive_integer, default=None)
+    parser.add_argument(
+        '--profiledir',
+        help='Directory of the files of --profiledump.',
+        default="profiles")
 
     args = parser.parse_args()
 
+    if args.profile:
+        profiling.enable(args.profiledump or 0)
+    else:
+        profiling.enableFromEnvironment()
+
     if (args.agentfile == "humanagent.py" and args.silentdisplay):
         print("Human agent cannot play without graphical display")
         exit()
     agent = load_agent_from_file(args.agentfile)(args)
+    profiling.instrumentAgent(agent)
 
     gagt = ghosts[args.ghostagent]
     nghosts = 1
@@ -82,9 +162,27 @@ if __name__ == '__main__':
         gagts = [gagt(i + 1) for i in range(nghosts)]
     else:
         gagts = []
-    total_score, total_computation_time, total_expanded_nodes = runGame(
-        args.layout, agent, gagts, not args.silentdisplay, expout=0)
+    game = createGame(
+        args.layout, agent, gagts, not args.silentdisplay, expout=0,
+        moveTime=args.movetime)
+    total_score, total_computation_time, total_expanded_nodes = game.run()
 
     print("Total score : " + str(total_score))
     print("Total computation time (seconds) : " + str(total_computation_time))
     print("Total expanded nodes : " + str(total_expanded_nodes))
+
+    if args.stats is not None:
+        instrumentation = game.instrumentation
+        print(formatReport(instrumentation.searchReport()))
+        if args.stats != '-':
+            with open(args.stats, 'w') as f:
+                writeJSONL([stats for stats in instrumentation.moves
+                            if stats.agentIndex == 0], f,
+                           agent=args.agentfile, ghost=args.ghostagent,
+                           layout=args.layout, seed=args.seed)
+
+    profile = game.instrumentation.profile
+    if profile is not None:
+        print(profile.format())
+        for path in profile.dump(args.profiledir) if profile.slowest else []:
+            print("Profile of a slow move written in " + path)
@@ -0,0 +1,296 @@
+import csv
+import json
+import os
+import random
+import sys
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from itertools import product
+
+import numpy as np
+
+from pacman_module.pacman import createGame
+from pacman_module.searchStats import writeJSONL
+from run import (ghosts, load_agent_from_file, heuristics_list,
+                 positive_integer)
+
+# Fields of the result of a game, in the order of the CSV columns
+FIELDS = ['agent', 'ghost', 'layout', 'seed', 'score', 'time',
+          'expanded_nodes', 'win', 'lose', 'moves', 'generated_states',
+          'cache_hits', 'cache_misses', 'error']
+
+# Agent classes loaded by this process, by agent file
+agent_classes = {}
+
+
+def comma_list(x):
+    return [item for item in x.split(',') if item]
+
+
+def integer_list(x):
+    return [int(item) for item in comma_list(x)]
+
+
+def play_game(agentfile, ghost, layout, seed, options=None, stats=False):
+    """
+    Play a game without display and return its result.
+
+    Arguments:
+    ----------
+    - `agentfile`: Python file containing a `PacmanAgent` class
+    - `ghost`: name of the ghost agent (`dumby`, `greedy` or `smarty`)
+    - `layout`: name of the maze layout
+    - `seed`: seed of the random number generators
+    - `options`: dictionary of additional agent arguments (e.g. `movetime`)
+    - `stats`: keep the search statistics of the moves of Pacman
+
+    Return:
+    -------
+    - A dictionary with the keys of FIELDS. `error` is None unless the game
+      raised an exception, in which case the other results are None. With
+      `stats`, the `move_stats` key holds the list of the MoveStats of the
+      moves of Pacman (see searchStats).
+    """
+
+    sys.setrecursionlimit(8000)
+    random.seed(seed)
+    np.random.seed(seed)
+
+    args = Namespace(seed=seed, agentfile=agentfile, ghostagent=ghost,
+                     layout=layout, silentdisplay=True, movetime=None,
+                     ordering=None, workers=None, rollouts=None,
+                     rolloutpolicy=None, tablebase=False, trappruning=False)
+    args.__dict__.update(options or {})
+
+    result = dict.fromkeys(FIELDS)
+    result.update(agent=agentfile, ghost=ghost, layout=layout, seed=seed)
+    try:
+        if agentfile not in agent_classes:
+            agent_classes[agentfile] = load_agent_from_file(agentfile)
+        agent = agent_classes[agentfile](args)
+
+        game = createGame(layout, agent, [ghosts[ghost](1)], False, expout=0,
+                          moveTime=args.movetime)
+        score, computation_time, expanded_nodes = game.run()
+
+        counters = game.instrumentation
+        result.update(
+            score=score, time=computation_time,
+            expanded_nodes=int(expanded_nodes), win=game.state.isWin(),
+            lose=game.state.isLose(),
+            moves=sum(1 for index, _ in game.moveHistory if index == 0),
+            generated_states=counters.generated,
+            cache_hits=counters.cacheHits, cache_misses=counters.cacheMisses)
+        if stats:
+            result['move_stats'] = [moveStats for moveStats in counters.moves
+                                    if moveStats.agentIndex == 0]
+    except Exception as e:
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+
+    return result
+
+
+class JSONLSink:
+    """
+    Writes results as JSON lines, one per game.
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, result):
+        self.f.write(json.dumps(result) + '\n')
+        self.f.flush()
+
+
+class CSVSink:
+    """
+    Writes results as CSV rows, one per game, after a header row.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.writer = csv.DictWriter(f, FIELDS)
+        self.writer.writeheader()
+
+    def write(self, result):
+        self.writer.writerow(result)
+        self.f.flush()
+
+
+def open_sink(path):
+    """
+    Return a sink writing in `path`: CSV if `path` ends with `.csv`, JSON
+    lines otherwise (`-` is the standard output).
+    """
+
+    f = sys.stdout if path == '-' else open(path, 'w', newline='')
+    if path.lower().endswith('.csv'):
+        return CSVSink(f)
+    return JSONLSink(f)
+
+
+def run_batch(agents, ghost_names, layouts, seeds=(1,), workers=None,
+              sinks=(), options=None, verbose=False, threads=None,
+              stats=None):
+    """
+    Play every (agent, ghost, layout, seed) combination, in a pool of
+    `workers` processes (all the cores by default, in this process if
+    `workers` is 1), or in a pool of `threads` threads of this process.
+    Results are written in the sinks as soon as the games finish.
+
+    Arguments:
+    ----------
+    - `agents`, `ghost_names`, `layouts`, `seeds`: the values of the
+      combinations, see `play_game`
+    - `workers`: number of processes
+    - `threads`: number of threads, used instead of processes if given. The
+      games share the layouts and the random number generators, which are
+      seeded when each game starts.
+    - `sinks`: objects with a `write(result)` method, see `open_sink`
+    - `options`: dictionary of additional agent arguments
+    - `verbose`: print a line per finished game
+    - `stats`: file receiving the search statistics of every move of Pacman,
+      as JSON lines (see searchStats.writeJSONL)
+
+    Return:
+    -------
+    - The results of the games, in the order they finished
+    """
+
+    games = list(product(agents, ghost_names, layouts, seeds))
+    workers = workers or os.cpu_count() or 1
+    results = []
+
+    def collect(result):
+        moves = result.pop('move_stats', None)
+        if moves is not None:
+            writeJSONL(moves, stats, agent=result['agent'],
+                       ghost=result['ghost'], layout=result['layout'],
+                       seed=result['seed'])
+            stats.flush()
+        results.append(result)
+        for sink in sinks:
+            sink.write(result)
+        if verbose:
+            if result['error'] is None:
+                outcome = "score %s (%.2f s, %d nodes)" % (
+                    result['score'], result['time'],
+                    result['expanded_nodes'])
+            else:
+                outcome = result['error']
+            print("[%d/%d] %s %s %s seed %d: %s" % (
+                len(results), len(games), result['agent'], result['ghost'],
+                result['layout'], result['seed'], outcome))
+
+    if threads:
+        with ThreadPoolExecutor(threads) as executor:
+            futures = [executor.submit(play_game, *game, options=options,
+                                       stats=stats is not None)
+                       for game in games]
+            for future in as_completed(futures):
+                collect(future.result())
+    elif workers == 1:
+        for game in games:
+            collect(play_game(*game, options=options,
+                              stats=stats is not None))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(play_game, *game, options=options,
+                                       stats=stats is not None)
+                       for game in games]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    return results
+
+
+if __name__ == '__main__':
+    usage = """
+    USAGE:      python runBatch.py <batch_options>
+    EXAMPLES:   (1) python runBatch.py --output results.jsonl
+                    - plays the minimax, alphabeta and hminimax agents
+                      against every ghost in every adversarial maze
+                (2) python runBatch.py --agents hminimax.py --seeds 1,2,3
+                    --workers 4 --output results.csv
+    """
+
+    parser = ArgumentParser(usage)
+    parser.add_argument(
+        '--agents',
+        help='Comma-separated Python files containing a `PacmanAgent` '
+             'class.',
+        type=comma_list, default=["minimax.py", "alphabeta.py",
+                                  "hminimax.py"])
+    parser.add_argument(
+        '--ghosts',
+        help='Comma-separated ghost agents among dumby, greedy, smarty.',
+        type=comma_list, default=["greedy", "smarty", "dumby"])
+    parser.add_argument(
+        '--layouts',
+        help='Comma-separated maze layouts (from layout folder).',
+        type=comma_list, default=["small_adv", "medium_adv", "large_adv"])
+    parser.add_argument(
+        '--seeds', help='Comma-separated RNG seeds.', type=integer_list,
+        default=[1])
+    parser.add_argument(
+        '--workers',
+        help='Number of games played in parallel (default: number of '
+             'cores).',
+        type=int, default=None)
+    parser.add_argument(
+        '--threads',
+        help='Number of games played in parallel in threads of this '
+             'process, instead of worker processes.',
+        type=int, default=None)
+    parser.add_argument(
+        '--output',
+        help='Files receiving the results as games finish, as CSV if the '
+             'name ends with `.csv`, as JSON lines otherwise (`-` for the '
+             'standard output).',
+        nargs='*', default=[])
+    parser.add_argument(
+        '--movetime',
+        help='Time budget of a move of Pacman, in seconds (default: no time '
+             'budget, the agents search to a fixed depth).',
+        type=float, default=None)
+    parser.add_argument(
+        '--ordering',
+        help='Comma-separated move ordering heuristics of the alphabeta '
+             'agents (default: none).',
+        type=heuristics_list, default=None)
+    parser.add_argument(
+        '--rollouts',
+        help='Number of rollouts of a move, for the Monte Carlo agents.',
+        type=positive_integer, default=None)
+    parser.add_argument(
+        '--tablebase',
+        help='Play the moves of the positions Pacman wins from the '
+             'tablebases generated ahead of time.',
+        action='store_true')
+    parser.add_argument(
+        '--trappruning',
+        help='Prune the moves of Pacman into the dead-end pockets the '
+             'ghosts can seal.',
+        action='store_true')
+    parser.add_argument(
+        '--stats',
+        help='File receiving the search statistics of every move of '
+             'Pacman, as JSON lines.',
+        default=None)
+
+    args = parser.parse_args()
+
+    for name in args.ghosts:
+        if name not in ghosts:
+            parser.error("unknown ghost agent %r" % name)
+
+    sinks = [open_sink(path) for path in args.output]
+    stats = open(args.stats, 'w') if args.stats else None
+    run_batch(args.agents, args.ghosts, args.layouts, args.seeds,
+              args.workers, sinks,
+              {'movetime': args.movetime, 'ordering': args.ordering,
+               'rollouts': args.rollouts, 'tablebase': args.tablebase,
+               'trappruning': args.trappruning},
+              verbose=True, threads=args.threads, stats=stats)
@@ -0,0 +1,78 @@
+# conftest.py
+# -----------
+# Fixtures of the tests of the fast paths of the engine and the agents.
+#
+# Most tests compare a fast path with the original code it replaces, on the
+# game states met in random games of the shipped layouts (and of MAZE, a
+# small maze with capsules and two ghosts, so that the scared ghosts and
+# the capsules are covered too).
+
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from pacman_module import instrumentation  # noqa: E402
+from pacman_module import layout as layoutModule  # noqa: E402
+from pacman_module import pacman  # noqa: E402
+from pacman_module.game import Directions  # noqa: E402
+
+# Shipped layouts with a ghost, and layouts without ghosts
+ADVERSARIAL_LAYOUTS = ['small_adv', 'small_adv2', 'medium_adv', 'large_adv']
+MAZE_LAYOUTS = ['small', 'medium', 'large']
+
+# A maze with capsules and two ghosts
+MAZE = [
+    '%%%%%%%%%%',
+    '%o....G..%',
+    '%.%%.%%%.%',
+    '%P...o..G%',
+    '%%%%%%%%%%',
+]
+
+
+def getLayout(name):
+    """
+    Returns a shipped layout, or MAZE for 'maze'.
+    """
+    if name == 'maze':
+        return layoutModule.Layout(MAZE)
+    return layoutModule.getLayout(name)
+
+
+def randomGames(layout, numGames=10, maxMoves=200, seed=0):
+    """
+    Plays games of random moves (STOP excluded) on a layout and returns the
+    list of the GameStates met, with the index of the agent to move in
+    them.
+    """
+    rng = random.Random(seed)
+    states = []
+    for _ in range(numGames):
+        state = pacman.GameState()
+        state.initialize(layout, layout.getNumGhosts())
+        player = 0
+        for _ in range(maxMoves):
+            if state.isWin() or state.isLose():
+                break
+            states.append((state, player))
+            actions = [action for action in state.getLegalActions(player)
+                       if action != Directions.STOP] or [Directions.STOP]
+            state = state.generateSuccessor(player, rng.choice(actions))
+            player = (player + 1) % state.getNumAgents()
+    return states
+
+
+@pytest.fixture(autouse=True)
+def freshInstrumentation():
+    """
+    Gives every test an instrumentation of its own, with no budget.
+    """
+    previous = instrumentation.activate(instrumentation.Instrumentation())
+    yield instrumentation.current()
+    instrumentation.activate(previous)
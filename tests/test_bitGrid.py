@@ -0,0 +1,73 @@
+# Tests of BitGrid against the list-backed Grid
+
+import random
+
+import pytest
+
+from pacman_module.game import BitGrid, Grid
+
+
+def randomGrids(width, height, rng):
+    """
+    Returns a Grid with random cells and the BitGrid of the same cells.
+    """
+    grid = Grid(width, height)
+    bitGrid = BitGrid(width, height)
+    for x in range(width):
+        for y in range(height):
+            value = rng.random() < 0.3
+            grid[x][y] = value
+            bitGrid[x][y] = value
+    return grid, bitGrid
+
+
+@pytest.mark.parametrize('size', [(1, 1), (7, 7), (20, 7), (30, 14)])
+def test_sameCells(size):
+    rng = random.Random(0)
+    for _ in range(20):
+        grid, bitGrid = randomGrids(*size, rng)
+        assert bitGrid == grid
+        assert BitGrid.fromGrid(grid) == bitGrid
+        assert hash(bitGrid) == hash(grid)
+        assert bitGrid.count() == grid.count()
+        assert bitGrid.count(False) == grid.count(False)
+        assert bitGrid.asList() == grid.asList()
+        assert bitGrid.asList(False) == grid.asList(False)
+        assert bitGrid.data == grid.data
+        assert str(bitGrid) == str(grid)
+
+
+def test_writesUpdateCachedHashAndCount():
+    rng = random.Random(1)
+    grid, bitGrid = randomGrids(20, 7, rng)
+    hash(bitGrid)
+    bitGrid.count()
+    for _ in range(200):
+        x, y = rng.randrange(20), rng.randrange(7)
+        value = rng.random() < 0.5
+        grid[x][y] = value
+        bitGrid[x][y] = value
+        assert hash(bitGrid) == hash(grid)
+        assert bitGrid.count() == grid.count()
+
+
+def test_copiesAreIndependent():
+    rng = random.Random(2)
+    grid, bitGrid = randomGrids(9, 5, rng)
+    copy = bitGrid.copy()
+    copy[3][2] = not copy[3][2]
+    assert bitGrid == grid
+    assert copy != bitGrid
+    assert hash(copy) != hash(bitGrid)
+    assert copy.count() == bitGrid.count() + (1 if copy[3][2] else -1)
+
+
+def test_columnsAreIndexedLikeLists():
+    rng = random.Random(3)
+    grid, bitGrid = randomGrids(6, 4, rng)
+    for x in range(-6, 6):
+        assert [bitGrid[x][y] for y in range(4)] == grid[x]
+    for x in (-7, 6):
+        with pytest.raises(IndexError):
+            bitGrid[x]
+    assert [list(column) for column in bitGrid] == grid.data
@@ -0,0 +1,61 @@
+# Tests of CompactGameState against GameState
+
+import pytest
+
+from conftest import ADVERSARIAL_LAYOUTS, MAZE_LAYOUTS, getLayout, \
+    randomGames
+from pacman_module.compactState import CompactGameState
+from pacman_module.game import Directions
+
+
+def assertSameState(compact, state):
+    assert compact == state.toCompact()
+    assert compact.getPacmanPosition() == state.getPacmanPosition()
+    assert compact.getGhostPositions() == state.getGhostPositions()
+    assert compact.getNumFood() == state.getNumFood()
+    assert compact.getFood() == state.getFood()
+    assert list(compact.getCapsules()) == state.getCapsules()
+    assert compact.getScore() == state.getScore()
+    assert compact.isWin() == state.isWin()
+    assert compact.isLose() == state.isLose()
+    for index in range(1, state.getNumAgents()):
+        assert compact.getGhostScaredTimer(index) == \
+            state.getGhostState(index).scaredTimer
+
+
+@pytest.mark.parametrize(
+    'name', ADVERSARIAL_LAYOUTS + MAZE_LAYOUTS + ['maze'])
+def test_successorsMatchGameState(name):
+    for state, _ in randomGames(getLayout(name)):
+        compact = state.toCompact()
+        assertSameState(compact, state)
+        for player in range(state.getNumAgents()):
+            actions = state.getLegalActions(player)
+            assert sorted(compact.getLegalActions(player)) == \
+                sorted(actions)
+            for action in actions:
+                assertSameState(compact.generateSuccessor(player, action),
+                                state.generateSuccessor(player, action))
+
+
+@pytest.mark.parametrize('name', ['small_adv', 'maze'])
+def test_roundTrip(name):
+    for state, _ in randomGames(getLayout(name)):
+        compact = state.toCompact()
+        rebuilt = CompactGameState.fromGameState(compact.toGameState())
+        assert rebuilt == compact
+        assert compact.toGameState() == state
+
+
+def test_expansionsAreCounted(freshInstrumentation):
+    state, _ = randomGames(getLayout('maze'), numGames=1)[0]
+    compact = state.toCompact()
+    context = freshInstrumentation.searchContext
+
+    successors = compact.generatePacmanSuccessors()
+    assert [move for _, move in successors] == \
+        [move for _, move in state.generatePacmanSuccessors()]
+    assert Directions.STOP not in [move for _, move in successors]
+    compact.generateGhostSuccessors(1)
+    state.generateGhostSuccessors(1)
+    assert context.expanded == 4
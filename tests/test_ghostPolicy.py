@@ -0,0 +1,44 @@
+# Tests of the policy tables of the ghosts against their distributions
+# computed on the fly
+
+import random
+
+import pytest
+
+from conftest import ADVERSARIAL_LAYOUTS, getLayout, randomGames
+from pacman_module import util
+from pacman_module.game import Directions
+from pacman_module.ghostAgents import DumbyGhost, GreedyGhost, SmartyGhost
+
+GHOSTS = [DumbyGhost, GreedyGhost, SmartyGhost,
+          lambda index: GreedyGhost(index, 0.8, 0.6)]
+
+
+@pytest.mark.parametrize('name', ADVERSARIAL_LAYOUTS + ['maze'])
+@pytest.mark.parametrize('ghostClass', GHOSTS)
+def test_tablesMatchComputedDistributions(name, ghostClass):
+    layout = getLayout(name)
+    ghosts = [ghostClass(index)
+              for index in range(1, layout.getNumGhosts() + 1)]
+    looked = 0
+    for state, _ in randomGames(layout):
+        for ghost in ghosts:
+            if ghost._lookupPolicy(state) is not None:
+                looked += 1
+            assert ghost.getDistribution(state) == \
+                ghost.computeDistribution(state)
+    assert looked > 0
+
+
+@pytest.mark.parametrize('ghostClass', GHOSTS)
+def test_samplesMatchComputedDistributions(ghostClass):
+    layout = getLayout('maze')
+    ghost = ghostClass(1)
+    for seed, (state, _) in enumerate(randomGames(layout)):
+        random.seed(seed)
+        action = ghost.get_action(state)
+        random.seed(seed)
+        distribution = ghost.computeDistribution(state)
+        expected = util.chooseFromDistribution(distribution) \
+            if len(distribution) else Directions.STOP
+        assert action == expected
@@ -0,0 +1,69 @@
+# Tests of the leaf evaluations against the original scan of the food
+
+from argparse import Namespace
+from math import inf as INF
+
+import pytest
+
+import hminimax
+from conftest import ADVERSARIAL_LAYOUTS, getLayout, randomGames
+from pacman_module.leafEvaluation import LeafEvaluator
+
+
+def scanEstimate(state, foodCoef, distCoef, ghostCoef, farthest=False):
+    """
+    The estimate of the original evaluation functions, scanning the whole
+    food matrix.
+    """
+    pacmanPosition = state.getPacmanPosition()
+    foodMatrix = state.getFood()
+    nbFoods = 0
+    distance = 0 if farthest else INF
+    for i in range(foodMatrix.width):
+        for j in range(foodMatrix.height):
+            if foodMatrix[i][j]:
+                nbFoods += 1
+                tmp = abs(pacmanPosition[0] - i) + abs(pacmanPosition[1] - j)
+                distance = max(distance, tmp) if farthest else \
+                    min(distance, tmp)
+    if distance == INF:
+        distance = 0
+    estimate = nbFoods * foodCoef + distance * distCoef + state.getScore()
+    if ghostCoef:
+        ghostPosition = state.getGhostPositions()[0]
+        estimate += ghostCoef * (abs(pacmanPosition[0] - ghostPosition[0]) +
+                                 abs(pacmanPosition[1] - ghostPosition[1]))
+    return estimate
+
+
+@pytest.mark.parametrize('name', ADVERSARIAL_LAYOUTS)
+@pytest.mark.parametrize('coefs', [(-100, -5, 1, False), (-10, -1, 0, True)])
+def test_batchesMatchTheScan(name, coefs):
+    layout = getLayout(name)
+    states = [state for state, _ in randomGames(layout)]
+    evaluator = LeafEvaluator(layout, *coefs)
+    expected = [scanEstimate(state, *coefs) for state in states]
+    assert evaluator.evaluateStates(states) == expected
+    assert evaluator.evaluateStates(
+        [state.toCompact() for state in states]) == expected
+
+    # Once memorized
+    assert evaluator.evaluateStates(states[::-1]) == expected[::-1]
+
+
+@pytest.mark.parametrize('name', ADVERSARIAL_LAYOUTS)
+def test_incrementalFeaturesMatchTheScan(name):
+    agent = hminimax.PacmanAgent(Namespace())
+    coefs = (agent.FOOD_COEF, agent.DIST_COEF, agent.GHOST_COEF)
+    for state, player in randomGames(getLayout(name)):
+        compact = state.toCompact()
+        features = agent._getFeatures(compact)
+        assert agent._getEstimate(compact, features) == \
+            scanEstimate(state, *coefs)
+        for action in compact.getLegalActions(player):
+            successor = compact.generateSuccessor(player, action)
+            successorFeatures = agent._updateFeatures(
+                compact, successor, features)
+            assert agent._getEstimate(successor, successorFeatures) == \
+                scanEstimate(successor, *coefs)
+        agent.closestFood = {}
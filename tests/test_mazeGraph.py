@@ -0,0 +1,73 @@
+# Tests of the corridors of the maze graphs against the moves of the rules
+
+import pytest
+
+from conftest import ADVERSARIAL_LAYOUTS, MAZE_LAYOUTS, getLayout
+from pacman_module import layout as layoutModule
+from pacman_module.game import Actions, Directions
+from pacman_module.mazeGraph import MazeGraph
+
+
+def exits(layout, cell):
+    """
+    Returns the moves of an agent on a cell, as computed by the rules.
+    """
+    return [action for action in Actions.getPossibleActionsAt(
+        cell, Directions.STOP, layout.walls) if action != Directions.STOP]
+
+
+@pytest.mark.parametrize(
+    'name', ADVERSARIAL_LAYOUTS + MAZE_LAYOUTS + ['maze'])
+def test_corridorsFollowTheMaze(name):
+    layout = getLayout(name)
+    graph = MazeGraph(layout)
+    assert set(graph.junctions) == {
+        cell for cell in layout.freeCells if len(exits(layout, cell)) != 2}
+
+    for cell in layout.freeCells:
+        assert sorted(exits(layout, cell)) == \
+            sorted(action for (start, action) in graph.corridors
+                   if start == cell)
+        for action in exits(layout, cell):
+            corridor = graph.getCorridor(cell, action)
+            assert corridor.start == cell
+            assert corridor.actions[0] == action
+
+            # Walk the corridor with the rules: straight on through the
+            # corridor cells, until a junction
+            position, mask = cell, 0
+            for index, step in enumerate(corridor.actions):
+                assert step in exits(layout, position)
+                if index > 0:
+                    assert len(exits(layout, position)) == 2
+                    assert step != Actions.reverseDirection(
+                        corridor.actions[index - 1])
+                position = tuple(map(int, Actions.getSuccessor(position,
+                                                               step)))
+                assert position == corridor.cells[index]
+                mask |= 1 << (position[0] * layout.height + position[1])
+            assert position == corridor.end
+            assert position in graph.junctions or position == cell
+            assert corridor.length == len(corridor.cells)
+            assert corridor.mask == mask
+
+    for junction, edges in graph.edges.items():
+        assert [edge.actions[0] for edge in edges] == \
+            [action for action in layout.pacmanActions[junction]
+             if action != Directions.STOP]
+    assert graph.compression() >= 1
+
+
+def test_loopWithoutJunctions():
+    layout = layoutModule.Layout(['%%%%%',
+                                  '%P  %',
+                                  '% % %',
+                                  '%   %',
+                                  '%%%%%'])
+    graph = MazeGraph(layout)
+    assert graph.junctions == []
+    assert graph.edges == {}
+    assert graph.compression() == 0
+    for (cell, _), corridor in graph.corridors.items():
+        assert corridor.end == cell
+        assert corridor.length == len(layout.freeCells) == 8
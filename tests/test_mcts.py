@@ -0,0 +1,37 @@
+# Tests of the Monte Carlo tree search agent on whole games
+
+from argparse import Namespace
+
+import pytest
+
+import mcts
+from conftest import getLayout
+from pacman_module import pacman
+from pacman_module.ghostAgents import DumbyGhost, GreedyGhost, SmartyGhost
+
+
+@pytest.mark.parametrize('name', ['small_adv', 'medium_adv'])
+@pytest.mark.parametrize('ghostName, ghostClass', [
+    ('dumby', DumbyGhost), ('greedy', GreedyGhost),
+    ('smarty', SmartyGhost)])
+def test_gamesAreWon(freshInstrumentation, name, ghostName, ghostClass):
+    layout = getLayout(name)
+    state = pacman.GameState()
+    state.initialize(layout, layout.getNumGhosts())
+    # Pacman used to stay away from the food next to the dumby ghost of
+    # medium_adv forever
+    agent = mcts.PacmanAgent(
+        Namespace(ghostagent=ghostName, rollouts=100, seed=0))
+    ghosts = [ghostClass(index)
+              for index in range(1, layout.getNumGhosts() + 1)]
+    for _ in range(300):
+        freshInstrumentation.newMove()
+        state = state.generateSuccessor(0, agent.get_action(state))
+        for ghost in ghosts:
+            if state.isWin() or state.isLose():
+                break
+            state = state.generateSuccessor(
+                ghost.index, ghost.get_action(state))
+        if state.isWin() or state.isLose():
+            break
+    assert state.isWin()
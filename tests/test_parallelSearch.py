@@ -0,0 +1,32 @@
+# Tests of the search of the successors of the root in the workers
+
+from argparse import Namespace
+
+import pytest
+
+import alphabeta
+from conftest import getLayout, randomGames
+from pacman_module.searchContext import BudgetExhausted
+
+
+def test_exhaustedTasksLeaveNoPath(freshInstrumentation):
+    state, _ = randomGames(getLayout('small_adv'), numGames=1)[0]
+    compact = state.toCompact()
+    tasks = [(1, successor, move)
+             for successor, move in compact.generatePacmanSuccessors()]
+
+    # Results of the tasks in a fresh agent
+    freshInstrumentation.newMove()
+    expected = [alphabeta.PacmanAgent(Namespace()).searchRootChild(task)
+                for task in tasks]
+
+    # A worker agent whose first task runs out of budget
+    agent = alphabeta.PacmanAgent(Namespace())
+    freshInstrumentation.newMove(maxExpanded=3)
+    with pytest.raises(BudgetExhausted):
+        agent.searchRootChild(tasks[0])
+    assert not agent.path
+
+    freshInstrumentation.newMove()
+    agent.table.clear()
+    assert [agent.searchRootChild(task) for task in tasks] == expected
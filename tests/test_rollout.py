@@ -0,0 +1,72 @@
+# Tests of the rollout simulator against the rules of the game
+
+import random
+
+import pytest
+
+from conftest import ADVERSARIAL_LAYOUTS, getLayout, randomGames
+from pacman_module.ghostAgents import GreedyGhost, SmartyGhost
+from pacman_module.rollout import GhostModelPolicy, RandomPolicy, \
+    RolloutSimulator
+
+
+class RecordingPolicy:
+    """
+    A rollout policy recording the moves chosen by another one.
+    """
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.moves = []
+
+    def pacmanMove(self, simulator, *args):
+        move = self.policy.pacmanMove(simulator, *args)
+        self.moves.append((0, move[0]))
+        return move
+
+    def ghostMove(self, simulator, index, *args):
+        move = self.policy.ghostMove(simulator, index, *args)
+        self.moves.append((index, move[0]))
+        return move
+
+
+@pytest.mark.parametrize('name', ADVERSARIAL_LAYOUTS)
+@pytest.mark.parametrize('policy', [
+    RandomPolicy(), GhostModelPolicy(GreedyGhost),
+    GhostModelPolicy(SmartyGhost)])
+@pytest.mark.parametrize('maxMoves', [5, 1000])
+def test_rolloutsFollowTheRules(name, policy, maxMoves):
+    layout = getLayout(name)
+    simulator = RolloutSimulator(layout)
+    rng = random.Random(0)
+    for state, player in randomGames(layout, numGames=5):
+        compact = state.toCompact()
+        assert simulator.canSimulate(compact)
+        recorder = RecordingPolicy(policy)
+        score = simulator.rollout(compact, player, recorder, rng, maxMoves)
+
+        # Replay the moves of the rollout on the CompactGameState
+        for agentIndex, action in recorder.moves:
+            assert agentIndex == player
+            assert action in compact.getLegalActions(agentIndex)
+            compact = compact.generateSuccessor(agentIndex, action)
+            player = (player + 1) % compact.getNumAgents()
+
+        # Games that are not won are scored with the distance to the food
+        food = compact.getFood().asList()
+        if compact.isWin():
+            assert score == compact.getScore()
+        else:
+            if not compact.isLose():
+                assert len([move for move in recorder.moves
+                            if move[0] == 0]) == maxMoves
+            assert score == compact.getScore() - min(
+                layout.mazeDistance(compact.getPacmanPosition(), dot)
+                for dot in food)
+
+
+def test_statesWithCapsulesAreNotSimulated():
+    layout = getLayout('maze')
+    simulator = RolloutSimulator(layout)
+    state, _ = randomGames(layout, numGames=1)[0]
+    assert not simulator.canSimulate(state.toCompact())
@@ -0,0 +1,75 @@
+# Tests of the node expansion budget and of the deadline of the moves
+
+from math import inf as INF
+
+import pytest
+
+from conftest import getLayout, randomGames
+from pacman_module.pacman import GameState
+from pacman_module.searchContext import BudgetExhausted, SearchContext
+
+
+def test_unlimitedContext():
+    context = SearchContext()
+    for _ in range(1000):
+        context.expand()
+    assert context.expanded == 1000
+    assert context.deadline is None
+    assert context.timeLeft() is None
+    assert context.nodesLeft() == INF
+    assert not context.isExhausted()
+
+
+def test_budgetStopsTheExpansions():
+    context = SearchContext(maxExpanded=3)
+    for _ in range(3):
+        context.expand()
+    assert context.nodesLeft() == 0
+    assert context.isExhausted()
+    with pytest.raises(BudgetExhausted):
+        context.expand()
+    assert context.expanded == 3
+
+
+def test_deadlineIsPolled():
+    context = SearchContext(moveTime=0)
+    assert context.timeLeft() == 0.0
+    assert context.isExhausted()
+    with pytest.raises(BudgetExhausted):
+        context.poll()
+
+
+def test_deadlineIsCheckedEveryInterval():
+    context = SearchContext(moveTime=0)
+    with pytest.raises(BudgetExhausted):
+        for _ in range(2 * SearchContext.CHECK_INTERVAL):
+            context.expand()
+    assert context.expanded == SearchContext.CHECK_INTERVAL - 1
+
+
+def test_gameStatesSpendTheBudgetOfTheMove(freshInstrumentation):
+    state, _ = randomGames(getLayout('small_adv'), numGames=1)[0]
+    compact = state.toCompact()
+    freshInstrumentation.newMove(maxExpanded=2)
+    state.generatePacmanSuccessors()
+    compact.generateGhostSuccessors(1)
+    with pytest.raises(BudgetExhausted):
+        state.generateGhostSuccessors(1)
+    with pytest.raises(BudgetExhausted):
+        compact.generatePacmanSuccessors()
+    assert freshInstrumentation.searchContext.expanded == 2
+
+
+def test_classLevelCountersFollowTheContext(freshInstrumentation):
+    state, _ = randomGames(getLayout('small_adv'), numGames=1)[0]
+    context = freshInstrumentation.newMove()
+    GameState.setMaximumExpanded(3)
+    assert GameState.maximumExpanded == context.maxExpanded == 3
+    state.generatePacmanSuccessors()
+    state.generateGhostSuccessors(1)
+    assert GameState.countExpanded == context.expanded == 2
+    GameState.resetNodeExpansionCounter()
+    assert GameState.countExpanded == 0
+    GameState.countExpanded = 3
+    with pytest.raises(BudgetExhausted):
+        state.generatePacmanSuccessors()
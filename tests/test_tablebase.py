@@ -0,0 +1,69 @@
+# Tests of the endgame tablebases against the rules of the game
+
+from math import inf as INF
+
+import pytest
+
+from conftest import getLayout, randomGames
+from pacman_module import tablebase
+from pacman_module.game import Directions
+
+
+def probeValue(table, state, player):
+    """
+    Returns the value of a GameState in a tablebase, -inf if the ghost can
+    make the game last forever.
+    """
+    value = table.probe(state.toCompact(), player)
+    return -INF if value is None else value
+
+
+@pytest.mark.parametrize('name', ['small_adv', 'small_adv2', 'medium_adv'])
+def test_valuesSatisfyTheRules(name):
+    layout = getLayout(name)
+    values, _ = tablebase.solve(layout)
+    table = tablebase.Tablebase(layout, values)
+    assert table.probe(randomGames(layout, 1)[0][0].toCompact(), 0) \
+        is not None
+
+    # The value of a state is the best value of its successors, generated
+    # by GameState, for the player to move
+    for state, player in randomGames(layout, numGames=20):
+        successorValues = []
+        for action in state.getLegalActions(player):
+            if action == Directions.STOP:
+                continue
+            successor = state.generateSuccessor(player, action)
+            value = successor.getScore() - state.getScore()
+            if not (successor.isWin() or successor.isLose()):
+                value += probeValue(table, successor, 1 - player)
+            successorValues.append(value)
+        best = max(successorValues) if player == 0 else \
+            min(successorValues)
+        assert probeValue(table, state, player) == best
+
+
+def test_onlyOneGhostAndNoCapsule():
+    with pytest.raises(Exception):
+        tablebase.tableShape(getLayout('maze'))
+    assert tablebase.getTablebase(getLayout('maze')) is None
+
+
+def test_layoutsAreOnlySolvedOnRequest(tmp_path, monkeypatch):
+    monkeypatch.setattr(tablebase, 'TABLEBASE_DIR', str(tmp_path))
+    monkeypatch.setattr(tablebase, 'TABLEBASE_CACHE', {})
+    layout = getLayout('small_adv')
+    assert tablebase.getTablebase(layout) is None
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setattr(tablebase, 'TABLEBASE_CACHE', {})
+    table = tablebase.getTablebase(layout, lazyMaxStates=2 ** 20)
+    assert table is not None
+    assert (table.values == tablebase.solve(layout)[0]).all()
+    assert tablebase.tablebasePath(layout).startswith(str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # Too many states to solve while playing
+    monkeypatch.setattr(tablebase, 'TABLEBASE_DIR', str(tmp_path / 'empty'))
+    monkeypatch.setattr(tablebase, 'TABLEBASE_CACHE', {})
+    assert tablebase.getTablebase(layout, lazyMaxStates=100) is None
@@ -0,0 +1,83 @@
+# Tests of the transposition table and of the Zobrist keys
+
+import pytest
+
+from conftest import getLayout, randomGames
+from pacman_module.transpositionTable import EXACT, LOWER, \
+    TranspositionTable, ZobristHasher
+
+
+def test_depthPolicyKeepsDeeperEntriesOfTheSearch():
+    table = TranspositionTable(4, 'depth')
+    table.store(1, 10, EXACT, depth=3)
+
+    # Same slot, same search: the shallower entry does not replace it
+    table.store(5, 20, EXACT, depth=2)
+    assert table.probe(1).value == 10
+    assert table.probe(5) is None
+
+    # Deeper or as deep: replaced
+    table.store(5, 30, LOWER, depth=3)
+    assert table.probe(1) is None
+    assert table.probe(5).value == 30
+    assert table.evictions == 1
+
+    # Entries of older searches are always replaced
+    table.newSearch()
+    table.store(9, 40, EXACT, depth=0)
+    assert table.probe(9).value == 40
+    assert len(table) == 1
+
+
+def test_depthPolicyUpdatesTheSameKey():
+    table = TranspositionTable(4, 'depth')
+    table.store(2, 10, EXACT, depth=5)
+    table.store(2, 20, EXACT, depth=1)
+    assert table.probe(2).value == 20
+    assert table.evictions == 0
+    table.remove(2)
+    assert table.probe(2) is None
+    assert len(table) == 0
+
+
+def test_lruPolicyEvictsTheLeastRecentlyUsed():
+    table = TranspositionTable(3, 'lru')
+    for key in range(3):
+        table.store(key, key, EXACT)
+    table.probe(0)
+    table.store(3, 3, EXACT)
+    assert table.probe(1) is None
+    assert [table.probe(key).value for key in (0, 2, 3)] == [0, 2, 3]
+    assert table.evictions == 1
+    assert len(table) == 3
+
+
+def test_invalidTables():
+    with pytest.raises(ValueError):
+        TranspositionTable(3, 'depth')
+    with pytest.raises(ValueError):
+        TranspositionTable(4, 'fifo')
+
+
+def test_probesAreCounted(freshInstrumentation):
+    table = TranspositionTable(4)
+    table.store(1, 0, EXACT)
+    table.probe(1)
+    table.probe(2)
+    assert (table.hits, table.misses) == (1, 1)
+    assert table.hitRate() == 0.5
+    assert freshInstrumentation.cacheHits == 1
+    assert freshInstrumentation.cacheMisses == 1
+
+
+@pytest.mark.parametrize('name', ['small_adv', 'large_adv', 'maze'])
+def test_updatedKeysMatchKeysFromScratch(name):
+    hasher = ZobristHasher()
+    for state, _ in randomGames(getLayout(name)):
+        compact = state.toCompact()
+        key = hasher.hash(compact)
+        for player in range(compact.getNumAgents()):
+            for action in compact.getLegalActions(player):
+                successor = compact.generateSuccessor(player, action)
+                assert hasher.update(key, compact, successor) == \
+                    hasher.hash(successor)
@@ -0,0 +1,126 @@
+# Tests of the dead-end pockets and of the pruning of the moves into them
+
+import pytest
+
+from conftest import ADVERSARIAL_LAYOUTS, MAZE_LAYOUTS
+from pacman_module import layout as layoutModule
+from pacman_module import pacman
+from pacman_module.game import Directions
+from pacman_module.traps import TrapAnalysis, prunePacmanSuccessors
+
+# A loop with a pocket 3 cells deep below its bottom side, holding food at
+# depths 1 and 3
+POCKET_MAZE = [
+    '%%%%%%%%',
+    '%P .. G%',
+    '% %%%% %',
+    '% %%%% %',
+    '%      %',
+    '%%%%.%%%',
+    '%%%% %%%',
+    '%%%%.%%%',
+    '%%%%%%%%',
+]
+ENTRY = (4, 4)
+
+
+def neighbors(layout, cell):
+    return [destination for action, destination in layout.moves[cell].items()
+            if action != Directions.STOP]
+
+
+def distancesFrom(layout, start, removed=None):
+    """
+    Breadth-first search of the maze from a cell, without cell `removed`.
+    """
+    distances = {start: 0}
+    fringe = [start]
+    while fringe:
+        cell = fringe.pop(0)
+        for neighbor in neighbors(layout, cell):
+            if neighbor != removed and neighbor not in distances:
+                distances[neighbor] = distances[cell] + 1
+                fringe.append(neighbor)
+    return distances
+
+
+@pytest.mark.parametrize(
+    'name', ADVERSARIAL_LAYOUTS + MAZE_LAYOUTS + ['basic_pacman_level'])
+def test_pocketsMatchBruteForce(name):
+    layout = layoutModule.getLayout(name)
+    analysis = TrapAnalysis(layout)
+    numCells = len(layout.freeCells)
+
+    points = set()
+    pockets = {}
+    for cell in layout.freeCells:
+        sides = []
+        for neighbor in neighbors(layout, cell):
+            if not any(neighbor in side for side in sides):
+                sides.append(distancesFrom(layout, neighbor, cell))
+        if len(sides) < 2:
+            continue
+        points.add(cell)
+        fromEntry = distancesFrom(layout, cell)
+        for action, neighbor in layout.moves[cell].items():
+            side = next((side for side in sides if neighbor in side), None)
+            if action != Directions.STOP and 2 * len(side) < numCells:
+                pockets[(cell, action)] = (
+                    frozenset(side), max(fromEntry[c] for c in side))
+
+    assert analysis.articulationPoints == points
+    assert {key: (pocket.cells, pocket.depth)
+            for key, pocket in analysis.pocketOf.items()} == pockets
+
+
+def sealingGhosts(layout, distance):
+    """
+    Returns the cells at a maze distance from the entry of the pocket.
+    """
+    return [cell for cell, d in distancesFrom(layout, ENTRY).items()
+            if d == distance]
+
+
+def test_roundTripGoesToTheDeepestFood():
+    layout = layoutModule.Layout(POCKET_MAZE)
+    analysis = TrapAnalysis(layout)
+    pocket = analysis.pocketOf[(ENTRY, Directions.SOUTH)]
+    assert pocket.depth == 3
+
+    food = layout.food.getBits()
+    deepFood = 1 << (4 * layout.height + 1)
+    assert pocket.roundTrip(food) == 7
+    assert pocket.roundTrip(food & ~deepFood) == 3
+    assert pocket.roundTrip(food & ~pocket.mask) == 3
+
+    near, far = sealingGhosts(layout, 6)[0], sealingGhosts(layout, 7)[0]
+    assert analysis.isSealed(ENTRY, Directions.SOUTH, [near], food)
+    assert not analysis.isSealed(ENTRY, Directions.SOUTH, [far], food)
+    assert not analysis.isSealed(ENTRY, Directions.SOUTH, [near],
+                                 food & ~deepFood)
+    assert not analysis.isSealed(ENTRY, Directions.EAST, [ENTRY], food)
+
+    # Pacman wins in a pocket holding all the food left
+    assert not analysis.isSealed(ENTRY, Directions.SOUTH, [near],
+                                 food & pocket.mask)
+
+
+def test_movesIntoSealedPocketsArePruned():
+    layout = layoutModule.Layout(POCKET_MAZE)
+    state = pacman.GameState()
+    state.initialize(layout, 1)
+    state.data.agentStates[0].configuration.pos = ENTRY
+    ghost = sealingGhosts(layout, 6)[0]
+    state.data.agentStates[1].configuration.pos = ghost
+
+    for game in (state, state.toCompact()):
+        moves = [move for _, move in prunePacmanSuccessors(
+            game, game.generatePacmanSuccessors())]
+        assert Directions.SOUTH not in moves
+        assert sorted(moves) == [Directions.EAST, Directions.WEST]
+
+    # A scared ghost cannot seal the pocket
+    state.data.agentStates[1].scaredTimer = 10
+    moves = [move for _, move in prunePacmanSuccessors(
+        state, state.generatePacmanSuccessors())]
+    assert Directions.SOUTH in moves